@@ -1,17 +1,41 @@
 from concurrent.futures import ThreadPoolExecutor
-from flask import request, jsonify
+from flask import request, Response, stream_with_context
 from ariadne.constants import PLAYGROUND_HTML
 from ariadne import load_schema_from_path, make_executable_schema, \
-    graphql_sync, snake_case_fallback_resolvers, ObjectType
+    snake_case_fallback_resolvers, ObjectType, format_error
+from graphql import GraphQLError
 from flask import Flask
+import logging
 import os
+from typing import Optional
 from resolver.activity import get_activity_resolver, list_activities_resolver, \
     get_activity_main_objectives_by_id_resolver, get_activity_main_objectives_by_name_resolver, \
-    get_activity_main_objectives_all_resolver
-from service.integration import Integration, populate_database
+    get_activity_main_objectives_all_resolver, activities_field_resolver, activity_field_resolver, \
+    activity_main_objectives_field_resolver, activity_sector_resolver, activity_nace_resolver, \
+    objective_reference_resolver, criteria_text_resolver
+from resolver.loaders import context
+from resolver.criteria import get_criteria_resolver
+from service.integration import Integration
+from service.ingestion import changed, populate_database
+from service.jobs import jobs, JobAlreadyRunning
+from service.read_model import read_model
+from service.generation import generation
+from service.response_cache import response_cache
+from service.documents import documents, graphql_sync, prepare, check_batch, batch_context, \
+    GRAPHQL_BATCH_CONCURRENCY
+from service.query_cost import cost_analysis
+from service.export import ndjson
+from service.metrics import metrics, CypherMetrics, pool_gauges, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from service.slow_queries import slow_queries, SLOW_QUERY_ENABLED
+from repository.activity import ActivityRepository
 from dao.database_factory import db
+from dao.schema import Schema
 import requests
 
+# the services log through module loggers; gunicorn and uvicorn only set up their own
+logging.basicConfig(level=os.getenv("LOG_LEVEL") or "INFO",
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
 app = Flask(__name__)
 
 logger = app.logger
@@ -19,15 +43,92 @@ logger = app.logger
 app.config["DB_URL"] = os.getenv("DB_URL") or "localhost"
 app.config["DB_USERNAME"] = os.getenv("DB_USERNAME") or "neo4j"
 app.config["DB_PASSWORD"] = os.getenv("DB_PASSWORD") or "9VXuvxKAWuV9RTW"
+app.config["TAXONOMY_FILE"] = os.getenv("TAXONOMY_FILE")
+app.config["INGEST_MODE"] = os.getenv("INGEST_MODE") or "full"
 
 type_defs = load_schema_from_path("schema/eu_taxonamy.graphql")
 
 
+read_model.bind(db)
+if metrics.enabled:
+    db.observe(CypherMetrics(metrics))
+    metrics.collect(pool_gauges(db))
+if SLOW_QUERY_ENABLED:
+    db.observe(slow_queries)
+
+
+def warm_up():
+    # called once per worker process, see gunicorn.conf.py
+    try:
+        db.warm()
+        if read_model.enabled:
+            read_model.load(db)
+    except Exception as error:
+        logger.warning("warm up failed, connecting on first request: %s", error)
+
+
+def shut_down():
+    metrics.flush()
+    db.close()
+
+
 @app.route("/populate")
 def populate_db():
     integration = Integration(requests)
-    populate_database(integration, db)
-    return {"message": "started"}
+    incremental = (request.args.get("mode") or app.config["INGEST_MODE"]) == "incremental"
+    offline = request.args.get("offline")
+    offline = offline.lower() in ("1", "true", "yes") if offline is not None else None
+
+    def populate(progress):
+        diff = populate_database(integration, db, progress=progress, source=app.config["TAXONOMY_FILE"],
+                                 incremental=incremental, offline=offline)
+        if read_model.enabled and changed(diff):
+            progress.stage("read model")
+            read_model.load(db)
+    try:
+        job = jobs.start(populate)
+    except JobAlreadyRunning as error:
+        return {"message": str(error), "job": error.job_id}, 409
+    return {"message": "started", "job": job.id}, 202
+
+
+@app.route("/populate/<job_id>")
+def populate_status(job_id):
+    status = jobs.status(job_id)
+    if status is None:
+        return {"message": f"unknown job {job_id}"}, 404
+    return status
+
+
+@app.route("/populate/<job_id>/cancel", methods=["POST"])
+def populate_cancel(job_id):
+    status = jobs.cancel(job_id)
+    if status is None:
+        return {"message": f"unknown job {job_id}"}, 404
+    return status
+
+
+@app.route("/export")
+def export():
+    compress = request.args.get("gzip") in ("1", "true") or \
+        "gzip" in request.headers.get("Accept-Encoding", "")
+    records = ActivityRepository(db).export()
+    headers = {"Content-Disposition": "attachment; filename=taxonomy.ndjson"}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return Response(stream_with_context(ndjson(records, compress)),
+                    mimetype="application/x-ndjson", headers=headers)
+
+
+@app.route("/schema")
+def schema_status():
+    return Schema(db).status()
+
+
+@app.route("/schema", methods=["POST"])
+def schema_bootstrap():
+    return Schema(db).bootstrap()
 
 
 query = ObjectType("Query")
@@ -39,9 +140,30 @@ query.set_field("getActivityMainObjectivesByName",
                 get_activity_main_objectives_by_name_resolver)
 query.set_field("getActivityAllMainObjectives",
                 get_activity_main_objectives_all_resolver)
+query.set_field("getCriteria", get_criteria_resolver)
+
+activities_result = ObjectType("ActivitiesResult")
+activities_result.set_field("activities", activities_field_resolver)
+activities_result.set_field("edges", activities_field_resolver)
+activity_result = ObjectType("ActivityResult")
+activity_result.set_field("activity", activity_field_resolver)
+main_objectives_result = ObjectType("ActivityMainObjectivesResult")
+main_objectives_result.set_field("activityMainObjectives",
+                                 activity_main_objectives_field_resolver)
+main_objectives_result.set_field("edges", activity_main_objectives_field_resolver)
+activity = ObjectType("Activity")
+activity.set_field("sector", activity_sector_resolver)
+activity.set_field("nace", activity_nace_resolver)
+main_objectives = ObjectType("ActivityMainObjectives")
+main_objectives.set_field("objective", objective_reference_resolver)
+main_objectives.set_field("substantialContributionCriteria", criteria_text_resolver)
+dnsh = ObjectType("DNSH")
+dnsh.set_field("objective", objective_reference_resolver)
+dnsh.set_field("criteria", criteria_text_resolver)
 
 schema = make_executable_schema(
-    type_defs, query, snake_case_fallback_resolvers
+    type_defs, [query, activities_result, activity_result, main_objectives_result,
+                activity, main_objectives, dnsh], snake_case_fallback_resolvers
 )
 
 
@@ -50,14 +172,109 @@ def graphql_playground():
     return PLAYGROUND_HTML, 200
 
 
-@app.route("/graphql", methods=["POST"])
-def graphql_server():
-    data = request.get_json()
+def data_generation() -> str:
+    # snapshot reloads change what the read model serves, so they count too
+    snapshot = read_model.snapshot
+    return f"{generation.current()}:{snapshot.loaded_at if snapshot else ''}"
+
+
+def graphql_response(body: bytes, status: int, etag: str, cache: str) -> Response:
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, status, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["X-Cache"] = cache
+    return response
+
+
+def execute_operation(data, context_value: dict) -> tuple[bytes, int, Optional[str], Optional[str]]:
+    # body, status, ETag and X-Cache of one operation; responses that are
+    # not cached have neither
+    key = response_cache.key(data, data_generation()) if response_cache.enabled else None
+    if key:
+        cached = response_cache.get(key)
+        if cached:
+            return cached.body, cached.status, cached.etag, "HIT"
     success, result = graphql_sync(
         schema,
         data,
-        context_value=request,
+        context_value=context_value,
         debug=app.debug
     )
     status_code = 200 if success else 400
-    return jsonify(result), status_code
+    body = app.json.dumps(result).encode()
+    if not key or not success or "errors" in result or context_value.get("failures"):
+        return body, status_code, None, None
+    entry = response_cache.put(key, body, status_code)
+    return entry.body, entry.status, entry.etag, "MISS"
+
+
+# runs the operations of batched requests, bounded per worker process
+batch_pool = ThreadPoolExecutor(GRAPHQL_BATCH_CONCURRENCY, thread_name_prefix="graphql-batch")
+
+
+@app.route("/graphql", methods=["POST"])
+def graphql_server():
+    data = request.get_json()
+    if isinstance(data, list):
+        return graphql_batch(data)
+    body, status_code, etag, cache = execute_operation(data, context(request, db))
+    if etag is None:
+        return Response(body, status_code, mimetype="application/json")
+    return graphql_response(body, status_code, etag, cache)
+
+
+def graphql_batch(operations: list) -> Response:
+    # the results of a JSON array of operations, in the same order; each
+    # operation is cached on its own, the batch as a whole is not
+    try:
+        check_batch(operations)
+    except GraphQLError as error:
+        return {"errors": [format_error(error, app.debug)]}, 400
+    shared = context(request, db)
+    bodies = batch_pool.map(lambda data: execute_operation(data, batch_context(shared))[0], operations)
+    return Response(b"[" + b",".join(bodies) + b"]", 200, mimetype="application/json")
+
+
+@app.route("/graphql/cost", methods=["POST"])
+def graphql_cost():
+    # the cost analysis of a query without running it
+    try:
+        data, parsed = prepare(schema, request.get_json())
+        if parsed.errors:
+            return {"errors": [format_error(error, app.debug) for error in parsed.errors]}, 400
+        cost = cost_analysis.analyze(schema, parsed.document, data.get("variables"), data.get("operationName"))
+    except GraphQLError as error:
+        return {"errors": [format_error(error, app.debug)]}, 400
+    return cost.to_dict()
+
+
+@app.route("/graphql/cache")
+def graphql_cache_stats():
+    return {**response_cache.stats(), "documents": documents.stats()}
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    # Prometheus text format, summed over every worker of this server
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route("/debug/slow-queries")
+def slow_queries_report():
+    # ?by=dbHits ranks the captures by db hits instead of time
+    limit = request.args.get("limit", 20, type=int)
+    return slow_queries.worst(limit, request.args.get("by", "seconds"))
+
+
+@app.route("/debug/slow-queries", methods=["DELETE"])
+def slow_queries_clear():
+    slow_queries.log.clear()
+    return slow_queries.worst(0)
+
+
+@app.route("/graphql/cache", methods=["DELETE"])
+def graphql_cache_clear():
+    response_cache.clear()
+    return response_cache.stats()
@@ -0,0 +1,84 @@
+# Async entry point for the GraphQL API: `uvicorn asgi:app`. It serves
+# the same schema as app.py, but resolvers read through the async Neo4j
+# driver, so a request waiting on the database does not hold a thread
+# and independent fields of one operation are fetched concurrently.
+import asyncio
+from contextlib import asynccontextmanager
+from ariadne import format_error
+from ariadne.asgi import GraphQL
+from ariadne.asgi.handlers import GraphQLHTTPHandler
+from ariadne.exceptions import HttpError
+from graphql import GraphQLError
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+from app import app as flask_app, schema
+from dao.database_factory import async_db
+from resolver.loaders import context
+from service.documents import graphql as execute_graphql, check_batch, batch_context, \
+    GRAPHQL_BATCH_CONCURRENCY
+from service.metrics import metrics, CypherMetrics, pool_gauges, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from service.slow_queries import slow_queries, SLOW_QUERY_ENABLED
+
+
+class HTTPHandler(GraphQLHTTPHandler):
+    # runs queries through service.documents, so this server shares the
+    # document cache and persisted queries with app.py
+    async def execute_graphql_query(self, request, data, context_value=None):
+        if context_value is None:
+            context_value = await self.get_context_for_request(request)
+        return await execute_graphql(self.schema, data, context_value=context_value,
+                                     debug=self.debug, logger=self.logger)
+
+    async def graphql_http_server(self, request):
+        try:
+            data = await self.extract_data_from_request(request)
+        except HttpError as error:
+            return PlainTextResponse(error.message or error.status, status_code=400)
+        if not isinstance(data, list):
+            success, result = await self.execute_graphql_query(request, data)
+            return await self.create_json_response(request, result, success)
+        return await self.execute_batch(request, data)
+
+    async def execute_batch(self, request, operations: list):
+        # the results of a JSON array of operations, in the same order; the
+        # operations share async loaders, so lookups they start in the same
+        # tick go out as one query
+        try:
+            check_batch(operations)
+        except GraphQLError as error:
+            return JSONResponse({"errors": [format_error(error, self.debug)]}, status_code=400)
+        shared = await self.get_context_for_request(request)
+        running = asyncio.Semaphore(GRAPHQL_BATCH_CONCURRENCY)
+
+        async def execute(data):
+            async with running:
+                _, result = await self.execute_graphql_query(request, data, batch_context(shared))
+                return result
+        return JSONResponse(await asyncio.gather(*(execute(data) for data in operations)))
+
+
+graphql = GraphQL(schema, context_value=lambda request: context(request, async_db), debug=flask_app.debug,
+                  http_handler=HTTPHandler())
+
+
+if metrics.enabled:
+    async_db.observe(CypherMetrics(metrics))
+    metrics.collect(pool_gauges(async_db))
+if SLOW_QUERY_ENABLED:
+    async_db.observe(slow_queries)
+
+
+async def metrics_endpoint(request):
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@asynccontextmanager
+async def lifespan(application):
+    yield
+    metrics.flush()
+    await async_db.close()
+
+
+app = Starlette(routes=[Route("/graphql", graphql, methods=["GET", "POST"]),
+                        Route("/metrics", metrics_endpoint)], lifespan=lifespan)
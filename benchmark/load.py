@@ -0,0 +1,301 @@
+"""Load test for /graphql with latency percentiles per operation.
+
+    python -m benchmark.load --url http://localhost:5000/graphql --concurrency 16 --duration 30
+    python -m benchmark.load --in-process 1 --rate 200 --duration 10 --json load.json
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, NamedTuple, Optional
+
+# keep in-process runs and seeding away from the generation file a local
+# server watches, unless pointed at it on purpose
+os.environ.setdefault("GENERATION_FILE", os.path.join(tempfile.mkdtemp(), "generation"))
+
+from benchmark import synthetic  # noqa: E402
+from resolver.pagination import encode_cursor  # noqa: E402
+
+PAGE_SIZE = 20
+ACTIVITY = "id name description reference sector { name } nace { nace }"
+MAIN_OBJECTIVES = ("activity { name } objective { key name } activityContributionType contributionDescription "
+                   "dnsh { objective { key name } criteria } substantialContributionCriteria")
+OPERATIONS = {
+    "listActivities": "query listActivities($first: Int, $after: String) { listActivities(first: $first, "
+                      f"after: $after) {{ success activities {{ {ACTIVITY} }} pageInfo {{ hasNextPage endCursor }} }} }}",
+    "getActivity": f"query getActivity($name: ID!) {{ getActivity(name: $name) {{ success activity {{ {ACTIVITY} }} }} }}",
+    "getActivityMainObjectivesByID": "query getActivityMainObjectivesByID($id: ID!) { "
+                                     "getActivityMainObjectivesByID(id: $id) { success "
+                                     f"activityMainObjectives {{ {MAIN_OBJECTIVES} }} }} }}",
+    "getActivityMainObjectivesByName": "query getActivityMainObjectivesByName($name: String!) { "
+                                       "getActivityMainObjectivesByName(name: $name) { success "
+                                       f"activityMainObjectives {{ {MAIN_OBJECTIVES} }} }} }}",
+    "getActivityAllMainObjectives": "query getActivityAllMainObjectives($first: Int, $after: String) { "
+                                    "getActivityAllMainObjectives(first: $first, after: $after) { success "
+                                    f"activityMainObjectives {{ {MAIN_OBJECTIVES} }} pageInfo {{ endCursor }} }} }}",
+}
+DEFAULT_MIX = {"listActivities": 3, "getActivity": 3, "getActivityMainObjectivesByID": 1,
+               "getActivityMainObjectivesByName": 2, "getActivityAllMainObjectives": 1}
+DISCOVER = ("{ listActivities { activities { id name } } "
+            "getActivityAllMainObjectives { activityMainObjectives { activity { name } objective { key } } } }")
+
+
+class Response(NamedTuple):
+    status: int
+    body: Optional[dict]
+    cache: Optional[str]
+
+
+class Sample(NamedTuple):
+    operation: str
+    latency: float
+    ok: bool
+    cached: bool
+
+
+def http_client(url: str, timeout: float) -> Callable[[], Callable[[dict], Response]]:
+    import requests
+    local = threading.local()
+
+    def post(body: dict) -> Response:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        response = local.session.post(url, json=body, timeout=timeout)
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = None
+        return Response(response.status_code, payload, response.headers.get("X-Cache"))
+    return lambda: post
+
+
+def in_process_client(scale: float, seed: int, cache: bool) -> Callable[[], Callable[[dict], Response]]:
+    # the Flask app with its read model serving a synthetic snapshot, so
+    # the whole request path runs without Neo4j
+    import app
+    records = synthetic.snapshot_records(synthetic.taxonomy(scale, seed))
+
+    class Records:
+        def execute_read(self, query, *args):
+            return records
+
+    app.read_model.enabled = True
+    app.read_model.ttl = float("inf")
+    app.read_model.load(Records())
+    app.response_cache.enabled = cache
+    local = threading.local()
+
+    def post(body: dict) -> Response:
+        if not hasattr(local, "client"):
+            local.client = app.app.test_client()
+        response = local.client.post("/graphql", json=body)
+        return Response(response.status_code, response.get_json(silent=True), response.headers.get("X-Cache"))
+    return lambda: post
+
+
+def seed_database(scale: float, seed: int):
+    # populates the configured (local) Neo4j with a synthetic taxonomy
+    from dao.database_factory import db
+    from service.ingestion import populate_database
+    with tempfile.TemporaryDirectory() as directory:
+        path = synthetic.write(os.path.join(directory, "taxonomy.json"), scale, seed)
+        populate_database(None, db, source=path)
+
+
+def succeeded(response: Response) -> bool:
+    if response.status != 200 or not response.body or response.body.get("errors"):
+        return False
+    return all(result is None or result.get("success", True)
+               for result in (response.body.get("data") or {}).values())
+
+
+class Workload:
+    # picks operations by weight and fills in their variables from the
+    # activities and matches the server reported
+
+    def __init__(self, mix: dict, activities: list[dict], matches: list[dict]):
+        if not activities:
+            raise SystemExit("the server has no activities; seed it first (--seed or --in-process)")
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.activities = activities
+        self.activity_cursors = [None] + [encode_cursor((activity["name"],)) for activity in activities]
+        self.match_cursors = [None] + [encode_cursor((match["activity"]["name"], match["objective"]["key"]))
+                                       for match in matches if match["activity"] and match["objective"]]
+
+    def next(self, rng: random.Random) -> tuple[str, dict]:
+        operation = rng.choices(self.names, self.weights)[0]
+        activity = rng.choice(self.activities)
+        variables = {
+            "listActivities": lambda: {"first": PAGE_SIZE, "after": rng.choice(self.activity_cursors)},
+            "getActivity": lambda: {"name": activity["name"]},
+            "getActivityMainObjectivesByID": lambda: {"id": activity["id"]},
+            "getActivityMainObjectivesByName": lambda: {"name": activity["name"]},
+            "getActivityAllMainObjectives": lambda: {"first": PAGE_SIZE, "after": rng.choice(self.match_cursors)},
+        }[operation]()
+        return operation, {"operationName": operation, "query": OPERATIONS[operation], "variables": variables}
+
+    @staticmethod
+    def discover(post: Callable[[dict], Response], mix: dict) -> "Workload":
+        try:
+            response = post({"query": DISCOVER})
+        except Exception as error:
+            raise SystemExit(f"cannot reach the server: {error}")
+        if not succeeded(response):
+            raise SystemExit(f"discovery query failed: {response.status} {response.body}")
+        data = response.body["data"]
+        return Workload(mix, data["listActivities"]["activities"],
+                        data["getActivityAllMainObjectives"]["activityMainObjectives"])
+
+
+def call(post: Callable[[dict], Response], operation: str, body: dict, started: float) -> Sample:
+    try:
+        response = post(body)
+        ok = succeeded(response)
+        cached = response.cache == "HIT"
+    except Exception:
+        ok, cached = False, False
+    return Sample(operation, time.perf_counter() - started, ok, cached)
+
+
+def closed_loop(client, workload: Workload, concurrency: int, deadline: float, seed: int) -> list[Sample]:
+    # each worker sends its next request as soon as the last one returns
+    samples: list[Sample] = []
+
+    def worker(index: int):
+        post, rng, own = client(), random.Random(seed + index), []
+        while time.perf_counter() < deadline:
+            operation, body = workload.next(rng)
+            own.append(call(post, operation, body, time.perf_counter()))
+        samples.extend(own)
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def open_loop(client, workload: Workload, rate: float, concurrency: int, deadline: float,
+              seed: int) -> list[Sample]:
+    # requests are due at a fixed rate whether or not earlier ones have
+    # returned; latency counts from when a request was due, so a backed up
+    # server shows up in the percentiles instead of slowing the load down
+    rng, futures, start = random.Random(seed), [], time.perf_counter()
+    local = threading.local()
+
+    def send(operation: str, body: dict, due: float) -> Sample:
+        if not hasattr(local, "post"):
+            local.post = client()
+        return call(local.post, operation, body, due)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index in range(int((deadline - start) * rate)):
+            due = start + index / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            operation, body = workload.next(rng)
+            futures.append(pool.submit(send, operation, body, due))
+    return [future.result() for future in futures]
+
+
+def percentile(latencies: list[float], fraction: float) -> float:
+    # nearest rank over sorted latencies
+    return latencies[min(len(latencies) - 1, max(0, round(fraction * len(latencies)) - 1))]
+
+
+def summary(samples: list[Sample], seconds: float) -> dict:
+    latencies = sorted(sample.latency for sample in samples)
+    errors = sum(not sample.ok for sample in samples)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "cache_hits": sum(sample.cached for sample in samples),
+        "throughput": len(samples) / seconds,
+        "mean_ms": 1000 * sum(latencies) / len(latencies) if latencies else None,
+        **{f"p{int(fraction * 100)}_ms": 1000 * percentile(latencies, fraction) if latencies else None
+           for fraction in (0.5, 0.95, 0.99)},
+        "max_ms": 1000 * latencies[-1] if latencies else None,
+    }
+
+
+def report(samples: list[Sample], seconds: float) -> dict:
+    operations = {}
+    for sample in samples:
+        operations.setdefault(sample.operation, []).append(sample)
+    return {"seconds": seconds, "total": summary(samples, seconds),
+            "operations": {name: summary(own, seconds) for name, own in sorted(operations.items())}}
+
+
+def parse_mix(text: Optional[str]) -> dict:
+    if not text:
+        return DEFAULT_MIX
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"unknown operation {name.strip()!r}, expected one of {', '.join(OPERATIONS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://localhost:5000/graphql", help="GraphQL endpoint of a local server")
+    target.add_argument("--in-process", type=float, metavar="SCALE",
+                        help="drive app.py in this process over a synthetic snapshot of this scale")
+    parser.add_argument("--seed", type=float, metavar="SCALE",
+                        help="populate the configured Neo4j with a synthetic taxonomy of this scale first")
+    parser.add_argument("--random-seed", type=int, default=0)
+    parser.add_argument("--mix", help="weights like listActivities=3,getActivity=1 (default: a read-heavy mix)")
+    parser.add_argument("--concurrency", type=int, default=8, help="workers, the closed loop size without --rate")
+    parser.add_argument("--rate", type=float, help="requests per second to send, regardless of responses")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to measure")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds to run before measuring")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds per HTTP request")
+    parser.add_argument("--no-cache", action="store_true", help="turn the response cache off (in-process only)")
+    parser.add_argument("--json", help="also write the results to this file")
+    options = parser.parse_args(argv)
+
+    if options.in_process is not None:
+        client = in_process_client(options.in_process, options.random_seed, not options.no_cache)
+    else:
+        if options.seed is not None:
+            seed_database(options.seed, options.random_seed)
+        client = http_client(options.url, options.timeout)
+    mix = parse_mix(options.mix)
+    workload = Workload.discover(client(), mix)
+
+    def run(seconds: float) -> list[Sample]:
+        deadline = time.perf_counter() + seconds
+        if options.rate:
+            return open_loop(client, workload, options.rate, options.concurrency, deadline, options.random_seed)
+        return closed_loop(client, workload, options.concurrency, deadline, options.random_seed)
+    if options.warmup > 0:
+        run(options.warmup)
+    start = time.perf_counter()
+    samples = run(options.duration)
+    results = report(samples, time.perf_counter() - start)
+    results["config"] = {"target": "in-process" if options.in_process is not None else options.url,
+                         "scale": options.in_process if options.in_process is not None else options.seed,
+                         "mix": mix, "concurrency": options.concurrency, "rate": options.rate,
+                         "duration": options.duration, "cache": not options.no_cache}
+
+    print(f"{'operation':<34}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, row in [*results["operations"].items(), ("total", results["total"])]:
+        print(f"{name:<34}{row['requests']:>9}{row['error_rate']:>8.1%}{row['throughput']:>9.1f}"
+              f"{row['p50_ms'] or 0:>9.1f}{row['p95_ms'] or 0:>9.1f}{row['p99_ms'] or 0:>9.1f}")
+    if options.json:
+        with open(options.json, "w") as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
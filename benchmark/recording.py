@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+from collections import Counter
+from typing import Any, NamedTuple, Optional
+from neo4j import SummaryCounters
+
+
+class Recorder:
+    # Counts what the code under test would have sent to Neo4j. Shared by
+    # every transaction of a run, so it is thread safe for the ingestion
+    # worker pool.
+
+    def __init__(self, latency: float = 0.0):
+        # seconds slept per statement, to stand in for the network
+        self.latency = latency
+        self.transactions = 0
+        self.round_trips = 0
+        self.parameter_bytes = 0
+        self.statements: Counter = Counter()
+        self.lock = threading.Lock()
+
+    def record(self, query: str, parameters: dict):
+        size = len(json.dumps(parameters, default=str))
+        with self.lock:
+            self.round_trips += 1
+            self.parameter_bytes += size
+            self.statements[" ".join(query.split())] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def transaction(self):
+        with self.lock:
+            self.transactions += 1
+
+    def stats(self) -> dict:
+        return {
+            "transactions": self.transactions,
+            "round_trips": self.round_trips,
+            "parameter_bytes": self.parameter_bytes,
+            "statements": len(self.statements),
+        }
+
+
+class RecordingSummary(NamedTuple):
+    counters: SummaryCounters = SummaryCounters({})
+
+
+class RecordingResult:
+    # an empty result: reads in the write path (fingerprints, SHOW INDEXES)
+    # find nothing, as against a fresh database
+
+    def __iter__(self):
+        return iter(())
+
+    def data(self) -> list:
+        return []
+
+    def single(self) -> Optional[Any]:
+        return None
+
+    def consume(self) -> RecordingSummary:
+        return RecordingSummary()
+
+
+class RecordingTransaction:
+    # stands in for neo4j.ManagedTransaction
+
+    def __init__(self, recorder: Recorder):
+        self.recorder = recorder
+
+    def run(self, query: str, parameters: Optional[dict] = None, **kwargs) -> RecordingResult:
+        self.recorder.record(query, {**(parameters or {}), **kwargs})
+        return RecordingResult()
+
+
+class RecordingDatabase:
+    # stands in for dao.database_factory.DatabaseFactory, one recorded
+    # transaction per unit of work
+
+    def __init__(self, recorder: Recorder):
+        self.recorder = recorder
+
+    def execute_read(self, query, *args):
+        self.recorder.transaction()
+        return query(RecordingTransaction(self.recorder), *args)
+
+    def execute_write(self, query, *args):
+        self.recorder.transaction()
+        return query(RecordingTransaction(self.recorder), *args)
+
+    execute_query = execute_write
@@ -0,0 +1,99 @@
+"""Ingestion benchmarks against the recording fake, no Neo4j or network needed.
+
+    python -m benchmark.run --scale 1 5 20 --repeat 3 --json results.json
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+# populate_database bumps the response cache generation; keep the benchmark
+# away from the file a local server watches
+os.environ.setdefault("GENERATION_FILE", os.path.join(tempfile.mkdtemp(), "generation"))
+
+from benchmark import synthetic  # noqa: E402
+from benchmark.recording import Recorder, RecordingDatabase  # noqa: E402
+from service.ingestion import INGEST_CHUNK_SIZE, INGEST_WORKERS, populate_database  # noqa: E402
+from service.integration import Integration  # noqa: E402
+
+
+def persist_to_db(data: dict, path: str, options) -> Callable[[RecordingDatabase], None]:
+    return lambda db: db.execute_write(Integration.persist_to_db, data)
+
+
+def populate(data: dict, path: str, options) -> Callable[[RecordingDatabase], None]:
+    return lambda db: populate_database(None, db, options.workers, options.chunk_size, source=path,
+                                        incremental=options.incremental)
+
+
+TARGETS = {"persist_to_db": persist_to_db, "populate_database": populate}
+
+
+def measure(run: Callable[[RecordingDatabase], None], repeat: int, latency: float) -> dict:
+    # wall time from untraced runs, peak memory from one extra traced run,
+    # since tracemalloc slows allocation-heavy code down severalfold
+    times = []
+    for _ in range(repeat):
+        recorder = Recorder(latency)
+        start = time.perf_counter()
+        run(RecordingDatabase(recorder))
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        run(RecordingDatabase(Recorder()))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "wall_seconds": min(times),
+        "wall_seconds_median": statistics.median(times),
+        **recorder.stats(),
+        "peak_memory_bytes": peak,
+        "top_statements": [{"count": count, "statement": statement[:120]}
+                           for statement, count in recorder.statements.most_common(5)],
+    }
+
+
+def main(argv=None) -> list[dict]:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, nargs="+", default=[1.0],
+                        help="synthetic taxonomy sizes, 1 is about the published one")
+    parser.add_argument("--target", choices=list(TARGETS), nargs="+", default=list(TARGETS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="milliseconds added per statement to stand in for the network")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE)
+    parser.add_argument("--incremental", action="store_true",
+                        help="run populate_database in incremental mode")
+    parser.add_argument("--json", help="also write the results to this file")
+    options = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in options.scale:
+            data = synthetic.taxonomy(scale, options.seed)
+            path = os.path.join(directory, f"taxonomy-{scale}.json")
+            with open(path, "w") as file:
+                json.dump(data, file)
+            for target in options.target:
+                result = {"target": target, "scale": scale, "matches": len(data["matches"]),
+                          **measure(TARGETS[target](data, path, options), options.repeat, options.latency / 1000)}
+                results.append(result)
+                print(f"{target:<18} scale {scale:<6g} {result['wall_seconds']:8.3f}s "
+                      f"{result['round_trips']:6d} round trips {result['transactions']:5d} transactions "
+                      f"{result['parameter_bytes'] / 1e6:8.2f} MB params "
+                      f"{result['peak_memory_bytes'] / 1e6:8.2f} MB peak")
+    if options.json:
+        with open(options.json, "w") as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
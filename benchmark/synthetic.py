@@ -0,0 +1,112 @@
+import itertools
+import json
+import random
+from typing import NamedTuple
+from dao.fingerprint import criteria_hash
+from repository.activity import ActivityRepository
+from service.integration import Integration
+
+# the published taxonomy is roughly scale 1
+OBJECTIVES = [
+    ("Climate change mitigation", "mitigation"),
+    ("Climate change adaptation", "adoptation"),
+    ("Sustainable use and protection of water and marine resources", "water"),
+    ("Transition to a circular economy", "circular_economy"),
+    ("Pollution prevention and control", "pollution"),
+    ("Protection and restoration of biodiversity and ecosystems", "biodiversity"),
+]
+SECTORS = 13
+ACTIVITIES = 100
+# DNSH criteria are mostly shared appendix texts, SC criteria are mostly activity specific
+SHARED_CRITERIA = 60
+CRITERIA_PER_DNSH = 3
+CRITERIA_PER_SC = 4
+CRITERIA_WORDS = 60
+WORDS = ("activity", "emissions", "installation", "water", "waste", "assessment", "measures",
+         "operator", "plant", "energy", "climate", "risk", "lifecycle", "threshold", "materials",
+         "technical", "screening", "criteria", "environmental", "impact", "best", "available")
+
+
+class Scale(NamedTuple):
+    sectors: int
+    activities: int
+    shared_criteria: int
+
+    @staticmethod
+    def of(factor: float) -> "Scale":
+        return Scale(max(1, round(SECTORS * factor)), max(1, round(ACTIVITIES * factor)),
+                     max(1, round(SHARED_CRITERIA * factor)))
+
+
+def _text(rng: random.Random, label: str, words: int) -> str:
+    return label + ": " + " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def taxonomy(factor: float = 1.0, seed: int = 0, words: int = CRITERIA_WORDS) -> dict:
+    # a taxonomy.json shaped document; the same factor and seed always give
+    # the same document, so runs stay comparable
+    rng = random.Random(seed)
+    scale = Scale.of(factor)
+    objectives = [{"name": name, "long_name": f"{name} objective", "key": key}
+                  for name, key in OBJECTIVES]
+    keys = [key for _, key in OBJECTIVES]
+    sectors = [{"name": f"Sector {index}", "reference": index} for index in range(scale.sectors)]
+    shared = [_text(rng, f"DNSH {index}", words) for index in range(scale.shared_criteria)]
+    activities = []
+    matches = []
+    for index in range(scale.activities):
+        name = f"{index // 10 + 1}.{index % 10 + 1} Activity {index}"
+        activities.append({
+            "name": name,
+            "description": _text(rng, name, words // 2),
+            "reference": float(f"{index // 10 + 1}.{index % 10 + 1}"),
+            "sector": sectors[index % scale.sectors]["name"],
+            "nace_codes": [f"C{rng.randint(10, 33)}.{rng.randint(1, 9)}" for _ in range(rng.randint(0, 3))],
+        })
+        # most activities contribute to both climate objectives
+        for objective in keys[:2] if rng.random() < 0.8 else [rng.choice(keys)]:
+            matches.append({
+                "activity": name,
+                "objective": objective,
+                "activity_contribution_type": rng.choice(["enabling", "transitional", None]),
+                "contribution_description": rng.choice([_text(rng, "contribution", words // 4), None]),
+                "dnsh": [{"objective": key, "criteria": rng.sample(shared, min(CRITERIA_PER_DNSH, len(shared)))}
+                         for key in keys if key != objective],
+                "substantial_contribution_criteria": [
+                    _text(rng, f"SC {name} {objective} {number}", words) for number in range(CRITERIA_PER_SC)],
+            })
+    return {"objectives": objectives, "sectors": sectors, "activities": activities, "matches": matches,
+            "version": "synthetic", "empty": [], "n": len(matches)}
+
+
+def write(path: str, factor: float = 1.0, seed: int = 0) -> str:
+    with open(path, "w") as file:
+        json.dump(taxonomy(factor, seed), file)
+    return path
+
+
+def snapshot_records(data: dict) -> dict:
+    # what SnapshotRepository.load reads back once the document is
+    # populated, so the read model can serve it without Neo4j
+    ids = itertools.count()
+    rows = Integration.relationship_rows(data)
+    return {
+        "sectors": [{"id": next(ids), "properties": sector} for sector in data["sectors"]],
+        "objectives": [{"id": next(ids), "properties": objective} for objective in data["objectives"]],
+        "activities": [{"id": next(ids), "sector": activity["sector"], "properties": {
+                            "name": activity["name"], "description": activity["description"],
+                            "reference": activity["reference"],
+                            "nace_codes": ActivityRepository.nace_codes(activity["nace_codes"])}}
+                       for activity in data["activities"]],
+        "matches": [{"activity": row["activity_name"], "objective": row["objective_key"],
+                     "contribution_type": row["contribution_type"], "description": row["description"],
+                     "dnsh_summary": row["dnsh_summary"], "sc_criteria_hashes": row["sc_criteria_hashes"]}
+                    for row in rows["contribution_matches"]],
+        "dnsh": [{"objective": row["objective_key"], "dnsh_objective": row["dnsh_objective_key"]}
+                 for row in rows["dnsh_objectives"]],
+        "dnsh_criteria": [{"objective": row["objective_key"], "hash": row["criteria_hash"]}
+                          for row in rows["dnsh_criteria"]],
+        "sc_criteria": [{"objective": row["objective_key"], "hash": row["criteria_hash"]}
+                        for row in rows["sc_criteria"]],
+        "criteria": [{"hash": criteria_hash(text), "description": text} for text in rows["criteria"]],
+    }
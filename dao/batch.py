@@ -0,0 +1,10 @@
+from itertools import islice
+from os import getenv
+
+BATCH_SIZE = int(getenv("DB_BATCH_SIZE") or 1000)
+
+
+def batched(rows, size: int = BATCH_SIZE):
+    iterator = iter(rows)
+    while batch := list(islice(iterator, size)):
+        yield batch
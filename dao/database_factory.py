@@ -1,22 +1,193 @@
-from neo4j import GraphDatabase
+import os
+import threading
+from neo4j import GraphDatabase, AsyncGraphDatabase, AsyncManagedTransaction, READ_ACCESS
 from os import getenv
+from dao.instrumentation import AsyncInstrumentedTransaction, InstrumentedTransaction, Observer, caller, \
+    pool_stats, qualified_name
+
+# driver pool settings, unset values keep the driver defaults
+DRIVER_CONFIG = {
+    key: cast(value) for key, cast, value in (
+        ("max_connection_pool_size", int, getenv("DB_MAX_POOL_SIZE")),
+        ("connection_acquisition_timeout", float, getenv("DB_CONNECTION_ACQUISITION_TIMEOUT")),
+        ("max_connection_lifetime", float, getenv("DB_MAX_CONNECTION_LIFETIME")),
+        ("fetch_size", int, getenv("DB_FETCH_SIZE")),
+    ) if value
+}
+# connections opened by warm() when a worker boots
+DB_WARM_CONNECTIONS = int(getenv("DB_WARM_CONNECTIONS") or 1)
+# drivers a forked worker inherited from its parent, see _after_fork
+_inherited_drivers = []
 
 
 class DatabaseFactory:
 
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+    def __init__(self, uri, user, password, **config):
+        self.uri = uri
+        self.auth = (user, password)
+        self.config = config
+        self._driver = None
+        self._lock = threading.Lock()
+        # called with a dao.instrumentation.Observation per statement
+        self.observers: list[Observer] = []
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    @property
+    def driver(self):
+        # created on first use, so importing the app needs no database
+        if self._driver is None:
+            with self._lock:
+                if self._driver is None:
+                    self._driver = GraphDatabase.driver(self.uri, auth=self.auth, **self.config)
+        return self._driver
+
+    def _after_fork(self):
+        # A forked worker inherits the parent's driver and its pooled
+        # sockets. Closing that driver, or letting it be garbage collected
+        # (the driver's __del__ closes it), would say goodbye to the server
+        # on connections the parent still uses. So the child keeps it
+        # referenced, unused, for its whole life and builds its own driver
+        # on first use.
+        if self._driver is not None:
+            _inherited_drivers.append(self._driver)
+        self._driver = None
+        self._lock = threading.Lock()
+
+    def warm(self, connections: int = DB_WARM_CONNECTIONS):
+        # opens `connections` pooled connections up front, each held by an
+        # open transaction until all are established
+        self.driver.verify_connectivity()
+        sessions = [self.driver.session(default_access_mode=READ_ACCESS) for _ in range(connections)]
+        try:
+            for session in sessions:
+                session.begin_transaction().run("RETURN 1").consume()
+        finally:
+            for session in sessions:
+                session.close()
+
+    def observe(self, observer: Observer):
+        self.observers.append(observer)
+
+    def instrumented(self, query):
+        # the unit of work with its statements reported to the observers
+        if not self.observers:
+            return query
+        unit = qualified_name(query.__code__)
+
+        def run(tx, *args):
+            tx = InstrumentedTransaction(tx, unit, self.observers)
+            try:
+                return query(tx, *args)
+            finally:
+                tx.finish()
+        return run
 
-    def execute_query(self, query, params):
+    def execute_read(self, query, *args):
+        # read transactions are routed to followers and read replicas when
+        # the uri uses the neo4j:// scheme
+        with self.driver.session(default_access_mode=READ_ACCESS) as session:
+            return session.execute_read(self.instrumented(query), *args)
+
+    def execute_write(self, query, *args):
         with self.driver.session() as session:
-            return session.execute_write(query, params)
+            return session.execute_write(self.instrumented(query), *args)
+
+    # kept for callers that predate the read/write split
+    execute_query = execute_write
+
+    def stream(self, query, params):
+        # Runs the query in an explicit read transaction and yields its records
+        # while the driver fetches them in fetch_size batches. Closing the
+        # generator early rolls the transaction back.
+        with self.driver.session(default_access_mode=READ_ACCESS) as session:
+            with session.begin_transaction() as tx:
+                if not self.observers:
+                    yield from query(tx, params)
+                    return
+                tx = InstrumentedTransaction(tx, qualified_name(query.__code__), self.observers)
+                try:
+                    yield from query(tx, params)
+                finally:
+                    tx.finish()
+
+    def pool_stats(self) -> dict:
+        return pool_stats(self._driver) if self._driver is not None else {}
 
     def close(self):
-        self.driver.close()
+        with self._lock:
+            driver, self._driver = self._driver, None
+        if driver is not None:
+            driver.close()
+
+
+class AsyncDatabaseFactory:
+    # DatabaseFactory for the asyncio server (asgi.py). The driver belongs
+    # to the event loop it is first used on, so it is created lazily there.
+
+    def __init__(self, uri, user, password, **config):
+        self.uri = uri
+        self.auth = (user, password)
+        self.config = config
+        self._driver = None
+        self.observers: list[Observer] = []
+
+    @property
+    def driver(self):
+        if self._driver is None:
+            self._driver = AsyncGraphDatabase.driver(self.uri, auth=self.auth, **self.config)
+        return self._driver
+
+    def observe(self, observer: Observer):
+        self.observers.append(observer)
+
+    def instrumented(self, query, unit: str):
+        if not self.observers:
+            return query
+
+        async def run(tx, *args):
+            tx = AsyncInstrumentedTransaction(tx, unit, self.observers)
+            try:
+                return await query(tx, *args)
+            finally:
+                await tx.finish()
+        return run
+
+    def unit(self, query) -> str:
+        # data() and single() serve every async repository, so statements
+        # they run are named after the repository method awaiting this
+        return caller(2) if query in (data, single) else qualified_name(query.__code__)
+
+    async def execute_read(self, query, *args):
+        unit = self.unit(query)
+        async with self.driver.session(default_access_mode=READ_ACCESS) as session:
+            return await session.execute_read(self.instrumented(query, unit), *args)
+
+    async def execute_write(self, query, *args):
+        unit = self.unit(query)
+        async with self.driver.session() as session:
+            return await session.execute_write(self.instrumented(query, unit), *args)
+
+    def pool_stats(self) -> dict:
+        return pool_stats(self._driver) if self._driver is not None else {}
+
+    async def close(self):
+        driver, self._driver = self._driver, None
+        if driver is not None:
+            await driver.close()
+
+
+async def data(tx: AsyncManagedTransaction, query: str, params: dict) -> list[dict]:
+    return await (await tx.run(query, params)).data()
+
+
+async def single(tx: AsyncManagedTransaction, query: str, params: dict):
+    return await (await tx.run(query, params)).single()
+
 
+# neo4j:// enables cluster routing, bolt:// talks to a single server
+URI = f'{getenv("DB_SCHEME") or "bolt"}://{getenv("DB_URL") or "localhost"}:7687'
+USERNAME = getenv("DB_USERNAME") or "neo4j"
+PASSWORD = getenv("DB_PASSWORD") or "9VXuvxKAWuV9RTW"
 
-db = DatabaseFactory(
-    f'bolt://{getenv("DB_URL") or "localhost"}:7687',
-    getenv("DB_USERNAME") or "neo4j",
-    getenv("DB_PASSWORD") or "9VXuvxKAWuV9RTW"
-)
+db = DatabaseFactory(URI, USERNAME, PASSWORD, **DRIVER_CONFIG)
+async_db = AsyncDatabaseFactory(URI, USERNAME, PASSWORD, **DRIVER_CONFIG)
@@ -0,0 +1,17 @@
+import json
+from hashlib import blake2b
+
+
+def fingerprint(row: dict) -> str:
+    content = {key: value for key, value in row.items() if key != "content_hash"}
+    return blake2b(json.dumps(content, sort_keys=True, default=str).encode(),
+                   digest_size=16).hexdigest()
+
+
+def criteria_hash(description: str) -> str:
+    # compact identity of a Criteria node, the description itself is only stored once
+    return blake2b(description.encode(), digest_size=16).hexdigest()
+
+
+def fingerprinted(row: dict) -> dict:
+    return {**row, "content_hash": fingerprint(row)}
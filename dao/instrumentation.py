@@ -0,0 +1,260 @@
+import logging
+import sys
+import time
+from typing import Any, Callable, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Observation(NamedTuple):
+    # one statement, reported once its result is consumed
+    name: str
+    query: str
+    parameters: dict
+    seconds: float
+    rows: int
+    # neo4j.ResultSummary, None when the statement failed
+    summary: Any
+    error: Optional[BaseException]
+
+
+Observer = Callable[[Observation], None]
+
+
+def qualified_name(code) -> str:
+    return getattr(code, "co_qualname", code.co_name)
+
+
+def caller(depth: int) -> str:
+    return qualified_name(sys._getframe(depth + 1).f_code)
+
+
+def notify(observers: list[Observer], observation: Observation):
+    # instrumentation never fails the query it watches
+    for observer in observers:
+        try:
+            observer(observation)
+        except Exception:
+            logger.exception("query observer %r failed", observer)
+
+
+class _Statement:
+    # the bookkeeping shared by the sync and async results below
+
+    def __init__(self, observers: list[Observer], name: str, query: str, parameters: dict):
+        self.observers = observers
+        self.name = name
+        self.query = query
+        self.parameters = parameters
+        self.started = time.perf_counter()
+        self.rows = 0
+        self.done = False
+
+    def report(self, summary: Any = None, error: Optional[BaseException] = None):
+        if self.done:
+            return
+        self.done = True
+        notify(self.observers, Observation(self.name, self.query, self.parameters,
+                                           time.perf_counter() - self.started, self.rows, summary, error))
+
+
+class InstrumentedResult:
+    # neo4j.Result that counts the records handed out and reports the
+    # statement when it is consumed
+
+    def __init__(self, result, statement: _Statement):
+        self._result = result
+        self._statement = statement
+
+    def __getattr__(self, name: str):
+        return getattr(self._result, name)
+
+    def __iter__(self):
+        try:
+            for record in self._result:
+                self._statement.rows += 1
+                yield record
+        except Exception as error:
+            self._statement.report(error=error)
+            raise
+        self.finish()
+
+    def _counted(self, records: list) -> list:
+        self._statement.rows += len(records)
+        self.finish()
+        return records
+
+    def data(self, *keys) -> list[dict]:
+        return self._counted(self._call(self._result.data, *keys))
+
+    def values(self, *keys) -> list:
+        return self._counted(self._call(self._result.values, *keys))
+
+    def value(self, key=0, default=None) -> list:
+        return self._counted(self._call(self._result.value, key, default))
+
+    def single(self, strict: bool = False):
+        record = self._call(self._result.single, strict)
+        self._statement.rows += record is not None
+        self.finish()
+        return record
+
+    def consume(self):
+        summary = self._call(self._result.consume)
+        self._statement.report(summary)
+        return summary
+
+    def finish(self):
+        # consume() discards whatever is left unread without fetching it
+        if not self._statement.done:
+            try:
+                self.consume()
+            except Exception:
+                pass
+
+    def _call(self, method, *args):
+        try:
+            return method(*args)
+        except Exception as error:
+            self._statement.report(error=error)
+            raise
+
+
+class InstrumentedTransaction:
+    # neo4j.ManagedTransaction whose statements are reported to observers,
+    # each named after the function that ran it. Statements run by the
+    # generic helpers in dao.database_factory take the unit of work's name.
+
+    def __init__(self, tx, unit: str, observers: list[Observer]):
+        self._tx = tx
+        self._unit = unit
+        self._observers = observers
+        self._results: list[InstrumentedResult] = []
+
+    def __getattr__(self, name: str):
+        return getattr(self._tx, name)
+
+    def run(self, query, parameters: Optional[dict] = None, **kwargs) -> InstrumentedResult:
+        frame = sys._getframe(1)
+        name = self._unit if frame.f_globals.get("__name__") == "dao.database_factory" \
+            else qualified_name(frame.f_code)
+        statement = _Statement(self._observers, name, str(query), {**(parameters or {}), **kwargs})
+        try:
+            result = self._tx.run(query, parameters, **kwargs)
+        except Exception as error:
+            statement.report(error=error)
+            raise
+        result = InstrumentedResult(result, statement)
+        self._results.append(result)
+        return result
+
+    def finish(self):
+        # statements whose results the unit of work left unread
+        for result in self._results:
+            result.finish()
+
+
+class AsyncInstrumentedResult:
+    # neo4j.AsyncResult counterpart of InstrumentedResult
+
+    def __init__(self, result, statement: _Statement):
+        self._result = result
+        self._statement = statement
+
+    def __getattr__(self, name: str):
+        return getattr(self._result, name)
+
+    async def __aiter__(self):
+        try:
+            async for record in self._result:
+                self._statement.rows += 1
+                yield record
+        except Exception as error:
+            self._statement.report(error=error)
+            raise
+        await self.finish()
+
+    async def _counted(self, records: list) -> list:
+        self._statement.rows += len(records)
+        await self.finish()
+        return records
+
+    async def data(self, *keys) -> list[dict]:
+        return await self._counted(await self._call(self._result.data, *keys))
+
+    async def values(self, *keys) -> list:
+        return await self._counted(await self._call(self._result.values, *keys))
+
+    async def value(self, key=0, default=None) -> list:
+        return await self._counted(await self._call(self._result.value, key, default))
+
+    async def single(self, strict: bool = False):
+        record = await self._call(self._result.single, strict)
+        self._statement.rows += record is not None
+        await self.finish()
+        return record
+
+    async def consume(self):
+        summary = await self._call(self._result.consume)
+        self._statement.report(summary)
+        return summary
+
+    async def finish(self):
+        if not self._statement.done:
+            try:
+                await self.consume()
+            except Exception:
+                pass
+
+    async def _call(self, method, *args):
+        try:
+            return await method(*args)
+        except Exception as error:
+            self._statement.report(error=error)
+            raise
+
+
+class AsyncInstrumentedTransaction:
+    # neo4j.AsyncManagedTransaction counterpart of InstrumentedTransaction
+
+    def __init__(self, tx, unit: str, observers: list[Observer]):
+        self._tx = tx
+        self._unit = unit
+        self._observers = observers
+        self._results: list[AsyncInstrumentedResult] = []
+
+    def __getattr__(self, name: str):
+        return getattr(self._tx, name)
+
+    async def run(self, query, parameters: Optional[dict] = None, **kwargs) -> AsyncInstrumentedResult:
+        frame = sys._getframe(1)
+        name = self._unit if frame.f_globals.get("__name__") == "dao.database_factory" \
+            else qualified_name(frame.f_code)
+        statement = _Statement(self._observers, name, str(query), {**(parameters or {}), **kwargs})
+        try:
+            result = await self._tx.run(query, parameters, **kwargs)
+        except Exception as error:
+            statement.report(error=error)
+            raise
+        result = AsyncInstrumentedResult(result, statement)
+        self._results.append(result)
+        return result
+
+    async def finish(self):
+        for result in self._results:
+            await result.finish()
+
+
+def pool_stats(driver) -> dict:
+    # Connections per server address. The 5.x driver has no public pool
+    # API, so this reads its internals and reports nothing if they move.
+    try:
+        pool = driver._pool
+        stats = {"max": pool.pool_config.max_connection_pool_size, "servers": {}}
+        for address, connections in list(pool.connections.items()):
+            connections = list(connections)
+            in_use = sum(1 for connection in connections if connection.in_use)
+            stats["servers"][str(address)] = {"in_use": in_use, "idle": len(connections) - in_use}
+        return stats
+    except AttributeError:
+        return {}
@@ -0,0 +1,75 @@
+from os import getenv
+from typing import NamedTuple
+from neo4j import ManagedTransaction
+from dao.database_factory import DatabaseFactory
+
+SCHEMA_AWAIT_SECONDS = int(getenv("SCHEMA_AWAIT_SECONDS") or 300)
+
+# every property the import and the read queries look nodes up by
+CONSTRAINTS = {
+    "sector_name": "CREATE CONSTRAINT sector_name IF NOT EXISTS "
+                   "FOR (sector:Sector) REQUIRE sector.name IS UNIQUE",
+    "objective_key": "CREATE CONSTRAINT objective_key IF NOT EXISTS "
+                     "FOR (objective:Objective) REQUIRE objective.key IS UNIQUE",
+    "activity_name": "CREATE CONSTRAINT activity_name IF NOT EXISTS "
+                     "FOR (activity:Activity) REQUIRE activity.name IS UNIQUE",
+    # criteria are keyed by a hash of their description, see dao.fingerprint
+    "criteria_hash": "CREATE CONSTRAINT criteria_hash IF NOT EXISTS "
+                     "FOR (criteria:Criteria) REQUIRE criteria.hash IS UNIQUE",
+}
+INDEXES = {}
+# definitions earlier versions created that nothing looks up by anymore
+OBSOLETE = {
+    "criteria_description": "DROP INDEX criteria_description IF EXISTS",
+}
+
+
+class Schema(NamedTuple):
+    db: DatabaseFactory
+
+    @staticmethod
+    def _create_query(tx: ManagedTransaction, statement: str):
+        tx.run(statement).consume()
+
+    @staticmethod
+    def _indexes_query(tx: ManagedTransaction, params):
+        result = tx.run("SHOW INDEXES "
+                        "YIELD name, type, state, populationPercent, owningConstraint "
+                        "RETURN name, type, state, populationPercent, owningConstraint", params)
+        return result.data()
+
+    @staticmethod
+    def _await_query(tx: ManagedTransaction, seconds: int):
+        tx.run("CALL db.awaitIndexes($seconds)", seconds=seconds).consume()
+
+    def bootstrap(self) -> dict:
+        # idempotent; a definition the data violates (e.g. duplicate activity
+        # names left by an older import) is reported instead of raised
+        failed = {}
+        for name, statement in {**OBSOLETE, **CONSTRAINTS, **INDEXES}.items():
+            try:
+                self.db.execute_write(self._create_query, statement)
+            except Exception as error:
+                failed[name] = str(error)
+        status = self.status()
+        status["failed"] = failed
+        return status
+
+    def await_online(self, seconds: int = SCHEMA_AWAIT_SECONDS):
+        self.db.execute_write(self._await_query, seconds)
+
+    def status(self) -> dict:
+        indexes = {index["name"]: index
+                   for index in self.db.execute_read(self._indexes_query, {})}
+        # a constraint is backed by an index carrying the constraint's name
+        expected = {**CONSTRAINTS, **INDEXES}
+        return {
+            "missing": [name for name in expected if name not in indexes],
+            "populating": [name for name in expected
+                           if name in indexes and indexes[name]["state"] != "ONLINE"],
+            "indexes": {name: {"type": indexes[name]["type"],
+                               "state": indexes[name]["state"],
+                               "populationPercent": indexes[name]["populationPercent"],
+                               "constraint": indexes[name]["owningConstraint"]}
+                        for name in expected if name in indexes},
+        }
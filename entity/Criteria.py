@@ -5,4 +5,5 @@ from typing import Optional
 @dataclass
 class Criteria:
     description: str
+    hash: Optional[str] = None
     id: Optional[str] = None
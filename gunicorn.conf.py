@@ -0,0 +1,19 @@
+# gunicorn reads this file from the working directory (see Dockerfile).
+# The Neo4j driver is created lazily in each worker, so the app can be
+# imported, and preloaded, without a reachable database.
+
+
+def on_starting(server):
+    # counters left by a previous run of the server would add up with this one's
+    from service.metrics import metrics
+    metrics.clear()
+
+
+def post_worker_init(worker):
+    from app import warm_up
+    warm_up()
+
+
+def worker_exit(server, worker):
+    from app import shut_down
+    shut_down()
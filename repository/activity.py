@@ -1,9 +1,161 @@
+import json
 from typing import NamedTuple, Optional, Tuple
-from dao.database_factory import DatabaseFactory
+from dao.database_factory import DatabaseFactory, AsyncDatabaseFactory, data, single
+from dao.batch import BATCH_SIZE, batched
+from dao.fingerprint import fingerprinted
 from neo4j import ManagedTransaction, Record
 from entity.Activity import Activity
 from entity.Objective import Objective
 
+# read queries shared by ActivityRepository and AsyncActivityRepository
+GET_BY_NAMES = ("UNWIND $names AS name "
+                "MATCH (activity:Activity) WHERE activity.name = name "
+                "RETURN id(activity) as id, activity.name as name, "
+                "activity.description as description, "
+                "activity.reference as reference")
+NACE_CODES_BY_NAMES = ("UNWIND $names AS name "
+                       "MATCH (activity:Activity) WHERE activity.name = name "
+                       "RETURN activity.name as name, activity.nace_codes as nace_codes")
+COUNT = "MATCH (activity:Activity) RETURN count(activity) as count"
+MAIN_OBJECTIVES_COUNT = ("MATCH (:Activity)-[matches:MATCHES]->(:Objective) "
+                         "RETURN count(matches) as count")
+MAIN_OBJECTIVE_KEYS = {"mitigation": "mitigation", "adoptation": "adoptation"}
+
+# Read queries take the requested fields as a nested dict of snake_case
+# names (see resolver.projection) and return only those; None asks for
+# everything.
+ACTIVITY_PROPERTIES = ("name", "description", "reference")
+OBJECTIVE_PROPERTIES = ("key", "name", "long_name")
+
+
+def requested(fields: Optional[dict], name: str) -> bool:
+    return fields is None or name in fields
+
+
+def subfields(fields: Optional[dict], name: str) -> Optional[dict]:
+    return None if fields is None else fields.get(name) or {}
+
+
+def activity_projection(variable: str, fields: Optional[dict]) -> str:
+    # name is always there, cursors and loaders key on it; sector and nace
+    # codes come along when asked for, saving the loaders a round trip
+    items = [f"id: id({variable})"] if requested(fields, "id") else []
+    items += [f".{name}" for name in ACTIVITY_PROPERTIES if name == "name" or requested(fields, name)]
+    if requested(fields, "nace"):
+        items.append(".nace_codes")
+    if fields is not None and "sector" in fields:
+        items.append(f"sector: head([({variable})<-[:MATCHES]-(s:Sector)|s{{id: id(s), .name, .reference}}])")
+    return f"{variable}{{{', '.join(items)}}}"
+
+
+def objective_projection(variable: str, fields: Optional[dict]) -> str:
+    items = [f"id: id({variable})"] if requested(fields, "id") else []
+    items += [f".{name}" for name in OBJECTIVE_PROPERTIES if name == "key" or requested(fields, name)]
+    return f"{variable}{{{', '.join(items)}}}"
+
+
+def main_objectives_return(fields: Optional[dict]) -> str:
+    # RETURN clause over (a)-[matches]->(o). DNSH and criteria hashes come
+    # from the summary stored on the relationship (see summarized), the
+    # criteria text from the criteria loader; the traversals are only a
+    # fallback for relationships written before summaries existed, and
+    # only run when their fields are requested.
+    columns = [f"{activity_projection('a', subfields(fields, 'activity'))} as activity",
+               f"{objective_projection('o', subfields(fields, 'objective'))} as objective"]
+    if requested(fields, "activity_contribution_type"):
+        columns.append("matches.contribution_type as activity_contribution_type")
+    if requested(fields, "contribution_description"):
+        columns.append("matches.description as contribution_description")
+    if requested(fields, "dnsh"):
+        columns.append("matches.dnsh_summary as dnsh_summary")
+        dnsh = subfields(fields, "dnsh")
+        items = []
+        if requested(dnsh, "objective"):
+            items.append(f"objective: {objective_projection('do', subfields(dnsh, 'objective'))}")
+        if requested(dnsh, "criteria"):
+            items.append("criteria: [(do)-[:DNSH_MATCHES]->(c:Criteria)|c.description]")
+        if requested(dnsh, "criteria_hashes"):
+            items.append("criteria_hashes: [(do)-[:DNSH_MATCHES]->(c:Criteria)|c.hash]")
+        columns.append(unsummarized(f"[(o)-[:DNSH]->(do:Objective)|{{{', '.join(items)}}}]",
+                                    "dnsh", "dnsh_summary"))
+    if requested(fields, "substantial_contribution_criteria") or \
+            requested(fields, "substantial_contribution_criteria_hashes"):
+        columns.append("CASE WHEN matches.sc_criteria_hashes IS NULL "
+                       "THEN [(o)-[:SC_CRITERIA]->(c:Criteria)|c.hash] ELSE matches.sc_criteria_hashes "
+                       "END as substantial_contribution_criteria_hashes")
+    if requested(fields, "substantial_contribution_criteria"):
+        columns.append(unsummarized("[(o)-[:SC_CRITERIA]->(c:Criteria)|c.description]",
+                                    "substantial_contribution_criteria", "sc_criteria_hashes"))
+    return "RETURN " + ", ".join(columns)
+
+
+def unsummarized(expression: str, name: str, summary: str) -> str:
+    return f"CASE WHEN matches.{summary} IS NULL THEN {expression} END as {name}"
+
+
+def summarized(rows: list[dict], fields: Optional[dict] = None) -> list[dict]:
+    # decodes the DNSH summary column. DNSH objectives are stored by key:
+    # when nothing but the key is asked for it is answered right here,
+    # otherwise the key is left for the objectives loader to batch, as the
+    # criteria hashes are for the criteria loader.
+    dnsh_objective = subfields(subfields(fields, "dnsh"), "objective")
+    key_only = dnsh_objective is not None and set(dnsh_objective) <= {"key"}
+    for row in rows:
+        summary = row.pop("dnsh_summary", None)
+        if summary is None:
+            continue
+        row["dnsh"] = json.loads(summary)
+        for dnsh in row["dnsh"]:
+            if key_only:
+                dnsh["objective"] = {"key": dnsh["objective"]}
+    return rows
+
+
+def get_by_name_query(fields: Optional[dict] = None) -> str:
+    return ("MATCH (activity:Activity) "
+            "WHERE activity.name = $name "
+            f"RETURN {activity_projection('activity', fields)} as activity")
+
+
+def get_all_query(params: dict, fields: Optional[dict] = None) -> str:
+    # keyset paging on the activity_name index: no SKIP, so a page deep
+    # into the list costs the same as the first one
+    return ("MATCH (activity:Activity) "
+            + ("WHERE activity.name > $after " if params.get("after") is not None else "")
+            + f"RETURN {activity_projection('activity', fields)} as activity "
+            "ORDER BY activity.name"
+            + (" LIMIT $limit" if params.get("limit") is not None else ""))
+
+
+def main_objectives_all_query(params: dict, fields: Optional[dict] = None) -> str:
+    # ordered by (activity name, objective key); the range on a.name lets
+    # the planner seek the index, the second predicate trims the
+    # activity the previous page ended in. The page is cut before the
+    # DNSH and criteria comprehensions run.
+    return ("MATCH(a:Activity)-[matches:MATCHES]->(o:Objective) "
+            + ("WHERE a.name >= $after_activity AND (a.name > $after_activity OR o.key > $after_objective) "
+               if params.get("after_activity") is not None else "")
+            + "WITH a, matches, o ORDER BY a.name, o.key"
+            + (" LIMIT $limit " if params.get("limit") is not None else " ")
+            + main_objectives_return(fields))
+
+
+def main_objectives_by_id_query(fields: Optional[dict] = None) -> str:
+    return ("MATCH(a:Activity WHERE id(a)=$id)-[matches:MATCHES]->"
+            "(o:Objective WHERE o.key=$mitigation OR o.key=$adoptation) "
+            + main_objectives_return(fields))
+
+
+def main_objectives_by_name_query(fields: Optional[dict] = None) -> str:
+    return ("MATCH(a:Activity WHERE a.name=$name)-[matches:MATCHES]->"
+            "(o:Objective WHERE o.key=$mitigation OR o.key=$adoptation) "
+            + main_objectives_return(fields))
+
+
+def main_objectives_all_params(after: Optional[tuple], limit: Optional[int]) -> dict:
+    after_activity, after_objective = after or (None, None)
+    return {"after_activity": after_activity, "after_objective": after_objective, "limit": limit}
+
 
 class ActivityRepository(NamedTuple):
     db: DatabaseFactory
@@ -20,12 +172,41 @@ class ActivityRepository(NamedTuple):
         return result.single()
 
     @staticmethod
-    def bulk_create_query(tx: ManagedTransaction, entitis: list[Activity]):
-        for entity in entitis:
-            tx.run(
-                "MERGE (:Activity{name:$name, description:$description,reference:$reference})",
-                vars(entity)
-            )
+    def params(entity: Activity) -> dict:
+        return fingerprinted({"name": entity.name, "description": entity.description, "reference": entity.reference,
+                              "nace_codes": ActivityRepository.nace_codes(entity.nace_codes)})
+
+    @staticmethod
+    def nace_codes(codes) -> list[str]:
+        # the source has them as a list or a single comma separated string
+        if not codes:
+            return []
+        if isinstance(codes, str):
+            codes = codes.split(",")
+        return [str(code).strip() for code in codes if str(code).strip()]
+
+    @staticmethod
+    def bulk_create_query(tx: ManagedTransaction, entitis: list[Activity], batch_size: int = BATCH_SIZE):
+        rows = (ActivityRepository.params(entity) for entity in entitis)
+        for batch in batched(rows, batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MERGE (activity:Activity{name:row.name}) "
+                   "SET activity.description = row.description, activity.reference = row.reference, "
+                   "activity.nace_codes = row.nace_codes, activity.content_hash = row.content_hash",
+                   rows=batch)
+
+    @staticmethod
+    def fingerprints_query(tx: ManagedTransaction):
+        result = tx.run("MATCH (activity:Activity) "
+                        "RETURN activity.name as name, activity.content_hash as content_hash")
+        return result.data()
+
+    @staticmethod
+    def bulk_delete_query(tx: ManagedTransaction, rows: list[dict], batch_size: int = BATCH_SIZE):
+        for batch in batched(rows, batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MATCH (activity:Activity) WHERE activity.name = row.name "
+                   "DETACH DELETE activity", rows=batch)
 
     @staticmethod
     def _update_query(tx: ManagedTransaction, entity: Activity) -> Optional[Activity]:
@@ -49,41 +230,80 @@ class ActivityRepository(NamedTuple):
         return result.single()
 
     @staticmethod
-    def _get_all_query(tx: ManagedTransaction, params):
-        result = tx.run("MATCH (activity:Activity) "
-                        "RETURN id(activity) as id, activity.name as name, "
-                        "activity.description as description, "
-                        "activity.reference as reference", params)
-        return result.data()
+    def _get_by_name_query(tx: ManagedTransaction, name: str, fields: Optional[dict] = None) -> Optional[dict]:
+        record = tx.run(get_by_name_query(fields), name=name).single()
+        return record["activity"] if record else None
 
     @staticmethod
-    def _main_objectives_all_by_id_query(tx: ManagedTransaction, params):
-        result = tx.run("MATCH(a:Activity)-[matches:MATCHES]->(o:Objective)"
-                        "RETURN a as activity, o as objective, "
-                        "matches.contribution_type as activityContributionType, "
-                        "matches.description as contributionDescription, "
-                        "[(o)-[:DNSH]-(do:Objective)-[:DNSH]-(c:Criteria)|{objective: do.name, criteria:[c.description]}] as dnsh, "
-                        "[(o)-[:SC_CRITERIA]->(c:Criteria)|c.description] as substantialContributionCriteria",
-                        params)
+    def _get_by_names_query(tx: ManagedTransaction, names: list[str]):
+        result = tx.run(GET_BY_NAMES, names=names)
         return result.data()
 
     @staticmethod
-    def _main_objectives_by_id_query(tx: ManagedTransaction, id: str):
-        result = tx.run("MATCH(a:Activity WHERE id(a)=$id)-[matches:MATCHES]->(o:Objective WHERE o.key=$mitigation OR o.key=$adoptation) "
-                        "RETURN a as activity, o as objective, "
-                        "matches.contribution_type as activityContributionType, "
-                        "matches.description as contributionDescription",
-                        id=int(id), mitigation="mitigation", adoptation="adoptation")
+    def _nace_codes_by_names_query(tx: ManagedTransaction, names: list[str]):
+        result = tx.run(NACE_CODES_BY_NAMES, names=names)
         return result.data()
 
     @staticmethod
-    def _main_objectives_by_name_query(tx: ManagedTransaction, name: str):
-        result = tx.run("MATCH(a:Activity WHERE a.name=$name)-[matches:MATCHES]->(o:Objective WHERE o.key=$mitigation OR o.key=$adoptation) "
-                        "RETURN a as activity, o as objective, "
-                        "matches.contribution_type as activityContributionType, "
-                        "matches.description as contributionDescription",
-                        name=name, mitigation="mitigation", adoptation="adoptation")
-        return result.data()
+    def _get_all_query(tx: ManagedTransaction, params, fields: Optional[dict] = None):
+        result = tx.run(get_all_query(params, fields), params)
+        return [record["activity"] for record in result]
+
+    @staticmethod
+    def _count_query(tx: ManagedTransaction, params):
+        return tx.run(COUNT, params).single()["count"]
+
+    @staticmethod
+    def _main_objectives_all_by_id_query(tx: ManagedTransaction, params, fields: Optional[dict] = None):
+        result = tx.run(main_objectives_all_query(params, fields), params)
+        return summarized(result.data(), fields)
+
+    @staticmethod
+    def _export_query(tx: ManagedTransaction, params):
+        # One record per activity-objective match, with DNSH and criteria,
+        # streamed. Like the GraphQL reads it takes them from the match's
+        # summary, with the objectives and criteria text looked up here, and
+        # only walks the graph for matches written before summaries existed.
+        objectives = {record["key"]: record["objective"] for record in
+                      tx.run("MATCH (o:Objective) RETURN o.key as key, properties(o) as objective").data()}
+        criteria = {record["hash"]: record["description"] for record in
+                    tx.run("MATCH (c:Criteria) RETURN c.hash as hash, c.description as description").data()}
+        result = tx.run("MATCH(a:Activity)-[matches:MATCHES]->(o:Objective) "
+                        "RETURN properties(a) as activity, properties(o) as objective, "
+                        "matches.contribution_type as activity_contribution_type, "
+                        "matches.description as contribution_description, "
+                        "matches.dnsh_summary as dnsh_summary, matches.sc_criteria_hashes as sc_criteria_hashes, "
+                        + unsummarized("[(o)-[:DNSH]->(do:Objective)|{objective: properties(do), "
+                                       "criteria: [(do)-[:DNSH_MATCHES]->(c:Criteria)|c.description]}]",
+                                       "dnsh", "dnsh_summary")
+                        + ", "
+                        + unsummarized("[(o)-[:SC_CRITERIA]->(c:Criteria)|c.description]",
+                                       "substantial_contribution_criteria", "sc_criteria_hashes"),
+                        params)
+        for record in result:
+            record = record.data()
+            dnsh, hashes = record.pop("dnsh_summary"), record.pop("sc_criteria_hashes")
+            if dnsh is not None:
+                record["dnsh"] = [{"objective": objectives.get(entry["objective"]),
+                                   "criteria": [criteria.get(hash) for hash in entry["criteria_hashes"]]}
+                                  for entry in json.loads(dnsh)]
+            if hashes is not None:
+                record["substantial_contribution_criteria"] = [criteria.get(hash) for hash in hashes]
+            yield record
+
+    @staticmethod
+    def _main_objectives_count_query(tx: ManagedTransaction, params):
+        return tx.run(MAIN_OBJECTIVES_COUNT, params).single()["count"]
+
+    @staticmethod
+    def _main_objectives_by_id_query(tx: ManagedTransaction, id: str, fields: Optional[dict] = None):
+        result = tx.run(main_objectives_by_id_query(fields), id=int(id), **MAIN_OBJECTIVE_KEYS)
+        return summarized(result.data(), fields)
+
+    @staticmethod
+    def _main_objectives_by_name_query(tx: ManagedTransaction, name: str, fields: Optional[dict] = None):
+        result = tx.run(main_objectives_by_name_query(fields), name=name, **MAIN_OBJECTIVE_KEYS)
+        return summarized(result.data(), fields)
 
     @staticmethod
     def create_matches_with_objective_query(tx: ManagedTransaction, entity: Activity, objective: Objective):
@@ -133,43 +353,134 @@ class ActivityRepository(NamedTuple):
                    "MERGE (activity)-[:MATCHES{description:$description}]->(objective)",
                    activity_name=activity, objective_key=objective, **match)
 
+    @staticmethod
+    def bulk_create_contribution_match_with_objective_query(tx: ManagedTransaction, rows: list[dict], batch_size: int = BATCH_SIZE):
+        # merged on the pair, which the import writes once per document,
+        # see Integration.first_match
+        for batch in batched(map(fingerprinted, rows), batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MATCH (activity:Activity) WHERE activity.name = row.activity_name "
+                   "MATCH (objective:Objective) WHERE objective.key = row.objective_key "
+                   "MERGE (activity)-[rel:MATCHES]->(objective) "
+                   "SET rel.contribution_type = row.contribution_type, rel.description = row.description, "
+                   "rel.dnsh_summary = row.dnsh_summary, rel.sc_criteria_hashes = row.sc_criteria_hashes, "
+                   "rel.content_hash = row.content_hash",
+                   rows=batch)
+
+    @staticmethod
+    def contribution_match_fingerprints_query(tx: ManagedTransaction):
+        result = tx.run("MATCH (activity:Activity)-[rel:MATCHES]->(objective:Objective) "
+                        "RETURN activity.name as activity_name, objective.key as objective_key, "
+                        "rel.content_hash as content_hash")
+        return result.data()
+
+    @staticmethod
+    def bulk_delete_contribution_match_query(tx: ManagedTransaction, rows: list[dict], batch_size: int = BATCH_SIZE):
+        for batch in batched(rows, batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MATCH (activity:Activity)-[rel:MATCHES]->(objective:Objective) "
+                   "WHERE activity.name = row.activity_name AND objective.key = row.objective_key "
+                   "DELETE rel", rows=batch)
+
     def create(self, entity: Activity):
-        return self.db.execute_query(self._create_query, entity)
+        return self.db.execute_write(self._create_query, entity)
 
     def bulk_create(self, entities: list[Activity]):
-        return self.db.execute_query(self._bulk_create_query, entities)
+        return self.db.execute_write(self._bulk_create_query, entities)
 
     def create_contribution_match_with_objective(self, activity: str, objective: str, match) -> Activity:
-        return self.db.execute_query(self._create_contribution_match_with_objective_query, activity, objective, match)
+        return self.db.execute_write(self._create_contribution_match_with_objective_query, activity, objective, match)
 
     def update(self, entity: Activity) -> Tuple[bool, Optional[Activity]]:
-        activity: Record = self.db.execute_query(self._update_query, entity)
+        activity: Record = self.db.execute_write(self._update_query, entity)
         if activity:
             return (True, activity.data()["activity"])
         else:
             return (False, None)
 
     def get_by_id(self, id: str) -> Optional[Activity]:
-        activity: Record = self.db.execute_query(self._get_query, id)
+        activity: Record = self.db.execute_read(self._get_query, id)
         if activity:
             return activity.data()
         else:
             return None
 
-    def get_all(self) -> list[Activity]:
-        return self.db.execute_query(self._get_all_query, {})
+    def get_by_name(self, name: str, fields: Optional[dict] = None) -> Optional[dict]:
+        return self.db.execute_read(self._get_by_name_query, name, fields)
+
+    def get_by_names(self, names: list[str]) -> list[dict]:
+        return self.db.execute_read(self._get_by_names_query, names)
+
+    def get_nace_codes_by_names(self, names: list[str]) -> list[dict]:
+        return self.db.execute_read(self._nace_codes_by_names_query, names)
 
-    def get_main_objectives_all(self):
-        return self.db.execute_query(self._main_objectives_all_by_id_query, {})
+    def get_all(self, after: Optional[str] = None, limit: Optional[int] = None,
+                fields: Optional[dict] = None) -> list[dict]:
+        return self.db.execute_read(self._get_all_query, {"after": after, "limit": limit}, fields)
 
-    def get_main_objectives_by_id(self, id: str):
-        return self.db.execute_query(self._main_objectives_by_id_query, id)
+    def count(self) -> int:
+        return self.db.execute_read(self._count_query, {})
 
-    def get_main_objectives_by_name(self, name: str):
-        return self.db.execute_query(self._main_objectives_by_name_query, name)
+    def get_main_objectives_all(self, after: Optional[tuple] = None, limit: Optional[int] = None,
+                                fields: Optional[dict] = None):
+        return self.db.execute_read(self._main_objectives_all_by_id_query,
+                                    main_objectives_all_params(after, limit), fields)
+
+    def export(self):
+        return self.db.stream(self._export_query, {})
+
+    def count_main_objectives(self) -> int:
+        return self.db.execute_read(self._main_objectives_count_query, {})
+
+    def get_main_objectives_by_id(self, id: str, fields: Optional[dict] = None):
+        return self.db.execute_read(self._main_objectives_by_id_query, id, fields)
+
+    def get_main_objectives_by_name(self, name: str, fields: Optional[dict] = None):
+        return self.db.execute_read(self._main_objectives_by_name_query, name, fields)
 
     def delete_by_id(self, id: str) -> bool:
-        return self.db.execute_query(self._delete_query, id)
+        return self.db.execute_write(self._delete_query, id)
 
     def delete_relationship_with_objective(self, entity: Activity, objective: Objective) -> bool:
-        return self.db.execute_query(self._delete_relationship_with_objective_query, entity, objective)
+        return self.db.execute_write(self._delete_relationship_with_objective_query, entity, objective)
+
+
+class AsyncActivityRepository(NamedTuple):
+    # the reads behind the GraphQL API, for the async server
+    db: AsyncDatabaseFactory
+
+    async def get_by_name(self, name: str, fields: Optional[dict] = None) -> Optional[dict]:
+        activity: Record = await self.db.execute_read(single, get_by_name_query(fields), {"name": name})
+        return activity["activity"] if activity else None
+
+    async def get_by_names(self, names: list[str]) -> list[dict]:
+        return await self.db.execute_read(data, GET_BY_NAMES, {"names": names})
+
+    async def get_nace_codes_by_names(self, names: list[str]) -> list[dict]:
+        return await self.db.execute_read(data, NACE_CODES_BY_NAMES, {"names": names})
+
+    async def get_all(self, after: Optional[str] = None, limit: Optional[int] = None,
+                      fields: Optional[dict] = None) -> list[dict]:
+        params = {"after": after, "limit": limit}
+        rows = await self.db.execute_read(data, get_all_query(params, fields), params)
+        return [row["activity"] for row in rows]
+
+    async def count(self) -> int:
+        return (await self.db.execute_read(single, COUNT, {}))["count"]
+
+    async def get_main_objectives_all(self, after: Optional[tuple] = None, limit: Optional[int] = None,
+                                      fields: Optional[dict] = None):
+        params = main_objectives_all_params(after, limit)
+        return summarized(await self.db.execute_read(data, main_objectives_all_query(params, fields), params),
+                          fields)
+
+    async def count_main_objectives(self) -> int:
+        return (await self.db.execute_read(single, MAIN_OBJECTIVES_COUNT, {}))["count"]
+
+    async def get_main_objectives_by_id(self, id: str, fields: Optional[dict] = None):
+        return summarized(await self.db.execute_read(data, main_objectives_by_id_query(fields),
+                                                     {"id": int(id), **MAIN_OBJECTIVE_KEYS}), fields)
+
+    async def get_main_objectives_by_name(self, name: str, fields: Optional[dict] = None):
+        return summarized(await self.db.execute_read(data, main_objectives_by_name_query(fields),
+                                                     {"name": name, **MAIN_OBJECTIVE_KEYS}), fields)
@@ -1,4 +1,4 @@
-from typing import NamedTuple, Optional
+from typing import NamedTuple, Optional, Tuple
 from dao.database_factory import DatabaseFactory
 from neo4j import ManagedTransaction, Record
 from entity.Activity import Activity
@@ -82,33 +82,33 @@ class ActivityRepository(NamedTuple):
         return result
 
     def create(self, entity: Activity):
-        return self.db.execute_query(self._create_query, entity)
+        return self.db.execute_write(self._create_query, entity)
 
     def create_match_with_objective(self, entity: Activity, objective: Objective) -> Activity:
-        return self.db.execute_query(self._create_match_with_objective_query, entity, objective)
+        return self.db.execute_write(self._create_match_with_objective_query, entity, objective)
 
     def create_contribution_match_with_objective(self, entity: Activity, objective: Objective) -> Activity:
-        return self.db.execute_query(self._create_contribution_match_with_objective_query, entity, objective)
+        return self.db.execute_write(self._create_contribution_match_with_objective_query, entity, objective)
 
-    def update(self, entity: Activity) -> tuple(bool, Optional[Activity]):
-        activity: Record = self.db.execute_query(self._update_query, entity)
+    def update(self, entity: Activity) -> Tuple[bool, Optional[Activity]]:
+        activity: Record = self.db.execute_write(self._update_query, entity)
         if activity:
             return (True, activity.data()["activity"])
         else:
             return (False, None)
 
     def get_by_id(self, id: str) -> Optional[Activity]:
-        activity: Record = self.db.execute_query(self._get_query, id)
+        activity: Record = self.db.execute_read(self._get_query, id)
         if activity:
             return activity.data()
         else:
             return None
 
     def get_all(self) -> list[Activity]:
-        return self.db.execute_query(self._get_all_query)
+        return self.db.execute_read(self._get_all_query)
 
     def delete_by_id(self, id: str) -> bool:
-        return self.db.execute_query(self._delete_query, id)
+        return self.db.execute_write(self._delete_query, id)
 
     def delete_relationship_with_objective(self, entity: Activity, objective: Objective) -> bool:
-        return self.db.execute_query(self._delete_relationship_with_objective_query, entity, objective)
+        return self.db.execute_write(self._delete_relationship_with_objective_query, entity, objective)
@@ -1,9 +1,16 @@
 from typing import NamedTuple, Optional, Tuple
-from dao.database_factory import DatabaseFactory
+from dao.database_factory import DatabaseFactory, AsyncDatabaseFactory, data
+from dao.batch import BATCH_SIZE, batched
+from dao.fingerprint import criteria_hash, fingerprinted
 from neo4j import ManagedTransaction, Record
 from entity.Criteria import Criteria
 from entity.Objective import Objective
 
+# shared by CriteriaRepository and AsyncCriteriaRepository
+GET_BY_HASHES = ("UNWIND $hashes AS hash "
+                 "MATCH (criteria:Criteria) WHERE criteria.hash = hash "
+                 "RETURN criteria.hash as hash, criteria.description as description")
+
 
 class CriteriaRepository(NamedTuple):
     db: DatabaseFactory
@@ -16,10 +23,42 @@ class CriteriaRepository(NamedTuple):
         return result.single()
 
     @staticmethod
-    def bulk_create_query(tx: ManagedTransaction, descriptions: list[str]):
-        for description in descriptions:
-            tx.run("MERGE (:Criteria{description:$description})",
-                   description=description)
+    def params(description: str) -> dict:
+        return fingerprinted({"hash": criteria_hash(description), "description": description})
+
+    @staticmethod
+    def bulk_create_query(tx: ManagedTransaction, descriptions: list[str], batch_size: int = BATCH_SIZE):
+        rows = (CriteriaRepository.params(description) for description in descriptions)
+        for batch in batched(rows, batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MERGE (criteria:Criteria{hash:row.hash}) "
+                   "SET criteria.description = row.description, criteria.content_hash = row.content_hash",
+                   rows=batch)
+
+    @staticmethod
+    def fingerprints_query(tx: ManagedTransaction):
+        result = tx.run("MATCH (criteria:Criteria) "
+                        "RETURN criteria.hash as hash, criteria.content_hash as content_hash")
+        return result.data()
+
+    @staticmethod
+    def bulk_delete_query(tx: ManagedTransaction, rows: list[dict], batch_size: int = BATCH_SIZE):
+        for batch in batched(rows, batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MATCH (criteria:Criteria) WHERE criteria.hash = row.hash "
+                   "DETACH DELETE criteria", rows=batch)
+
+    @staticmethod
+    def delete_unhashed_query(tx: ManagedTransaction, params):
+        # criteria written before they were keyed by hash
+        result = tx.run("MATCH (criteria:Criteria) WHERE criteria.hash IS NULL "
+                        "DETACH DELETE criteria", params)
+        return result.consume().counters.nodes_deleted
+
+    @staticmethod
+    def get_by_hashes_query(tx: ManagedTransaction, hashes: list[str]):
+        result = tx.run(GET_BY_HASHES, hashes=hashes)
+        return result.data()
 
     @staticmethod
     def update_query(tx: ManagedTransaction, entity: Criteria) -> Optional[Criteria]:
@@ -84,33 +123,44 @@ class CriteriaRepository(NamedTuple):
         return result
 
     def create(self, entity: Criteria):
-        return self.db.execute_query(self.create_query, entity)
+        return self.db.execute_write(self.create_query, entity)
 
     def create_match_with_objective(self, entity: Criteria, objective: Objective) -> Criteria:
-        return self.db.execute_query(self._create_match_with_objective_query, entity, objective)
+        return self.db.execute_write(self._create_match_with_objective_query, entity, objective)
 
     def create_contribution_match_with_objective(self, entity: Criteria, objective: Objective) -> Criteria:
-        return self.db.execute_query(self._create_contribution_match_with_objective_query, entity, objective)
+        return self.db.execute_write(self._create_contribution_match_with_objective_query, entity, objective)
 
     def update(self, entity: Criteria) -> Tuple[bool, Optional[Criteria]]:
-        criteria: Record = self.db.execute_query(self.update_query, entity)
+        criteria: Record = self.db.execute_write(self.update_query, entity)
         if criteria:
             return (True, criteria.data()["criteria"])
         else:
             return (False, None)
 
     def get_by_id(self, id: str) -> Optional[Criteria]:
-        criteria: Record = self.db.execute_query(self._get_query, id)
+        criteria: Record = self.db.execute_read(self._get_query, id)
         if criteria:
             return criteria.data()
         else:
             return None
 
+    def get_by_hashes(self, hashes: list[str]) -> list[dict]:
+        return self.db.execute_read(self.get_by_hashes_query, hashes)
+
     def get_all(self) -> list[Criteria]:
-        return self.db.execute_query(self._get_all_query)
+        return self.db.execute_read(self._get_all_query)
 
     def delete_by_id(self, id: str) -> bool:
-        return self.db.execute_query(self._delete_query, id)
+        return self.db.execute_write(self._delete_query, id)
 
     def delete_relationship_with_objective(self, entity: Criteria, objective: Objective) -> bool:
-        return self.db.execute_query(self._delete_relationship_with_objective_query, entity, objective)
+        return self.db.execute_write(self._delete_relationship_with_objective_query, entity, objective)
+
+
+class AsyncCriteriaRepository(NamedTuple):
+    # getCriteria and the criteria loader under asgi.py
+    db: AsyncDatabaseFactory
+
+    async def get_by_hashes(self, hashes: list[str]) -> list[dict]:
+        return await self.db.execute_read(data, GET_BY_HASHES, {"hashes": hashes})
@@ -1,9 +1,17 @@
 from typing import NamedTuple, Optional, Tuple
-from dao.database_factory import DatabaseFactory
+from dao.database_factory import DatabaseFactory, AsyncDatabaseFactory, data
+from dao.batch import BATCH_SIZE, batched
+from dao.fingerprint import fingerprinted
 from neo4j import ManagedTransaction, Record
 from entity.Criteria import Criteria
 from entity.Objective import Objective
 
+# shared by ObjectiveRepository and AsyncObjectiveRepository
+GET_BY_KEYS = ("UNWIND $keys AS key "
+               "MATCH (objective:Objective) WHERE objective.key = key "
+               "RETURN id(objective) as id, objective.name as name, "
+               "objective.long_name as long_name, objective.key as key")
+
 
 class ObjectiveRepository(NamedTuple):
     db: DatabaseFactory
@@ -18,10 +26,31 @@ class ObjectiveRepository(NamedTuple):
         return result.single()
 
     @staticmethod
-    def bulk_create_query(tx: ManagedTransaction, entitis: list[Objective]):
-        for entity in entitis:
-            tx.run(
-                "MERGE (:Objective{name:$name,long_name:$long_name, key:$key})", vars(entity))
+    def params(entity: Objective) -> dict:
+        return fingerprinted({"name": entity.name, "long_name": entity.long_name, "key": entity.key})
+
+    @staticmethod
+    def bulk_create_query(tx: ManagedTransaction, entitis: list[Objective], batch_size: int = BATCH_SIZE):
+        rows = (ObjectiveRepository.params(entity) for entity in entitis)
+        for batch in batched(rows, batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MERGE (objective:Objective{key:row.key}) "
+                   "SET objective.name = row.name, objective.long_name = row.long_name, "
+                   "objective.content_hash = row.content_hash",
+                   rows=batch)
+
+    @staticmethod
+    def fingerprints_query(tx: ManagedTransaction):
+        result = tx.run("MATCH (objective:Objective) "
+                        "RETURN objective.key as key, objective.content_hash as content_hash")
+        return result.data()
+
+    @staticmethod
+    def bulk_delete_query(tx: ManagedTransaction, rows: list[dict], batch_size: int = BATCH_SIZE):
+        for batch in batched(rows, batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MATCH (objective:Objective) WHERE objective.key = row.key "
+                   "DETACH DELETE objective", rows=batch)
 
     @staticmethod
     def _update_query(tx: ManagedTransaction, entity: Objective) -> Optional[Objective]:
@@ -46,6 +75,11 @@ class ObjectiveRepository(NamedTuple):
                         "RETURN objective")
         return result.data()
 
+    @staticmethod
+    def _get_by_keys_query(tx: ManagedTransaction, keys: list[str]):
+        result = tx.run(GET_BY_KEYS, keys=keys)
+        return result.data()
+
     @staticmethod
     def create_dnsh_objective_query(tx: ManagedTransaction, objective: str, dnsh_objective: str):
         tx.run("MATCH (objective:Objective) "
@@ -73,6 +107,87 @@ class ObjectiveRepository(NamedTuple):
                "MERGE (objective)-[rel:DNSH_MATCHES]->(criteria)",
                objective_key=objective, criteria_description=criteria)
 
+    @staticmethod
+    def bulk_create_dnsh_objective_query(tx: ManagedTransaction, rows: list[dict], batch_size: int = BATCH_SIZE):
+        for batch in batched(map(fingerprinted, rows), batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MATCH (objective:Objective) "
+                   "WHERE objective.key = row.objective_key "
+                   "MATCH (dnsh_objective:Objective) "
+                   "WHERE dnsh_objective.key = row.dnsh_objective_key "
+                   "MERGE (objective)-[rel:DNSH]->(dnsh_objective) "
+                   "SET rel.content_hash = row.content_hash",
+                   rows=batch)
+
+    @staticmethod
+    def dnsh_objective_fingerprints_query(tx: ManagedTransaction):
+        result = tx.run("MATCH (objective:Objective)-[rel:DNSH]->(dnsh_objective:Objective) "
+                        "RETURN objective.key as objective_key, dnsh_objective.key as dnsh_objective_key, "
+                        "rel.content_hash as content_hash")
+        return result.data()
+
+    @staticmethod
+    def bulk_delete_dnsh_objective_query(tx: ManagedTransaction, rows: list[dict], batch_size: int = BATCH_SIZE):
+        for batch in batched(rows, batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MATCH (objective:Objective)-[rel:DNSH]->(dnsh_objective:Objective) "
+                   "WHERE objective.key = row.objective_key AND dnsh_objective.key = row.dnsh_objective_key "
+                   "DELETE rel", rows=batch)
+
+    @staticmethod
+    def bulk_create_sc_criteria_query(tx: ManagedTransaction, rows: list[dict], batch_size: int = BATCH_SIZE):
+        for batch in batched(map(fingerprinted, rows), batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MATCH (objective:Objective) "
+                   "WHERE objective.key = row.objective_key "
+                   "MATCH (criteria:Criteria) "
+                   "WHERE criteria.hash = row.criteria_hash "
+                   "MERGE (objective)-[rel:SC_CRITERIA]->(criteria) "
+                   "SET rel.content_hash = row.content_hash",
+                   rows=batch)
+
+    @staticmethod
+    def sc_criteria_fingerprints_query(tx: ManagedTransaction):
+        result = tx.run("MATCH (objective:Objective)-[rel:SC_CRITERIA]->(criteria:Criteria) "
+                        "RETURN objective.key as objective_key, criteria.hash as criteria_hash, "
+                        "rel.content_hash as content_hash")
+        return result.data()
+
+    @staticmethod
+    def bulk_delete_sc_criteria_query(tx: ManagedTransaction, rows: list[dict], batch_size: int = BATCH_SIZE):
+        for batch in batched(rows, batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MATCH (objective:Objective)-[rel:SC_CRITERIA]->(criteria:Criteria) "
+                   "WHERE objective.key = row.objective_key AND criteria.hash = row.criteria_hash "
+                   "DELETE rel", rows=batch)
+
+    @staticmethod
+    def bulk_create_dnsh_match_with_criteria_query(tx: ManagedTransaction, rows: list[dict], batch_size: int = BATCH_SIZE):
+        for batch in batched(map(fingerprinted, rows), batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MATCH (objective:Objective) "
+                   "WHERE objective.key = row.objective_key "
+                   "MATCH (criteria:Criteria) "
+                   "WHERE criteria.hash = row.criteria_hash "
+                   "MERGE (objective)-[rel:DNSH_MATCHES]->(criteria) "
+                   "SET rel.content_hash = row.content_hash",
+                   rows=batch)
+
+    @staticmethod
+    def dnsh_match_with_criteria_fingerprints_query(tx: ManagedTransaction):
+        result = tx.run("MATCH (objective:Objective)-[rel:DNSH_MATCHES]->(criteria:Criteria) "
+                        "RETURN objective.key as objective_key, criteria.hash as criteria_hash, "
+                        "rel.content_hash as content_hash")
+        return result.data()
+
+    @staticmethod
+    def bulk_delete_dnsh_match_with_criteria_query(tx: ManagedTransaction, rows: list[dict], batch_size: int = BATCH_SIZE):
+        for batch in batched(rows, batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MATCH (objective:Objective)-[rel:DNSH_MATCHES]->(criteria:Criteria) "
+                   "WHERE objective.key = row.objective_key AND criteria.hash = row.criteria_hash "
+                   "DELETE rel", rows=batch)
+
     @staticmethod
     def _delete_query(tx: ManagedTransaction, id: str) -> bool:
         result = tx.run("MATCH (objective:Objective) "
@@ -93,30 +208,41 @@ class ObjectiveRepository(NamedTuple):
         return result
 
     def create(self, entity: Objective):
-        return self.db.execute_query(self._create_query, entity)
+        return self.db.execute_write(self._create_query, entity)
 
     def bulk_create(self, entities: list[Objective]):
-        return self.db.execute_query(self.bulk_create_query, entities)
+        return self.db.execute_write(self.bulk_create_query, entities)
 
     def update(self, entity: Objective) -> Tuple[bool, Optional[Objective]]:
-        objective: Record = self.db.execute_query(self._update_query, entity)
+        objective: Record = self.db.execute_write(self._update_query, entity)
         if objective:
             return (True, objective.data()["objective"])
         else:
             return (False, None)
 
     def get_by_id(self, id: str) -> Optional[Objective]:
-        objective: Record = self.db.execute_query(self._get_query, id)
+        objective: Record = self.db.execute_read(self._get_query, id)
         if objective:
             return objective.data()
         else:
             return None
 
+    def get_by_keys(self, keys: list[str]) -> list[dict]:
+        return self.db.execute_read(self._get_by_keys_query, keys)
+
     def get_all(self) -> list[Objective]:
-        return self.db.execute_query(self._get_all_query)
+        return self.db.execute_read(self._get_all_query)
 
     def delete_by_id(self, id: str) -> bool:
-        return self.db.execute_query(self._delete_query, id)
+        return self.db.execute_write(self._delete_query, id)
 
     def delete_relationship_with_objective(self, entity: Objective, objective: Objective) -> bool:
-        return self.db.execute_query(self._delete_relationship_with_criteria_query, entity, objective)
+        return self.db.execute_write(self._delete_relationship_with_criteria_query, entity, objective)
+
+
+class AsyncObjectiveRepository(NamedTuple):
+    # objective loader read for asgi.py
+    db: AsyncDatabaseFactory
+
+    async def get_by_keys(self, keys: list[str]) -> list[dict]:
+        return await self.db.execute_read(data, GET_BY_KEYS, {"keys": keys})
@@ -1,9 +1,18 @@
 from typing import NamedTuple, Optional, Tuple
-from dao.database_factory import DatabaseFactory
+from dao.database_factory import DatabaseFactory, AsyncDatabaseFactory, data
+from dao.batch import BATCH_SIZE, batched
+from dao.fingerprint import fingerprinted
 from neo4j import ManagedTransaction, Record
 from entity.Sector import Sector
 from entity.Activity import Activity
 
+# shared by SectorRepository and AsyncSectorRepository
+GET_BY_ACTIVITY_NAMES = ("UNWIND $names AS name "
+                         "MATCH (sector:Sector)-[:MATCHES]->(activity:Activity) "
+                         "WHERE activity.name = name "
+                         "RETURN name as activity_name, id(sector) as id, sector.name as name, "
+                         "sector.reference as reference")
+
 
 class SectorRepository(NamedTuple):
     db: DatabaseFactory
@@ -17,9 +26,29 @@ class SectorRepository(NamedTuple):
         return result.single()
 
     @staticmethod
-    def bulk_create_query(tx: ManagedTransaction, entitis: list[Sector]):
-        for entity in entitis:
-            tx.run("MERGE (:Sector{name:$name})", vars(entity))
+    def params(entity: Sector) -> dict:
+        return fingerprinted({"name": entity.name})
+
+    @staticmethod
+    def bulk_create_query(tx: ManagedTransaction, entitis: list[Sector], batch_size: int = BATCH_SIZE):
+        rows = (SectorRepository.params(entity) for entity in entitis)
+        for batch in batched(rows, batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MERGE (sector:Sector{name:row.name}) "
+                   "SET sector.content_hash = row.content_hash", rows=batch)
+
+    @staticmethod
+    def fingerprints_query(tx: ManagedTransaction):
+        result = tx.run("MATCH (sector:Sector) "
+                        "RETURN sector.name as name, sector.content_hash as content_hash")
+        return result.data()
+
+    @staticmethod
+    def bulk_delete_query(tx: ManagedTransaction, rows: list[dict], batch_size: int = BATCH_SIZE):
+        for batch in batched(rows, batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MATCH (sector:Sector) WHERE sector.name = row.name "
+                   "DETACH DELETE sector", rows=batch)
 
     @staticmethod
     def update_query(tx: ManagedTransaction, entity: Sector) -> Optional[Sector]:
@@ -44,6 +73,11 @@ class SectorRepository(NamedTuple):
                         "RETURN sector")
         return result.data()
 
+    @staticmethod
+    def get_by_activity_names_query(tx: ManagedTransaction, names: list[str]):
+        result = tx.run(GET_BY_ACTIVITY_NAMES, names=names)
+        return result.data()
+
     @staticmethod
     def create_match_with_activity_query(tx: ManagedTransaction, activity: dict):
         tx.run("MATCH (sector:Sector) "
@@ -53,6 +87,33 @@ class SectorRepository(NamedTuple):
                "MERGE (sector)-[rel:MATCHES]->(activity)",
                sector_name=activity["sector"], activity_name=activity["name"])
 
+    @staticmethod
+    def bulk_create_match_with_activity_query(tx: ManagedTransaction, rows: list[dict], batch_size: int = BATCH_SIZE):
+        for batch in batched(map(fingerprinted, rows), batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MATCH (sector:Sector) "
+                   "WHERE sector.name = row.sector_name "
+                   "MATCH (activity:Activity) "
+                   "WHERE activity.name = row.activity_name "
+                   "MERGE (sector)-[rel:MATCHES]->(activity) "
+                   "SET rel.content_hash = row.content_hash",
+                   rows=batch)
+
+    @staticmethod
+    def match_with_activity_fingerprints_query(tx: ManagedTransaction):
+        result = tx.run("MATCH (sector:Sector)-[rel:MATCHES]->(activity:Activity) "
+                        "RETURN sector.name as sector_name, activity.name as activity_name, "
+                        "rel.content_hash as content_hash")
+        return result.data()
+
+    @staticmethod
+    def bulk_delete_match_with_activity_query(tx: ManagedTransaction, rows: list[dict], batch_size: int = BATCH_SIZE):
+        for batch in batched(rows, batch_size):
+            tx.run("UNWIND $rows AS row "
+                   "MATCH (sector:Sector)-[rel:MATCHES]->(activity:Activity) "
+                   "WHERE sector.name = row.sector_name AND activity.name = row.activity_name "
+                   "DELETE rel", rows=batch)
+
     @staticmethod
     def delete_query(tx: ManagedTransaction, id: str) -> bool:
         result = tx.run("MATCH (sector:Sector) "
@@ -73,33 +134,44 @@ class SectorRepository(NamedTuple):
         return result
 
     def create(self, entity: Sector):
-        return self.db.execute_query(self.create_query, entity)
+        return self.db.execute_write(self.create_query, entity)
 
     def bulk_create(self, entities: list[Sector]):
-        return self.db.execute_query(self.bulk_create_query, entities)
+        return self.db.execute_write(self.bulk_create_query, entities)
 
     def create_match_with_activity(self, entity: Sector, activity: Activity) -> Sector:
-        return self.db.execute_query(self.create_match_with_activity_query, entity, activity)
+        return self.db.execute_write(self.create_match_with_activity_query, entity, activity)
 
     def update(self, entity: Sector) -> Tuple[bool, Optional[Sector]]:
-        sector: Record = self.db.execute_query(self.update_query, entity)
+        sector: Record = self.db.execute_write(self.update_query, entity)
         if sector:
             return (True, sector.data()["sector"])
         else:
             return (False, None)
 
     def get_by_id(self, id: str) -> Optional[Sector]:
-        sector: Record = self.db.execute_query(self.get_query, id)
+        sector: Record = self.db.execute_read(self.get_query, id)
         if sector:
             return sector.data()
         else:
             return None
 
+    def get_by_activity_names(self, names: list[str]) -> list[dict]:
+        return self.db.execute_read(self.get_by_activity_names_query, names)
+
     def get_all(self) -> list[Sector]:
-        return self.db.execute_query(self.get_all_query)
+        return self.db.execute_read(self.get_all_query)
 
     def delete_by_id(self, id: str) -> bool:
-        return self.db.execute_query(self.delete_query, id)
+        return self.db.execute_write(self.delete_query, id)
 
     def delete_relationship_with_activity(self, entity: Sector, activity: Activity) -> bool:
-        return self.db.execute_query(self.delete_relationship_with_activity_query, entity, activity)
+        return self.db.execute_write(self.delete_relationship_with_activity_query, entity, activity)
+
+
+class AsyncSectorRepository(NamedTuple):
+    # sector loader read for asgi.py
+    db: AsyncDatabaseFactory
+
+    async def get_by_activity_names(self, names: list[str]) -> list[dict]:
+        return await self.db.execute_read(data, GET_BY_ACTIVITY_NAMES, {"names": names})
@@ -0,0 +1,40 @@
+from typing import NamedTuple
+from dao.database_factory import DatabaseFactory
+from neo4j import ManagedTransaction
+
+
+class SnapshotRepository(NamedTuple):
+    # whole-graph reads backing service.read_model
+    db: DatabaseFactory
+
+    @staticmethod
+    def _load_query(tx: ManagedTransaction, params) -> dict:
+        return {
+            "sectors": tx.run("MATCH (sector:Sector) "
+                              "RETURN id(sector) as id, properties(sector) as properties", params).data(),
+            "objectives": tx.run("MATCH (objective:Objective) "
+                                 "RETURN id(objective) as id, properties(objective) as properties", params).data(),
+            "activities": tx.run("MATCH (activity:Activity) "
+                                 "OPTIONAL MATCH (sector:Sector)-[:MATCHES]->(activity) "
+                                 "RETURN id(activity) as id, properties(activity) as properties, "
+                                 "sector.name as sector", params).data(),
+            "matches": tx.run("MATCH (activity:Activity)-[rel:MATCHES]->(objective:Objective) "
+                              "RETURN activity.name as activity, objective.key as objective, "
+                              "rel.contribution_type as contribution_type, rel.description as description, "
+                              "rel.dnsh_summary as dnsh_summary, rel.sc_criteria_hashes as sc_criteria_hashes",
+                              params).data(),
+            "dnsh": tx.run("MATCH (objective:Objective)-[:DNSH]->(dnsh_objective:Objective) "
+                           "RETURN objective.key as objective, dnsh_objective.key as dnsh_objective",
+                           params).data(),
+            "dnsh_criteria": tx.run("MATCH (objective:Objective)-[:DNSH_MATCHES]->(criteria:Criteria) "
+                                    "RETURN objective.key as objective, criteria.hash as hash", params).data(),
+            "sc_criteria": tx.run("MATCH (objective:Objective)-[:SC_CRITERIA]->(criteria:Criteria) "
+                                  "RETURN objective.key as objective, criteria.hash as hash", params).data(),
+            "criteria": tx.run("MATCH (criteria:Criteria) "
+                               "RETURN criteria.hash as hash, criteria.description as description",
+                               params).data(),
+        }
+
+    def load(self) -> dict:
+        # a single read transaction, so the snapshot is consistent
+        return self.db.execute_read(self._load_query, {})
@@ -1,82 +1,145 @@
-from dao.database_factory import db
-from repository.activity import ActivityRepository
+from typing import Optional
+from ariadne import convert_camel_case_to_snake
+from resolver.loaders import nace_code
+from resolver.pagination import connection, decode_cursor, page_limit
+from resolver.payload import respond
+from resolver.projection import node_fields, selected_fields
+from service.read_model import read_model
 
 
-def get_activity_resolver(obj, info, id: str):
-    try:
-        activity = ActivityRepository(db).get_by_id(id)
-        payload = {
-            "success": True,
-            "activity": activity
-        }
-    except Exception as error:
-        payload = {
-            "success": False,
-            "errors": [str(error)]
-        }
-    return payload
+def get_activity_resolver(obj, info, name: str):
+    def fetch():
+        snapshot = read_model.snapshot
+        if snapshot:
+            return snapshot.get_activity(name)
+        return info.context["repositories"].activity.get_by_name(
+            name, selected_fields(info).get("activity", {}))
+    return respond(info, fetch, lambda activity: {
+        "success": True,
+        "activity": activity
+    })
 
 
 def get_activity_main_objectives_by_id_resolver(obj, info, id: str):
-    try:
-        activity = ActivityRepository(db).get_main_objectives_by_id(id)
-        print(activity)
-        payload = {
-            "success": True,
-            "activityMainObjectives": activity
-        }
-    except Exception as error:
-        payload = {
-            "success": False,
-            "errors": [str(error)]
-        }
-    return payload
-
-
-def get_activity_main_objectives_all_resolver(obj, info):
-    try:
-        activity = ActivityRepository(db).get_main_objectives_all()
-        print(activity)
-        payload = {
-            "success": True,
-            "activityMainObjectives": activity
-        }
-    except Exception as error:
-        payload = {
-            "success": False,
-            "errors": [str(error)]
-        }
-    return payload
+    def fetch():
+        snapshot = read_model.snapshot
+        if snapshot:
+            return snapshot.get_main_objectives_by_id(id)
+        return info.context["repositories"].activity.get_main_objectives_by_id(
+            id, node_fields(selected_fields(info), "activity_main_objectives"))
+    return respond(info, fetch, lambda activity: {
+        "success": True,
+        "activity_main_objectives": activity
+    })
+
+
+def get_activity_main_objectives_all_resolver(obj, info, first: Optional[int] = None, after: Optional[str] = None):
+    snapshot = read_model.snapshot
+    repository = info.context["repositories"].activity
+    total_count = (lambda: len(snapshot.main_objectives)) if snapshot else repository.count_main_objectives
+
+    def fetch():
+        cursor, limit = decode_cursor(after), page_limit(first)
+        if snapshot:
+            return snapshot.get_main_objectives_all(cursor, limit)
+        return repository.get_main_objectives_all(
+            cursor, limit, node_fields(selected_fields(info), "activity_main_objectives"))
+    return respond(info, fetch, lambda activity: connection(
+        activity, first, lambda row: (row["activity"]["name"], row["objective"]["key"]),
+        total_count, "activity_main_objectives"))
 
 
 def get_activity_main_objectives_by_name_resolver(obj, info, name: str):
-    try:
-        print(name)
-        activity = ActivityRepository(db).get_main_objectives_by_name(name)
-        print(activity)
-        payload = {
-            "success": True,
-            "activityMainObjectives": activity
-        }
-    except Exception as error:
-        payload = {
-            "success": False,
-            "errors": [str(error)]
-        }
-    return payload
-
-
-def list_activities_resolver(obj, info):
-    try:
-        activities = ActivityRepository(db).get_all()
-        print(activities)
-        payload = {
-            "success": True,
-            "activities": activities
-        }
-    except Exception as error:
-        payload = {
-            "success": False,
-            "errors": [str(error)]
-        }
-    return payload
+    def fetch():
+        snapshot = read_model.snapshot
+        if snapshot:
+            return snapshot.get_main_objectives_by_name(name)
+        return info.context["repositories"].activity.get_main_objectives_by_name(
+            name, node_fields(selected_fields(info), "activity_main_objectives"))
+    return respond(info, fetch, lambda activity: {
+        "success": True,
+        "activity_main_objectives": activity
+    })
+
+
+def list_activities_resolver(obj, info, first: Optional[int] = None, after: Optional[str] = None):
+    snapshot = read_model.snapshot
+    repository = info.context["repositories"].activity
+    total_count = (lambda: len(snapshot.activities)) if snapshot else repository.count
+
+    def fetch():
+        cursor, limit = decode_cursor(after), page_limit(first)
+        if snapshot:
+            return snapshot.get_activities(cursor[0] if cursor else None, limit)
+        return repository.get_all(cursor[0] if cursor else None, limit,
+                                  node_fields(selected_fields(info), "activities"))
+    return respond(info, fetch, lambda activities: connection(
+        activities, first, lambda activity: (activity["name"],), total_count, "activities"))
+
+
+def activities_field_resolver(obj, info):
+    activities = obj.get("activities")
+    if activities:
+        info.context["loaders"].prime_activities(activities)
+    # edges wrap the same rows
+    return obj.get(convert_camel_case_to_snake(info.field_name))
+
+
+def activity_field_resolver(obj, info):
+    activity = obj.get("activity")
+    if activity:
+        info.context["loaders"].prime_activities([activity])
+    return activity
+
+
+def activity_main_objectives_field_resolver(obj, info):
+    rows = obj.get("activity_main_objectives")
+    if rows:
+        loaders = info.context["loaders"]
+        loaders.prime_activities(row["activity"] for row in rows)
+        loaders.objectives.prime(dnsh.get("objective") for row in rows for dnsh in row.get("dnsh") or ()
+                                 if isinstance(dnsh.get("objective"), str))
+        # criteria text is only looked up when it is selected
+        fields = selected_fields(info)
+        if info.field_name == "edges":
+            fields = fields.get("node", {})
+        if "substantial_contribution_criteria" in fields:
+            loaders.criteria.prime(hash for row in rows if row.get("substantial_contribution_criteria") is None
+                                   for hash in row.get("substantial_contribution_criteria_hashes") or ())
+        if "criteria" in fields.get("dnsh", {}):
+            loaders.criteria.prime(hash for row in rows for dnsh in row.get("dnsh") or ()
+                                   if dnsh.get("criteria") is None for hash in dnsh.get("criteria_hashes") or ())
+    return obj.get(convert_camel_case_to_snake(info.field_name))
+
+
+def activity_sector_resolver(obj, info):
+    # snapshot rows carry their sector already
+    if "sector" in obj:
+        return obj["sector"]
+    return info.context["loaders"].sectors.load(obj["name"])
+
+
+def activity_nace_resolver(obj, info):
+    if "nace_codes" in obj:
+        return nace_code(obj)
+    return info.context["loaders"].nace_codes.load(obj["name"])
+
+
+def objective_reference_resolver(obj, info):
+    # objectives referenced by key are looked up through the loader
+    objective = obj.get(info.field_name)
+    if isinstance(objective, str):
+        return info.context["loaders"].objectives.load(objective)
+    return objective
+
+
+def criteria_text_resolver(obj, info):
+    # rows read from Neo4j carry criteria by hash, their text comes from the
+    # criteria loader; snapshot rows and pre-summary rows carry the text
+    name = convert_camel_case_to_snake(info.field_name)
+    if obj.get(name) is not None:
+        return obj[name]
+    hashes = obj.get(f"{name}_hashes")
+    if hashes is None:
+        return None
+    return info.context["loaders"].criteria.load_many(hashes)
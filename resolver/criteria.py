@@ -0,0 +1,14 @@
+from resolver.payload import respond
+from service.read_model import read_model
+
+
+def get_criteria_resolver(obj, info, hashes: list[str]):
+    def fetch():
+        snapshot = read_model.snapshot
+        if snapshot:
+            return snapshot.get_criteria(hashes)
+        return info.context["repositories"].criteria.get_by_hashes(hashes)
+    return respond(info, fetch, lambda criteria: {
+        "success": True,
+        "criteria": criteria
+    })
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+from typing import Any, Callable, Hashable, Iterable, NamedTuple
+from dao.database_factory import AsyncDatabaseFactory
+from repository.activity import ActivityRepository, AsyncActivityRepository
+from repository.criteria import CriteriaRepository, AsyncCriteriaRepository
+from repository.objective import ObjectiveRepository, AsyncObjectiveRepository
+from repository.sector import SectorRepository, AsyncSectorRepository
+from resolver.payload import then
+
+
+class Loader:
+    # Per-request batching cache. List fields prime() the keys their items
+    # will ask for; the first load() then fetches every pending key with a
+    # single query, and later loads for any of them are served from memory.
+
+    def __init__(self, batch: Callable[[list], dict]):
+        self.batch = batch
+        self.cache: dict[Hashable, Any] = {}
+        self.pending: dict[Hashable, None] = {}
+        self.lock = threading.Lock()
+
+    def prime(self, keys: Iterable[Hashable]):
+        with self.lock:
+            for key in keys:
+                if key is not None and key not in self.cache:
+                    self.pending[key] = None
+
+    def load(self, key: Hashable) -> Any:
+        return self.load_many([key])[0]
+
+    def load_many(self, keys: list[Hashable]) -> list:
+        with self.lock:
+            for key in keys:
+                if key not in self.cache:
+                    self.pending[key] = None
+            if self.pending:
+                missing = list(self.pending)
+                self.pending.clear()
+                values = self.batch(missing)
+                for key in missing:
+                    self.cache[key] = values.get(key)
+            return [self.cache.get(key) for key in keys]
+
+
+class AsyncLoader:
+    # Loader for the async server. load() returns a future; the pending
+    # keys are fetched together once the event loop gets round to it, so
+    # sibling resolvers started in the same tick share one query.
+
+    def __init__(self, batch: Callable[[list], Any]):
+        self.batch = batch
+        self.cache: dict[Hashable, asyncio.Future] = {}
+        self.pending: list[Hashable] = []
+        self.scheduled = False
+
+    def prime(self, keys: Iterable[Hashable]):
+        for key in keys:
+            if key is not None and key not in self.cache:
+                self.cache[key] = asyncio.get_running_loop().create_future()
+                self.pending.append(key)
+
+    def load(self, key: Hashable) -> asyncio.Future:
+        self.prime([key])
+        if self.pending and not self.scheduled:
+            self.scheduled = True
+            asyncio.get_running_loop().call_soon(self.dispatch)
+        return self.cache[key]
+
+    def load_many(self, keys: list[Hashable]):
+        return asyncio.gather(*(self.load(key) for key in keys))
+
+    def dispatch(self):
+        keys, self.pending, self.scheduled = self.pending, [], False
+        asyncio.ensure_future(self.fetch(keys))
+
+    async def fetch(self, keys: list[Hashable]):
+        try:
+            values = await self.batch(keys)
+        except Exception as error:
+            for key in keys:
+                self.cache[key].set_exception(error)
+            return
+        for key in keys:
+            self.cache[key].set_result(values.get(key))
+
+
+def nace_code(row: dict):
+    codes = row["nace_codes"] or []
+    if not codes:
+        return None
+    return {"id": ",".join(codes), "nace": ", ".join(codes)}
+
+
+class Repositories(NamedTuple):
+    # the repositories resolvers read through; async ones under asgi.py
+    activity: Any
+    sector: Any
+    objective: Any
+    criteria: Any
+    asynchronous: bool
+
+    @staticmethod
+    def of(db) -> "Repositories":
+        if isinstance(db, AsyncDatabaseFactory):
+            return Repositories(AsyncActivityRepository(db), AsyncSectorRepository(db),
+                                AsyncObjectiveRepository(db), AsyncCriteriaRepository(db), True)
+        return Repositories(ActivityRepository(db), SectorRepository(db),
+                            ObjectiveRepository(db), CriteriaRepository(db), False)
+
+
+class Loaders:
+    def __init__(self, repositories: Repositories):
+        loader = AsyncLoader if repositories.asynchronous else Loader
+        self.activities = loader(lambda names: then(
+            repositories.activity.get_by_names(names),
+            lambda rows: {row["name"]: row for row in rows}))
+        self.sectors = loader(lambda names: then(
+            repositories.sector.get_by_activity_names(names),
+            lambda rows: {row.pop("activity_name"): row for row in rows}))
+        self.objectives = loader(lambda keys: then(
+            repositories.objective.get_by_keys(keys),
+            lambda rows: {row["key"]: row for row in rows}))
+        self.nace_codes = loader(lambda names: then(
+            repositories.activity.get_nace_codes_by_names(names),
+            lambda rows: {row["name"]: nace_code(row) for row in rows}))
+        self.criteria = loader(lambda hashes: then(
+            repositories.criteria.get_by_hashes(hashes),
+            lambda rows: {row["hash"]: row["description"] for row in rows}))
+
+    def prime_activities(self, activities: Iterable[dict]):
+        # rows fetched with their sector or nace codes need no lookup
+        activities = [activity for activity in activities if activity]
+        self.sectors.prime(activity["name"] for activity in activities if "sector" not in activity)
+        self.nace_codes.prime(activity["name"] for activity in activities if "nace_codes" not in activity)
+
+
+def context(request, db) -> dict:
+    # GraphQL context for one request
+    repositories = Repositories.of(db)
+    return {"request": request, "repositories": repositories, "loaders": Loaders(repositories)}
@@ -0,0 +1,50 @@
+import base64
+import json
+from typing import Callable, Optional
+from graphql import GraphQLError
+
+
+def encode_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[tuple]:
+    if cursor is None:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        key = None
+    if not isinstance(key, list):
+        raise GraphQLError(f"invalid cursor {cursor!r}")
+    return tuple(key)
+
+
+def page_limit(first: Optional[int]) -> Optional[int]:
+    # one extra row is fetched to tell whether another page follows
+    if first is None:
+        return None
+    if first < 0:
+        raise GraphQLError("first must not be negative")
+    return first + 1
+
+
+def connection(rows: list, first: Optional[int], key: Callable[[dict], tuple],
+               total_count: Callable[[], int], nodes_field: str) -> dict:
+    # Relay-style page: the plain node list under nodes_field keeps
+    # existing clients working, edges/page_info/total_count are new;
+    # total_count is a callable so the count only runs when selected
+    has_next_page = first is not None and len(rows) > first
+    if has_next_page:
+        rows = rows[:first]
+    edges = [{"cursor": encode_cursor(key(row)), "node": row} for row in rows]
+    return {
+        "success": True,
+        nodes_field: rows,
+        "edges": edges,
+        "page_info": {
+            "has_next_page": has_next_page,
+            "end_cursor": edges[-1]["cursor"] if edges else None,
+        },
+        "total_count": lambda info: total_count(),
+    }
@@ -0,0 +1,40 @@
+import inspect
+from typing import Any, Callable
+
+
+def then(value, fn: Callable[[Any], Any]):
+    # fn(value), or a coroutine applying fn once value resolves; lets one
+    # resolver serve both graphql_sync and the async server in asgi.py
+    if inspect.isawaitable(value):
+        async def resolve():
+            return fn(await value)
+        return resolve()
+    return fn(value)
+
+
+def failure(info, error: Exception) -> dict:
+    # recorded on the context so the response is not cached
+    info.context.setdefault("failures", []).append(str(error))
+    return {
+        "success": False,
+        "errors": [str(error)]
+    }
+
+
+def respond(info, fetch: Callable[[], Any], build: Callable[[Any], dict]):
+    # build(fetch()) with any error turned into an unsuccessful payload
+    try:
+        value = fetch()
+    except Exception as error:
+        return failure(info, error)
+    if inspect.isawaitable(value):
+        async def resolve():
+            try:
+                return build(await value)
+            except Exception as error:
+                return failure(info, error)
+        return resolve()
+    try:
+        return build(value)
+    except Exception as error:
+        return failure(info, error)
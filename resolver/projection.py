@@ -0,0 +1,41 @@
+from ariadne import convert_camel_case_to_snake
+from graphql import FieldNode, FragmentSpreadNode, GraphQLResolveInfo, InlineFragmentNode, SelectionSetNode
+
+
+def selected_fields(info: GraphQLResolveInfo) -> dict:
+    # the selection below the field being resolved as nested dicts of
+    # snake_case names, fragments merged in; @skip/@include are ignored,
+    # so at worst a field is fetched that is not returned
+    fields = {}
+    for node in info.field_nodes:
+        if node.selection_set:
+            _collect(info, node.selection_set, fields)
+    return fields
+
+
+def _collect(info: GraphQLResolveInfo, selection_set: SelectionSetNode, fields: dict):
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            name = selection.name.value
+            if name.startswith("__"):
+                continue
+            subfields = fields.setdefault(convert_camel_case_to_snake(name), {})
+            if selection.selection_set:
+                _collect(info, selection.selection_set, subfields)
+        elif isinstance(selection, InlineFragmentNode):
+            _collect(info, selection.selection_set, fields)
+        elif isinstance(selection, FragmentSpreadNode):
+            _collect(info, info.fragments[selection.name.value].selection_set, fields)
+
+
+def merged(*trees: dict) -> dict:
+    fields = {}
+    for tree in trees:
+        for name, subfields in tree.items():
+            fields[name] = merged(fields.get(name, {}), subfields)
+    return fields
+
+
+def node_fields(fields: dict, nodes_field: str) -> dict:
+    # what a connection's rows need: the plain node list and edges.node
+    return merged(fields.get(nodes_field, {}), fields.get("edges", {}).get("node", {}))
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from inspect import isawaitable
+from os import getenv
+from typing import Any, NamedTuple, Optional
+from ariadne.extensions import ExtensionManager
+from ariadne.format_error import format_error
+from ariadne.graphql import handle_graphql_errors, handle_query_result, parse_query, validate_data, \
+    validate_query
+from ariadne.types import GraphQLResult
+from graphql import DocumentNode, GraphQLError, GraphQLSchema, execute, execute_sync
+from service.metrics import graphql_operation, operation_label
+from service.query_cost import QueryCost, cost_analysis
+
+GRAPHQL_DOCUMENT_CACHE_SIZE = int(getenv("GRAPHQL_DOCUMENT_CACHE_SIZE") or 500)
+# JSON file with {sha256: query} or a list of queries, registered at startup
+PERSISTED_QUERIES_FILE = getenv("PERSISTED_QUERIES_FILE")
+# only run queries from PERSISTED_QUERIES_FILE
+PERSISTED_QUERIES_ONLY = (getenv("PERSISTED_QUERIES_ONLY") or "false").lower() in ("1", "true", "yes")
+# queries clients register on top of the file, least recently used go first
+PERSISTED_QUERIES_MAX = int(getenv("PERSISTED_QUERIES_MAX") or 1000)
+# operations one /graphql request may carry as a JSON array
+GRAPHQL_BATCH_MAX = int(getenv("GRAPHQL_BATCH_MAX") or 20)
+# operations of a batch executed at the same time
+GRAPHQL_BATCH_CONCURRENCY = int(getenv("GRAPHQL_BATCH_CONCURRENCY") or 4)
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+class PersistedQueries:
+    # Automatic persisted queries, the protocol Apollo clients speak: a
+    # request names its query by extensions.persistedQuery.sha256Hash and
+    # leaves "query" out; only after a PersistedQueryNotFound does the
+    # client send the text along with the hash, which registers it.
+
+    def __init__(self, path: Optional[str] = PERSISTED_QUERIES_FILE,
+                 allowlist_only: bool = PERSISTED_QUERIES_ONLY, max_entries: int = PERSISTED_QUERIES_MAX):
+        self.allowlist_only = allowlist_only
+        self.max_entries = max_entries
+        self.allowlist: dict[str, str] = {}
+        self.registered: OrderedDict[str, str] = OrderedDict()
+        self.lock = threading.Lock()
+        if path:
+            self.load(path)
+
+    def load(self, path: str):
+        with open(path) as file:
+            queries = json.load(file)
+        if isinstance(queries, list):
+            queries = {query_hash(query): query for query in queries}
+        for hash, query in queries.items():
+            if query_hash(query) != hash:
+                raise ValueError(f"{path}: {hash} is not the sha256 of its query")
+        self.allowlist.update(queries)
+
+    def get(self, hash: str) -> Optional[str]:
+        with self.lock:
+            query = self.allowlist.get(hash) or self.registered.get(hash)
+            if hash in self.registered:
+                self.registered.move_to_end(hash)
+            return query
+
+    def register(self, hash: str, query: str):
+        with self.lock:
+            if hash in self.allowlist:
+                return
+            self.registered[hash] = query
+            self.registered.move_to_end(hash)
+            while len(self.registered) > self.max_entries:
+                self.registered.popitem(last=False)
+
+    def resolve(self, data: Any) -> Any:
+        # the request data with "query" filled in from the persisted query
+        if not isinstance(data, dict):
+            return data
+        persisted = (data.get("extensions") or {}).get("persistedQuery")
+        query = data.get("query")
+        if isinstance(persisted, dict):
+            hash = persisted.get("sha256Hash")
+            if query is None:
+                query = self.get(hash)
+                if query is None:
+                    raise GraphQLError("PersistedQueryNotFound",
+                                       extensions={"code": "PERSISTED_QUERY_NOT_FOUND"})
+                data = {**data, "query": query}
+            elif not isinstance(query, str) or query_hash(query) != hash:
+                raise GraphQLError("provided sha256Hash does not match query",
+                                   extensions={"code": "PERSISTED_QUERY_HASH_MISMATCH"})
+            elif not self.allowlist_only:
+                self.register(hash, query)
+        if self.allowlist_only and (not isinstance(query, str) or query_hash(query) not in self.allowlist):
+            raise GraphQLError("query is not on the persisted query allowlist",
+                               extensions={"code": "PERSISTED_QUERY_NOT_ALLOWED"})
+        return data
+
+
+class ParsedDocument(NamedTuple):
+    document: DocumentNode
+    errors: list
+
+
+class DocumentCache:
+    # Parsed and validated documents keyed by the sha256 of the query text.
+    # The schema is fixed for the life of the process, so the validation
+    # result, errors included, holds for as long as the entry does.
+
+    def __init__(self, max_entries: int = GRAPHQL_DOCUMENT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, ParsedDocument] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, schema: GraphQLSchema, query: str) -> ParsedDocument:
+        key = query_hash(query)
+        with self.lock:
+            parsed = self.entries.get(key)
+            if parsed:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return parsed
+            self.misses += 1
+        # syntax errors raise and are not cached
+        document = parse_query(query)
+        parsed = ParsedDocument(document, validate_query(schema, document))
+        with self.lock:
+            self.entries[key] = parsed
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return parsed
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "maxEntries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses}
+
+
+persisted_queries = PersistedQueries()
+documents = DocumentCache()
+
+
+def prepare(schema: GraphQLSchema, data: Any) -> tuple[dict, ParsedDocument]:
+    data = persisted_queries.resolve(data)
+    validate_data(data)
+    return data, documents.get(schema, data["query"])
+
+
+def check_batch(operations: list):
+    if not operations:
+        raise GraphQLError("batch has no operations")
+    if len(operations) > GRAPHQL_BATCH_MAX:
+        raise GraphQLError(f"batch has {len(operations)} operations, the limit is {GRAPHQL_BATCH_MAX}")
+
+
+def batch_context(shared: dict) -> dict:
+    # Each operation of a batch gets its own context on top of the batch's:
+    # loaders are shared, so lookups operations have in common are fetched
+    # once, while a failure only keeps its own operation out of the cache.
+    return {**shared}
+
+
+def with_cost(result: GraphQLResult, cost: QueryCost) -> GraphQLResult:
+    # reported on every response so limits can be tuned against real traffic
+    success, response = result
+    response.setdefault("extensions", {})["cost"] = cost.to_dict()
+    return success, response
+
+
+def graphql_sync(schema: GraphQLSchema, data: Any, *, context_value: Any = None,
+                 debug: bool = False, logger: Optional[str] = None) -> GraphQLResult:
+    # ariadne.graphql_sync with the document taken from the caches above
+    extension_manager = ExtensionManager(None, context_value)
+    with extension_manager.request(), graphql_operation() as timer:
+        try:
+            data, parsed = prepare(schema, data)
+            if parsed.errors:
+                timer.outcome = "rejected"
+                return handle_graphql_errors(parsed.errors, logger=logger, error_formatter=format_error,
+                                             debug=debug, extension_manager=extension_manager)
+            timer.operation = operation_label(parsed.document, data.get("operationName"))
+            cost = cost_analysis.check(schema, parsed.document, data.get("variables"), data.get("operationName"))
+            result = execute_sync(schema, parsed.document, context_value=context_value,
+                                  variable_values=data.get("variables"),
+                                  operation_name=data.get("operationName"),
+                                  middleware=extension_manager.as_middleware_manager(None))
+        except GraphQLError as error:
+            timer.outcome = "rejected"
+            return handle_graphql_errors([error], logger=logger, error_formatter=format_error,
+                                         debug=debug, extension_manager=extension_manager)
+        timer.outcome = "error" if result.errors else "ok"
+        return with_cost(handle_query_result(result, logger=logger, error_formatter=format_error,
+                                             debug=debug, extension_manager=extension_manager), cost)
+
+
+async def graphql(schema: GraphQLSchema, data: Any, *, context_value: Any = None,
+                  debug: bool = False, logger: Optional[str] = None) -> GraphQLResult:
+    # ariadne.graphql, likewise
+    extension_manager = ExtensionManager(None, context_value)
+    with extension_manager.request(), graphql_operation() as timer:
+        try:
+            data, parsed = prepare(schema, data)
+            if parsed.errors:
+                timer.outcome = "rejected"
+                return handle_graphql_errors(parsed.errors, logger=logger, error_formatter=format_error,
+                                             debug=debug, extension_manager=extension_manager)
+            timer.operation = operation_label(parsed.document, data.get("operationName"))
+            cost = cost_analysis.check(schema, parsed.document, data.get("variables"), data.get("operationName"))
+            result = execute(schema, parsed.document, context_value=context_value,
+                             variable_values=data.get("variables"),
+                             operation_name=data.get("operationName"),
+                             middleware=extension_manager.as_middleware_manager(None))
+            if isawaitable(result):
+                result = await result
+        except GraphQLError as error:
+            timer.outcome = "rejected"
+            return handle_graphql_errors([error], logger=logger, error_formatter=format_error,
+                                         debug=debug, extension_manager=extension_manager)
+        timer.outcome = "error" if result.errors else "ok"
+        return with_cost(handle_query_result(result, logger=logger, error_formatter=format_error,
+                                             debug=debug, extension_manager=extension_manager), cost)
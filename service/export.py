@@ -0,0 +1,32 @@
+import json
+import zlib
+from os import getenv
+from typing import Iterable, Iterator
+
+# records are written out once this many bytes are buffered
+EXPORT_CHUNK_BYTES = int(getenv("EXPORT_CHUNK_BYTES") or 64 * 1024)
+
+
+def ndjson(records: Iterable[dict], compress: bool = False,
+           chunk_bytes: int = EXPORT_CHUNK_BYTES) -> Iterator[bytes]:
+    # one JSON document per line; the first chunk goes out as soon as the
+    # first record is read, later ones once chunk_bytes have accumulated
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = []
+    size = 0
+    first = True
+    for record in records:
+        line = json.dumps(record, default=str, separators=(",", ":")).encode() + b"\n"
+        buffer.append(line)
+        size += len(line)
+        if first or size >= chunk_bytes:
+            data = b"".join(buffer)
+            if compressor:
+                data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield data
+            buffer, size, first = [], 0, False
+    data = b"".join(buffer)
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
@@ -0,0 +1,44 @@
+import os
+import tempfile
+import threading
+
+GENERATION_FILE = os.getenv("GENERATION_FILE") or os.path.join(
+    tempfile.gettempdir(), "eu_taxonamy_generation")
+
+
+class Generation:
+    # Counts changes to the taxonomy data. It lives in a file so a bump by
+    # the worker that ran a population is seen by every other worker; a
+    # stat per read tells whether the file has to be read again.
+
+    def __init__(self, path: str = GENERATION_FILE):
+        self.path = path
+        self._stat = None
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def current(self) -> int:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return 0
+        # bump() replaces the file, so the inode changes with every write
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if key != self._stat:
+            with open(self.path) as file:
+                self._value = int(file.read().strip() or 0)
+            self._stat = key
+        return self._value
+
+    def bump(self) -> int:
+        with self._lock:
+            value = self.current() + 1
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as file:
+                file.write(str(value))
+            os.replace(file.name, self.path)
+            return value
+
+
+generation = Generation()
@@ -0,0 +1,425 @@
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from hashlib import blake2b
+import logging
+import os
+from typing import Callable, Iterable, NamedTuple, Optional
+from zlib import crc32
+from dao.batch import BATCH_SIZE
+from dao.fingerprint import fingerprinted
+from dao.database_factory import DatabaseFactory
+from dao.schema import Schema
+from repository.activity import ActivityRepository
+from repository.objective import ObjectiveRepository
+from repository.sector import SectorRepository
+from repository.criteria import CriteriaRepository
+from entity.Sector import Sector
+from entity.Activity import Activity
+from entity.Objective import Objective
+from service.generation import generation
+from service.integration import Integration
+from service.source_cache import source_cache
+from service.taxonomy_stream import iter_taxonomy_file
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS") or 4)
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE") or 5000)
+# distinct rows a streamed import remembers to drop repeats, see RecentKeys
+INGEST_DEDUP_KEYS = int(os.getenv("INGEST_DEDUP_KEYS") or 100000)
+
+
+class IngestionCancelled(Exception):
+    pass
+
+
+class Progress:
+    # no-op hooks, see service.jobs.PopulationJob for the tracked version
+
+    def stage(self, name: str):
+        pass
+
+    def total(self, phase: str, rows: int):
+        pass
+
+    def advance(self, phase: str, rows: int):
+        pass
+
+    def check(self):
+        pass
+
+    def diff(self, summary: dict):
+        pass
+
+    def source(self, summary: dict):
+        pass
+
+
+class Phase(NamedTuple):
+    name: str
+    writer: Callable
+    # identity of the node whose lock the rows contend for
+    lock_key: Callable
+    # parameter row actually written for an item, carrying its content_hash
+    params: Callable
+    # columns that identify the node or relationship, see Incremental
+    identity: tuple
+    reader: Callable
+    deleter: Callable
+    # order in which a chunk's rows lock their nodes, for relationships both ends
+    lock_order: Optional[Callable] = None
+
+
+class Stage(NamedTuple):
+    name: str
+    # (phase, row) pairs, in any interleaving
+    rows: Iterable[tuple[Phase, object]]
+    totals: dict = {}
+
+
+class Rows:
+    # stage rows produced afresh on every pass, so a stage can be counted
+    # and diffed before it is written without holding its rows in memory
+    def __init__(self, produce: Callable[[], Iterable]):
+        self.produce = produce
+
+    def __iter__(self):
+        return iter(self.produce())
+
+
+SECTORS = Phase("sectors", SectorRepository.bulk_create_query,
+                lambda sector: "Sector:" + sector.name,
+                SectorRepository.params, ("name",),
+                SectorRepository.fingerprints_query, SectorRepository.bulk_delete_query)
+OBJECTIVES = Phase("objectives", ObjectiveRepository.bulk_create_query,
+                   lambda objective: "Objective:" + objective.key,
+                   ObjectiveRepository.params, ("key",),
+                   ObjectiveRepository.fingerprints_query, ObjectiveRepository.bulk_delete_query)
+ACTIVITIES = Phase("activities", ActivityRepository.bulk_create_query,
+                   lambda activity: "Activity:" + activity.name,
+                   ActivityRepository.params, ("name",),
+                   ActivityRepository.fingerprints_query, ActivityRepository.bulk_delete_query)
+CRITERIA = Phase("criteria", CriteriaRepository.bulk_create_query,
+                 lambda description: "Criteria:" + description,
+                 CriteriaRepository.params, ("hash",),
+                 CriteriaRepository.fingerprints_query, CriteriaRepository.bulk_delete_query)
+# Relationships are partitioned by their hub end (sectors and objectives),
+# the handful of nodes that nearly every edge of a type touches. Their
+# other end (activities and criteria) is shared between partitions:
+# workers may wait on each other there, and lock_order sorts each chunk
+# so they take those locks in the same order, which keeps deadlocks
+# rare. One that does happen fails the transaction with a transient
+# error, and the driver runs the chunk again. With only six objectives,
+# a relationship phase keeps at most six workers busy.
+SECTOR_ACTIVITIES = Phase("sector_activities", SectorRepository.bulk_create_match_with_activity_query,
+                          lambda row: "Sector:" + row["sector_name"],
+                          fingerprinted, ("sector_name", "activity_name"),
+                          SectorRepository.match_with_activity_fingerprints_query,
+                          SectorRepository.bulk_delete_match_with_activity_query,
+                          lambda row: (row["sector_name"], row["activity_name"]))
+CONTRIBUTION_MATCHES = Phase("contribution_matches", ActivityRepository.bulk_create_contribution_match_with_objective_query,
+                             lambda row: "Objective:" + row["objective_key"],
+                             fingerprinted, ("activity_name", "objective_key"),
+                             ActivityRepository.contribution_match_fingerprints_query,
+                             ActivityRepository.bulk_delete_contribution_match_query,
+                             lambda row: (row["objective_key"], row["activity_name"]))
+# both ends are objectives, any of which is another partition's hub; the
+# few dozen rows are written by one worker instead
+DNSH_OBJECTIVES = Phase("dnsh_objectives", ObjectiveRepository.bulk_create_dnsh_objective_query,
+                        lambda row: "Objectives",
+                        fingerprinted, ("objective_key", "dnsh_objective_key"),
+                        ObjectiveRepository.dnsh_objective_fingerprints_query,
+                        ObjectiveRepository.bulk_delete_dnsh_objective_query,
+                        lambda row: (row["objective_key"], row["dnsh_objective_key"]))
+DNSH_CRITERIA = Phase("dnsh_criteria", ObjectiveRepository.bulk_create_dnsh_match_with_criteria_query,
+                      lambda row: "Objective:" + row["objective_key"],
+                      fingerprinted, ("objective_key", "criteria_hash"),
+                      ObjectiveRepository.dnsh_match_with_criteria_fingerprints_query,
+                      ObjectiveRepository.bulk_delete_dnsh_match_with_criteria_query,
+                      lambda row: (row["objective_key"], row["criteria_hash"]))
+SC_CRITERIA = Phase("sc_criteria", ObjectiveRepository.bulk_create_sc_criteria_query,
+                    lambda row: "Objective:" + row["objective_key"],
+                    fingerprinted, ("objective_key", "criteria_hash"),
+                    ObjectiveRepository.sc_criteria_fingerprints_query,
+                    ObjectiveRepository.bulk_delete_sc_criteria_query,
+                    lambda row: (row["objective_key"], row["criteria_hash"]))
+PHASES = [SECTORS, OBJECTIVES, ACTIVITIES, CRITERIA,
+          SECTOR_ACTIVITIES, CONTRIBUTION_MATCHES, DNSH_OBJECTIVES, DNSH_CRITERIA, SC_CRITERIA]
+
+
+class Incremental:
+    # Filters stages down to what differs from the graph. The graph is read
+    # once up front (identity and content_hash per node and edge), then one
+    # pass over the source sorts its rows into inserted, updated and
+    # unchanged, so the totals reported are those of the rows actually
+    # written. Whatever was never seen in the source is deleted at the end.
+
+    def __init__(self, db: DatabaseFactory, phases: list[Phase] = PHASES):
+        self.phases = phases
+        self.existing: dict[str, dict[tuple, Optional[str]]] = {}
+        self.summary = {phase.name: {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+                        for phase in phases}
+        for phase in phases:
+            records = db.execute_read(phase.reader)
+            self.existing[phase.name] = {
+                tuple(record[column] for column in phase.identity): record["content_hash"]
+                for record in records}
+
+    def apply(self, stages: list[Stage]) -> list[Stage]:
+        seen = {phase.name: set() for phase in self.phases}
+        pending = {phase.name: set() for phase in self.phases}
+        for stage in stages:
+            for phase, item in stage.rows:
+                row = phase.params(item)
+                identity = tuple(row[column] for column in phase.identity)
+                # the plans only repeat an identity with identical content,
+                # see Integration.first_match
+                if identity in seen[phase.name]:
+                    continue
+                seen[phase.name].add(identity)
+                counts = self.summary[phase.name]
+                if identity not in self.existing[phase.name]:
+                    counts["inserted"] += 1
+                elif self.existing[phase.name][identity] != row["content_hash"]:
+                    counts["updated"] += 1
+                else:
+                    counts["unchanged"] += 1
+                    continue
+                pending[phase.name].add(identity)
+        deleted = {phase.name: self.existing[phase.name].keys() - seen[phase.name] for phase in self.phases}
+        for name, identities in deleted.items():
+            self.summary[name]["deleted"] = len(identities)
+        return [self.filter(stage, pending) for stage in stages] + [self.deletions(deleted)]
+
+    def filter(self, stage: Stage, pending: dict[str, set]) -> Stage:
+        # the stage's second pass: each pending row once, then it is done
+        def rows():
+            for phase, item in stage.rows:
+                identities = pending[phase.name]
+                row = phase.params(item)
+                identity = tuple(row[column] for column in phase.identity)
+                if identity in identities:
+                    identities.remove(identity)
+                    yield phase, item
+        return Stage(stage.name, rows(), {name: len(pending[name]) for name in stage.totals})
+
+    def deletions(self, deleted: dict[str, set]) -> Stage:
+        # relationships first, then nodes; all in one partition since
+        # DETACH DELETE locks every neighbour of the node
+        deletes = [(phase, phase._replace(name=phase.name + "_deleted", writer=phase.deleter,
+                                          lock_key=lambda row: "deletions", lock_order=None))
+                   for phase in reversed(self.phases)]
+
+        def rows():
+            for phase, delete in deletes:
+                for identity in deleted[phase.name]:
+                    yield delete, dict(zip(phase.identity, identity))
+        return Stage("deletions", rows(), {delete.name: len(deleted[phase.name]) for phase, delete in deletes})
+
+
+def changed(diff: Optional[dict]) -> bool:
+    # whether a run wrote anything: a full one always does, an incremental
+    # one only when its summary counts an insert, update or deletion
+    return diff is None or any(counts["inserted"] or counts["updated"] or counts["deleted"]
+                               for counts in diff.values())
+
+
+def _stage(name: str, rows: dict[Phase, list]) -> Stage:
+    return Stage(name,
+                 Rows(lambda: ((phase, row) for phase, phase_rows in rows.items() for row in phase_rows)),
+                 {phase.name: len(phase_rows) for phase, phase_rows in rows.items()})
+
+
+def plan(data) -> list[Stage]:
+    rows = Integration.relationship_rows(data)
+    return [
+        _stage("nodes", {
+            SECTORS: [Sector(**sector) for sector in data["sectors"]],
+            OBJECTIVES: [Objective(**objective) for objective in data["objectives"]],
+            ACTIVITIES: [Activity(**activity) for activity in data["activities"]],
+            CRITERIA: rows["criteria"],
+        }),
+        _stage("relationships", {
+            SECTOR_ACTIVITIES: rows["sector_activities"],
+            CONTRIBUTION_MATCHES: rows["contribution_matches"],
+            DNSH_OBJECTIVES: rows["dnsh_objectives"],
+            DNSH_CRITERIA: rows["dnsh_criteria"],
+            SC_CRITERIA: rows["sc_criteria"],
+        }),
+    ]
+
+
+class RecentKeys:
+    # Digests of the last max_keys distinct keys. A streamed import drops
+    # rows it has seen recently; a repeat older than that is written again,
+    # which the MERGE writers make harmless, so memory stays bounded
+    # however many distinct criteria and relationships the document holds.
+
+    def __init__(self, max_keys: int = INGEST_DEDUP_KEYS):
+        self.max_keys = max_keys
+        self.keys: OrderedDict[bytes, None] = OrderedDict()
+
+    def first_seen(self, key) -> bool:
+        digest = blake2b(repr(key).encode(), digest_size=16).digest()
+        if digest in self.keys:
+            self.keys.move_to_end(digest)
+            return False
+        self.keys[digest] = None
+        if len(self.keys) > self.max_keys:
+            self.keys.popitem(last=False)
+        return True
+
+
+def stream_plan(path: str, max_keys: int = INGEST_DEDUP_KEYS) -> list[Stage]:
+    # One pass over the document per stage, plus one per stage up front
+    # that only counts the rows, for the job's totals and ETA. Memory is
+    # bounded by the chunk size and max_keys, plus a digest per match to
+    # write each activity's match with an objective once (see first_match).
+    def nodes():
+        seen = RecentKeys(max_keys)
+        for section, item in iter_taxonomy_file(path):
+            if section == "sectors":
+                yield SECTORS, Sector(**item)
+            elif section == "objectives":
+                yield OBJECTIVES, Objective(**item)
+            elif section == "activities":
+                yield ACTIVITIES, Activity(**item)
+            elif section == "matches":
+                for kind, row in Integration.match_rows(item):
+                    if kind == "criteria" and seen.first_seen(row):
+                        yield CRITERIA, row
+
+    def relationships():
+        phases = {"dnsh_objectives": DNSH_OBJECTIVES,
+                  "dnsh_criteria": DNSH_CRITERIA, "sc_criteria": SC_CRITERIA}
+        seen = RecentKeys(max_keys)
+        matches = {}
+        for section, item in iter_taxonomy_file(path):
+            if section == "activities":
+                yield SECTOR_ACTIVITIES, Integration.sector_activity_row(item)
+            elif section == "matches":
+                for kind, row in Integration.match_rows(item):
+                    if kind == "contribution_matches":
+                        if Integration.first_match(matches, row):
+                            yield CONTRIBUTION_MATCHES, row
+                    elif kind in phases and seen.first_seen((kind, row)):
+                        yield phases[kind], row
+
+    # the same passes yield the same rows, so the counts are exact
+    return [Stage(name, Rows(rows), dict(Counter(phase.name for phase, _ in rows())))
+            for name, rows in (("nodes", nodes), ("relationships", relationships))]
+
+
+class Ingestion(NamedTuple):
+    db: DatabaseFactory
+    workers: int = INGEST_WORKERS
+    chunk_size: int = INGEST_CHUNK_SIZE
+    batch_size: int = BATCH_SIZE
+    progress: Progress = Progress()
+
+    def run(self, data, incremental: bool = False) -> Optional[dict]:
+        return self.run_stages(plan(data), incremental)
+
+    def run_stream(self, path: str, incremental: bool = False) -> Optional[dict]:
+        self.progress.stage("counting")
+        return self.run_stages(stream_plan(path), incremental)
+
+    def run_stages(self, stages: list[Stage], incremental: bool = False) -> Optional[dict]:
+        stages, diff = self.prepare(stages, incremental)
+        if changed(diff):
+            self.write(stages)
+        return diff
+
+    def prepare(self, stages: list[Stage], incremental: bool = False) -> tuple[list[Stage], Optional[dict]]:
+        # the stages to write and, for an incremental run, the diff summary
+        diff = None
+        if incremental:
+            self.progress.stage("diffing")
+            comparison = Incremental(self.db)
+            stages = comparison.apply(stages)
+            diff = comparison.summary
+            self.progress.diff(diff)
+        for stage in stages:
+            for phase, rows in stage.totals.items():
+                self.progress.total(phase, rows)
+        return stages, diff
+
+    def write(self, stages: list[Stage]):
+        for stage in stages:
+            self.progress.stage(stage.name)
+            self.run_stage(stage)
+
+    def run_stage(self, stage: Stage):
+        # Rows sharing a lock key always land in the same partition and a
+        # partition only ever has one chunk in flight, so no two chunks
+        # write the same node, or the same hub of a relationship, at once.
+        pending: list[Optional[Future]] = [None] * self.workers
+        buffers: dict[tuple[Phase, int], list] = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                for phase, row in stage.rows:
+                    partition = crc32(phase.lock_key(row).encode()) % self.workers
+                    buffer = buffers.setdefault((phase, partition), [])
+                    buffer.append(row)
+                    if len(buffer) >= self.chunk_size:
+                        self._submit(pool, pending, partition,
+                                     phase, buffers.pop((phase, partition)))
+                for (phase, partition), buffer in buffers.items():
+                    self._submit(pool, pending, partition, phase, buffer)
+            finally:
+                for future in pending:
+                    if future:
+                        future.result()
+
+    def _submit(self, pool: ThreadPoolExecutor, pending: list, partition: int, phase: Phase, rows: list):
+        self.progress.check()
+        if pending[partition]:
+            pending[partition].result()
+        pending[partition] = pool.submit(self.write_chunk, phase, rows)
+
+    def write_chunk(self, phase: Phase, rows: list):
+        # one transaction per chunk, retried by the driver on transient
+        # errors, deadlocks included
+        if phase.lock_order:
+            rows.sort(key=phase.lock_order)
+        self.db.execute_write(phase.writer, rows, self.batch_size)
+        self.progress.advance(phase.name, len(rows))
+        return len(rows)
+
+
+def populate_database(integration, db, workers: int = INGEST_WORKERS, chunk_size: int = INGEST_CHUNK_SIZE,
+                      progress: Progress = Progress(), source: Optional[str] = None,
+                      incremental: bool = False, offline: Optional[bool] = None) -> Optional[dict]:
+    logger.info("start populating")
+    ingestion = Ingestion(db, workers, chunk_size, progress=progress)
+    if source:
+        diff = _populate(ingestion, source, incremental)
+    else:
+        progress.stage("fetching")
+        fetched = source_cache.fetch(integration, offline)
+        logger.info("source %s %s", fetched.origin, fetched.metadata["sha256"])
+        progress.source(fetched.to_dict())
+        diff = _populate(ingestion, fetched.path, incremental)
+    logger.info("population finished %s", diff or "")
+    return diff
+
+
+def _populate(ingestion: Ingestion, path: str, incremental: bool) -> Optional[dict]:
+    # an incremental run that finds nothing changed leaves the database,
+    # its schema included, untouched
+    ingestion.progress.stage("counting")
+    stages, diff = ingestion.prepare(stream_plan(path), incremental)
+    if not changed(diff):
+        return diff
+    ingestion.progress.stage("schema")
+    schema = Schema(ingestion.db)
+    logger.info("schema %s", schema.bootstrap())
+    schema.await_online()
+    try:
+        ingestion.db.execute_write(CriteriaRepository.delete_unhashed_query, {})
+        ingestion.write(stages)
+    finally:
+        # even a failed or cancelled run may have written, so cached
+        # responses are invalidated either way
+        generation.bump()
+    return diff
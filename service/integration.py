@@ -1,6 +1,9 @@
-from functools import cache
-from typing import NamedTuple
+import json
+import logging
+from typing import BinaryIO, NamedTuple, Optional
 from requests import Request
+from dao.batch import BATCH_SIZE
+from dao.fingerprint import criteria_hash, fingerprint
 from repository.activity import ActivityRepository
 from repository.objective import ObjectiveRepository
 from repository.sector import SectorRepository
@@ -8,74 +11,141 @@ from repository.criteria import CriteriaRepository
 from entity.Sector import Sector
 from entity.Activity import Activity
 from entity.Objective import Objective
-from itertools import chain
-import logging
+
+logger = logging.getLogger(__name__)
 
 
 class Integration(NamedTuple):
     request: Request
     __eu_taxonamy_url = "https://ec.europa.eu/sustainable-finance-taxonomy/assets/taxonomy.json"
 
-    @cache
-    def fetch_eu_taxonamy(self) -> dict:
-        res = self.request.get(self.__eu_taxonamy_url)
-        return res.json()
+    def revalidate_eu_taxonamy(self, file: BinaryIO, validators: dict, chunk_size: int = 1 << 16,
+                               timeout: Optional[float] = None) -> Optional[dict]:
+        # A conditional GET for the copy described by validators (its etag and
+        # last_modified). Returns None when the server says that copy is
+        # current, otherwise spools the body to file and returns the new
+        # validators.
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        with self.request.get(self.__eu_taxonamy_url, stream=True, headers=headers, timeout=timeout) as res:
+            if res.status_code == 304:
+                return None
+            res.raise_for_status()
+            for chunk in res.iter_content(chunk_size):
+                file.write(chunk)
+            return {"etag": res.headers.get("ETag"), "last_modified": res.headers.get("Last-Modified")}
+
+    @staticmethod
+    def sector_activity_row(activity: dict) -> dict:
+        return {"sector_name": activity["sector"], "activity_name": activity["name"]}
+
+    @staticmethod
+    def match_summary(match: dict) -> dict:
+        # the match's own DNSH objectives and criteria, stored on its MATCHES
+        # relationship by key and hash; the graph only keeps their union per
+        # objective, and the criteria text once on the Criteria nodes
+        return {
+            "dnsh_summary": json.dumps([{"objective": dnsh["objective"],
+                                         "criteria_hashes": [criteria_hash(text) for text in dnsh["criteria"]]}
+                                        for dnsh in match["dnsh"]], separators=(",", ":")),
+            "sc_criteria_hashes": [criteria_hash(text) for text in match["substantial_contribution_criteria"]],
+        }
+
+    @staticmethod
+    def match_rows(match: dict):
+        # every row one match contributes, tagged with the kind of write it feeds
+        contribution_type = match.get("activity_contribution_type", None)
+        description = match.get("contribution_description", None)
+        # a match carrying neither a contribution type nor a description is not linked
+        if contribution_type or description or None not in (contribution_type, description):
+            yield "contribution_matches", {
+                "activity_name": match["activity"], "objective_key": match["objective"],
+                "contribution_type": contribution_type, "description": description,
+                **Integration.match_summary(match)}
+        for dnsh in match["dnsh"]:
+            yield "dnsh_objectives", {
+                "objective_key": match["objective"], "dnsh_objective_key": dnsh["objective"]}
+            for text in dnsh["criteria"]:
+                yield "criteria", text
+                yield "dnsh_criteria", {
+                    "objective_key": dnsh["objective"], "criteria_hash": criteria_hash(text)}
+        for text in match["substantial_contribution_criteria"]:
+            yield "criteria", text
+            yield "sc_criteria", {
+                "objective_key": match["objective"], "criteria_hash": criteria_hash(text)}
 
     @staticmethod
-    def persist_to_db(tx, data):
-        print("started")
-        matches = data["matches"]
+    def first_match(matches: dict, row: dict) -> bool:
+        # The MATCHES relationship is merged on the (activity, objective)
+        # pair, and the incremental diff keys on it too, so one pair is
+        # written once. A repeat with a different contribution would
+        # overwrite the first; it is skipped and logged instead.
+        key = (row["activity_name"], row["objective_key"])
+        digest = fingerprint(row)
+        if key not in matches:
+            matches[key] = digest
+            return True
+        if matches[key] != digest:
+            logger.warning("activity %r matches objective %r again with a different contribution "
+                           "(%r, %r), keeping the first", *key, row["contribution_type"], row["description"])
+        return False
+
+    @staticmethod
+    def relationship_rows(data) -> dict:
+        # deduplicated parameter rows per relationship type, plus the criteria they point to
+        rows = {kind: {} for kind in ("criteria", "sector_activities", "contribution_matches",
+                                      "dnsh_objectives", "dnsh_criteria", "sc_criteria")}
+        for activity in data["activities"]:
+            row = Integration.sector_activity_row(activity)
+            rows["sector_activities"][tuple(row.values())] = row
+        matches = {}
+        for match in data["matches"]:
+            for kind, row in Integration.match_rows(match):
+                if kind == "contribution_matches":
+                    if not Integration.first_match(matches, row):
+                        continue
+                    key = (row["activity_name"], row["objective_key"])
+                else:
+                    key = row if kind == "criteria" else tuple(row.values())
+                rows[kind][key] = row
+        return {kind: list(unique.values()) for kind, unique in rows.items()}
+
+    @staticmethod
+    def persist_to_db(tx, data, batch_size: int = BATCH_SIZE):
+        logger.info("started")
         sectors = [Sector(**sector) for sector in data["sectors"]]
         activities = [Activity(**activity) for activity in data["activities"]]
         objectives = [Objective(**objective)
                       for objective in data["objectives"]]
+        rows = Integration.relationship_rows(data)
 
-        print("bulk create started")
+        logger.info("bulk create started")
         # bulk creation of nodes
-        SectorRepository.bulk_create_query(tx, sectors)
-        ObjectiveRepository.bulk_create_query(tx, objectives)
-        ActivityRepository.bulk_create_query(tx, activities)
-        print("bulk create finished")
+        SectorRepository.bulk_create_query(tx, sectors, batch_size)
+        ObjectiveRepository.bulk_create_query(tx, objectives, batch_size)
+        ActivityRepository.bulk_create_query(tx, activities, batch_size)
+        CriteriaRepository.bulk_create_query(tx, rows["criteria"], batch_size)
+        logger.info("bulk create finished")
 
-        print("activity matches started")
+        logger.info("activity matches started")
         # create relationship between Sector and Activity
-        for activity in data["activities"]:
-            SectorRepository.create_match_with_activity_query(tx, activity)
-        print("activity matches created")
+        SectorRepository.bulk_create_match_with_activity_query(
+            tx, rows["sector_activities"], batch_size)
+        logger.info("activity matches created")
 
-        print("matches started")
+        logger.info("matches started")
         # create matches
-        for match in matches:
-            ActivityRepository.create_contribution_match_with_objective_query(
-                tx,
-                match["activity"],
-                match["objective"],
-                {"contribution_type": match.get("activity_contribution_type", None),
-                 "description": match.get("contribution_description", None)}
-            )
-            dnsh_criteria = [c["criteria"] for c in match["dnsh"]]
-            sc_criteria = match["substantial_contribution_criteria"]
-            criteria = list(chain(*dnsh_criteria))
-            criteria += list(sc_criteria)
-            CriteriaRepository.bulk_create_query(tx, criteria)
-            for dnsh in match["dnsh"]:
-                # create objective DNSH
-                ObjectiveRepository.create_dnsh_objective_query(
-                    tx, match["objective"], dnsh["objective"])
-                for criteria in dnsh["criteria"]:
-                    ObjectiveRepository.create_dnsh_match_with_criteria_query(
-                        tx, dnsh["objective"], criteria)
-            for criteria in sc_criteria:
-                # create sc objective criteria
-                ObjectiveRepository.create_sc_criteria_query(
-                    tx, match["objective"], criteria)
-        print("matches finished")
-
-
-def populate_database(integration, db):
-    logger = logging.getLogger(populate_database.__name__)
-    print("start populating")
-    data = integration.fetch_eu_taxonamy()
-    with db.driver.session() as session:
-        session.execute_write(Integration.persist_to_db, data)
-    print("population finished")
+        ActivityRepository.bulk_create_contribution_match_with_objective_query(
+            tx, rows["contribution_matches"], batch_size)
+        # create objective DNSH
+        ObjectiveRepository.bulk_create_dnsh_objective_query(
+            tx, rows["dnsh_objectives"], batch_size)
+        ObjectiveRepository.bulk_create_dnsh_match_with_criteria_query(
+            tx, rows["dnsh_criteria"], batch_size)
+        # create sc objective criteria
+        ObjectiveRepository.bulk_create_sc_criteria_query(
+            tx, rows["sc_criteria"], batch_size)
+        logger.info("matches finished")
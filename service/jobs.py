@@ -0,0 +1,210 @@
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+from service.ingestion import IngestionCancelled, Progress
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = os.getenv("JOBS_DIR") or os.path.join(
+    tempfile.gettempdir(), "eu_taxonamy_jobs")
+# status files are rewritten at most this often while rows are flowing
+STATUS_INTERVAL = float(os.getenv("JOBS_STATUS_INTERVAL") or 1)
+
+
+class JobAlreadyRunning(Exception):
+    def __init__(self, job_id: Optional[str]):
+        super().__init__(f"population job {job_id} is already running")
+        self.job_id = job_id
+
+
+class PopulationJob(Progress):
+    # Progress that records itself under JOBS_DIR, so any gunicorn worker
+    # can report on or cancel a job started by another one
+
+    def __init__(self, jobs_dir: str = JOBS_DIR):
+        self.id = uuid.uuid4().hex
+        self.jobs_dir = jobs_dir
+        self.state = "running"
+        self.phase = "queued"
+        self.rows_written: dict[str, int] = {}
+        self.rows_total: dict[str, int] = {}
+        self.diff_summary: Optional[dict] = None
+        self.source_summary: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+
+    @property
+    def status_path(self) -> str:
+        return os.path.join(self.jobs_dir, f"{self.id}.json")
+
+    @property
+    def cancel_path(self) -> str:
+        return os.path.join(self.jobs_dir, f"{self.id}.cancel")
+
+    def stage(self, name: str):
+        with self._lock:
+            self.phase = name
+        self.save()
+
+    def total(self, phase: str, rows: int):
+        with self._lock:
+            self.rows_total[phase] = rows
+            self.rows_written.setdefault(phase, 0)
+
+    def advance(self, phase: str, rows: int):
+        with self._lock:
+            self.rows_written[phase] = self.rows_written.get(phase, 0) + rows
+        if time.time() - self._saved_at >= STATUS_INTERVAL:
+            self.save()
+
+    def check(self):
+        if self._cancelled.is_set() or os.path.exists(self.cancel_path):
+            self._cancelled.set()
+            raise IngestionCancelled(self.id)
+
+    def diff(self, summary: dict):
+        with self._lock:
+            self.diff_summary = summary
+
+    def source(self, summary: dict):
+        with self._lock:
+            self.source_summary = summary
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def finish(self, state: str, error: Optional[str] = None):
+        with self._lock:
+            self.state = state
+            self.error = error
+            self.finished_at = time.time()
+        self.save()
+        if os.path.exists(self.cancel_path):
+            os.remove(self.cancel_path)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at
+            written = sum(self.rows_written.values())
+            total = sum(self.rows_total.values())
+            throughput = written / elapsed if elapsed > 0 else 0.0
+            eta = None
+            if self.state == "running" and total and throughput:
+                eta = max(total - written, 0) / throughput
+            return {
+                "id": self.id,
+                "state": self.state,
+                "phase": self.phase,
+                "rowsWritten": dict(self.rows_written),
+                "rowsTotal": dict(self.rows_total),
+                "diff": self.diff_summary,
+                "source": self.source_summary,
+                "throughput": round(throughput, 2),
+                "eta": round(eta, 2) if eta is not None else None,
+                "startedAt": self.started_at,
+                "finishedAt": self.finished_at,
+                "error": self.error,
+            }
+
+    def save(self):
+        status = self.to_dict()
+        self._saved_at = time.time()
+        temp = f"{self.status_path}.{os.getpid()}.{threading.get_ident()}"
+        with open(temp, "w") as file:
+            json.dump(status, file)
+        os.replace(temp, self.status_path)
+
+
+class JobManager:
+    # single-flight guard: the running job holds an exclusive flock on
+    # JOBS_DIR/populate.lock, which also excludes other worker processes
+
+    def __init__(self, jobs_dir: str = JOBS_DIR):
+        self.jobs_dir = jobs_dir
+        self.current: Optional[PopulationJob] = None
+
+    @property
+    def lock_path(self) -> str:
+        return os.path.join(self.jobs_dir, "populate.lock")
+
+    def start(self, target: Callable[[PopulationJob], None]) -> PopulationJob:
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        lock_file = open(self.lock_path, "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.seek(0)
+            running = lock_file.read().strip() or None
+            lock_file.close()
+            raise JobAlreadyRunning(running)
+        job = PopulationJob(self.jobs_dir)
+        lock_file.truncate(0)
+        lock_file.write(job.id)
+        lock_file.flush()
+        job.save()
+        self.current = job
+        thread = threading.Thread(target=self._run, args=(job, target, lock_file),
+                                  name=f"populate-{job.id}", daemon=True)
+        thread.start()
+        return job
+
+    def _run(self, job: PopulationJob, target: Callable, lock_file):
+        try:
+            target(job)
+            job.finish("finished")
+        except IngestionCancelled:
+            logger.info("population job %s cancelled", job.id)
+            job.finish("cancelled")
+        except Exception as error:
+            logger.exception("population job %s failed", job.id)
+            job.finish("failed", str(error))
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def status(self, job_id: str) -> Optional[dict]:
+        if self.current and self.current.id == job_id:
+            return self.current.to_dict()
+        try:
+            with open(os.path.join(self.jobs_dir, f"{os.path.basename(job_id)}.json")) as file:
+                status = json.load(file)
+        except FileNotFoundError:
+            return None
+        if status["state"] == "running" and not self._locked():
+            # the process running it died without recording an outcome
+            status["state"] = "abandoned"
+        return status
+
+    def _locked(self) -> bool:
+        with open(self.lock_path, "a+") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            return False
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        status = self.status(job_id)
+        if status is None or status["state"] != "running":
+            return status
+        if self.current and self.current.id == job_id:
+            self.current.cancel()
+        else:
+            open(os.path.join(self.jobs_dir, f"{os.path.basename(job_id)}.cancel"), "w").close()
+        status["state"] = "cancelling"
+        return status
+
+
+jobs = JobManager()
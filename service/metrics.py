@@ -0,0 +1,269 @@
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+from graphql import DocumentNode, FieldNode, get_operation_ast
+from dao.instrumentation import Observation
+
+METRICS_ENABLED = (os.getenv("METRICS_ENABLED") or "true").lower() in ("1", "true", "yes")
+METRICS_DIR = os.getenv("METRICS_DIR") or os.path.join(tempfile.gettempdir(), "eu_taxonamy_metrics")
+# how often a worker writes its values for the others to render
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL") or 5)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# the ResultSummary counters exported, as in neo4j.SummaryCounters
+UPDATE_COUNTERS = ("nodes_created", "nodes_deleted", "relationships_created", "relationships_deleted",
+                   "properties_set", "labels_added", "labels_removed", "indexes_added", "constraints_added")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+FAMILIES = {
+    "eu_taxonamy_cypher_query_duration_seconds":
+        ("histogram", "Time from running a Cypher statement until its result was consumed"),
+    "eu_taxonamy_cypher_query_rows_total": ("counter", "Records returned by Cypher statements"),
+    "eu_taxonamy_cypher_query_errors_total": ("counter", "Cypher statements that failed"),
+    "eu_taxonamy_cypher_updates_total": ("counter", "Result summary counters of Cypher statements"),
+    "eu_taxonamy_cypher_db_hits_total": ("counter", "Database hits of profiled Cypher statements"),
+    "eu_taxonamy_graphql_operation_duration_seconds":
+        ("histogram", "Time to execute a GraphQL operation, by its root fields and outcome"),
+    "eu_taxonamy_db_pool_connections": ("gauge", "Pooled Neo4j connections by server and state"),
+    "eu_taxonamy_db_pool_max_connections": ("gauge", "Connections the driver pools per server"),
+}
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, **extra) -> str:
+    items = [*labels, *extra.items()]
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}" if items else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Registry:
+    # Metric values of this process. Each worker writes its own to
+    # METRICS_DIR/<pid>.json at most every METRICS_FLUSH_INTERVAL and
+    # render() adds up every file there, so a scrape sees the whole
+    # gunicorn server whichever worker answers it. Gauges only count for
+    # workers that are still alive.
+
+    def __init__(self, directory: str = METRICS_DIR, enabled: bool = METRICS_ENABLED,
+                 interval: float = METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.enabled = enabled
+        self.interval = interval
+        self.collectors: list[Callable[[], Iterable[tuple]]] = []
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # a forked worker starts from zero, its parent's values are its parent's
+        self.counters: dict[tuple, float] = {}
+        self.histograms: dict[tuple, list] = {}
+        self.flushed_at = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f"{os.getpid()}.json")
+
+    def inc(self, name: str, labels: dict, value: float = 1):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        self._maybe_flush()
+
+    def observe(self, name: str, labels: dict, value: float, buckets: tuple = LATENCY_BUCKETS):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self.lock:
+            # per bucket counts (not cumulative), then sum and count
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * len(buckets) + [0.0, 0]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[index] += 1
+                    break
+            histogram[-2] += value
+            histogram[-1] += 1
+        self._maybe_flush()
+
+    def collect(self, collector: Callable[[], Iterable[tuple]]):
+        # collector() yields (name, labels, value) gauges, read at flush time
+        self.collectors.append(collector)
+
+    def _maybe_flush(self):
+        if time.time() - self.flushed_at >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if not self.enabled:
+            return
+        gauges = []
+        for collector in self.collectors:
+            try:
+                gauges += [[name, labels, value] for name, labels, value in collector()]
+            except Exception:
+                pass
+        with self.lock:
+            self.flushed_at = time.time()
+            state = {
+                "counters": [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                "histograms": [[name, dict(labels), list(values)] for (name, labels), values in self.histograms.items()],
+                "gauges": gauges,
+            }
+        os.makedirs(self.directory, exist_ok=True)
+        temp = f"{self.path}.{threading.get_ident()}"
+        with open(temp, "w") as file:
+            json.dump(state, file)
+        os.replace(temp, self.path)
+
+    def clear(self):
+        # gunicorn's master calls this on start, see gunicorn.conf.py
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            os.remove(path)
+
+    def merged(self) -> tuple[dict, dict, dict]:
+        counters: dict[tuple, float] = {}
+        histograms: dict[tuple, list] = {}
+        gauges: dict[tuple, float] = {}
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                with open(path) as file:
+                    state = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in state["counters"]:
+                key = _key(name, labels)
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in state["histograms"]:
+                key = _key(name, labels)
+                merged = histograms.setdefault(key, [0] * len(values))
+                histograms[key] = [total + value for total, value in zip(merged, values)]
+            if _alive(os.path.basename(path).split(".")[0]):
+                for name, labels, value in state["gauges"]:
+                    key = _key(name, labels)
+                    gauges[key] = gauges.get(key, 0) + value
+        return counters, histograms, gauges
+
+    def render(self) -> str:
+        self.flush()
+        counters, histograms, gauges = self.merged()
+        lines = []
+        for name, (kind, description) in FAMILIES.items():
+            values = {"histogram": histograms, "counter": counters, "gauge": gauges}[kind]
+            series = sorted((key, value) for key, value in values.items() if key[0] == name)
+            if not series:
+                continue
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+            for (_, labels), value in series:
+                if kind != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, le=_number(bound))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {value[-1]}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value[-2])}")
+                lines.append(f"{name}_count{_labels(labels)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _alive(pid: str) -> bool:
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def db_hits(profile: Optional[dict]) -> int:
+    if not profile:
+        return 0
+    return profile.get("dbHits", 0) + sum(db_hits(child) for child in profile.get("children", ()))
+
+
+class CypherMetrics:
+    # a DatabaseFactory observer, see dao.instrumentation
+
+    def __init__(self, registry: Registry):
+        self.registry = registry
+
+    def __call__(self, observation: Observation):
+        labels = {"query": observation.name}
+        self.registry.observe("eu_taxonamy_cypher_query_duration_seconds", labels, observation.seconds)
+        if observation.rows:
+            self.registry.inc("eu_taxonamy_cypher_query_rows_total", labels, observation.rows)
+        if observation.error is not None:
+            self.registry.inc("eu_taxonamy_cypher_query_errors_total", labels)
+        summary = observation.summary
+        if summary is None:
+            return
+        for counter in UPDATE_COUNTERS:
+            value = getattr(summary.counters, counter, 0)
+            if value:
+                self.registry.inc("eu_taxonamy_cypher_updates_total", {**labels, "counter": counter}, value)
+        hits = db_hits(summary.profile)
+        if hits:
+            self.registry.inc("eu_taxonamy_cypher_db_hits_total", labels, hits)
+
+
+def pool_gauges(database) -> Callable[[], Iterable[tuple]]:
+    def collect():
+        stats = database.pool_stats()
+        if not stats:
+            return
+        yield "eu_taxonamy_db_pool_max_connections", {}, stats["max"]
+        for address, states in stats["servers"].items():
+            for state, count in states.items():
+                yield "eu_taxonamy_db_pool_connections", {"server": address, "state": state}, count
+    return collect
+
+
+def operation_label(document: DocumentNode, operation_name: Optional[str]) -> str:
+    # root field names rather than the client's operationName, which would
+    # let clients mint label values without bound
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return "unknown"
+    return "+".join(sorted({selection.name.value for selection in operation.selection_set.selections
+                            if isinstance(selection, FieldNode)})) or "fragments"
+
+
+class OperationTimer:
+    def __init__(self):
+        self.operation = "invalid"
+        self.outcome = "error"
+        self.started = time.perf_counter()
+
+
+@contextmanager
+def graphql_operation(registry: Optional["Registry"] = None):
+    # times one GraphQL request; the caller fills in operation and outcome
+    timer = OperationTimer()
+    try:
+        yield timer
+    finally:
+        (registry or metrics).observe("eu_taxonamy_graphql_operation_duration_seconds",
+                                      {"operation": timer.operation, "outcome": timer.outcome},
+                                      time.perf_counter() - timer.started)
+
+
+metrics = Registry()
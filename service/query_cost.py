@@ -0,0 +1,194 @@
+import json
+from os import getenv
+from typing import NamedTuple, Optional
+from graphql import DocumentNode, FieldNode, FragmentDefinitionNode, FragmentSpreadNode, GraphQLError, GraphQLList, GraphQLNonNull, \
+    GraphQLSchema, InlineFragmentNode, get_named_type, is_composite_type
+from graphql.utilities import get_operation_ast, value_from_ast_untyped
+
+GRAPHQL_MAX_COST = int(getenv("GRAPHQL_MAX_COST") or 20000)
+GRAPHQL_MAX_DEPTH = int(getenv("GRAPHQL_MAX_DEPTH") or 10)
+GRAPHQL_MAX_ALIASES = int(getenv("GRAPHQL_MAX_ALIASES") or 10)
+# fields visited, including every expansion of a fragment
+GRAPHQL_MAX_SELECTIONS = int(getenv("GRAPHQL_MAX_SELECTIONS") or 5000)
+# size assumed for a list without an entry in LIST_SIZES or a paging argument
+GRAPHQL_DEFAULT_LIST_SIZE = int(getenv("GRAPHQL_DEFAULT_LIST_SIZE") or 10)
+
+# Cost of a field per object it returns; object fields default to 1,
+# scalars to 0. Overrides come from GRAPHQL_FIELD_COSTS, a JSON object of
+# "Type.field": cost.
+FIELD_COSTS = {
+    "Query.listActivities": 2,
+    "Query.getActivityMainObjectivesByID": 2,
+    "Query.getActivityMainObjectivesByName": 2,
+    "Query.getActivityAllMainObjectives": 10,
+    # count queries over the whole graph
+    "ActivitiesResult.totalCount": 5,
+    "ActivityMainObjectivesResult.totalCount": 5,
+    # pattern comprehensions evaluated per match
+    "ActivityMainObjectives.dnsh": 2,
+    "ActivityMainObjectives.substantialContributionCriteria": 1,
+    "ActivityMainObjectives.substantialContributionCriteriaHashes": 1,
+    "DNSH.criteria": 1,
+    "DNSH.criteriaHashes": 1,
+    **json.loads(getenv("GRAPHQL_FIELD_COSTS") or "{}"),
+}
+# Expected length of list fields when the query does not page them; the
+# `first` argument, or the length of a list argument like getCriteria's
+# hashes, sizes the lists of the field's result instead. Overrides come
+# from GRAPHQL_LIST_SIZES.
+LIST_SIZES = {
+    "ActivitiesResult.activities": 200,
+    "ActivitiesResult.edges": 200,
+    "ActivityMainObjectivesResult.activityMainObjectives": 500,
+    "ActivityMainObjectivesResult.edges": 500,
+    "ActivityMainObjectives.dnsh": 6,
+    **json.loads(getenv("GRAPHQL_LIST_SIZES") or "{}"),
+}
+
+
+class QueryCost(NamedTuple):
+    cost: int
+    depth: int
+    aliases: int
+    selections: int
+    max_cost: int
+    max_depth: int
+    max_aliases: int
+
+    def to_dict(self) -> dict:
+        return {
+            "cost": self.cost,
+            "maxCost": self.max_cost,
+            "depth": self.depth,
+            "maxDepth": self.max_depth,
+            "aliases": self.aliases,
+            "maxAliases": self.max_aliases,
+        }
+
+
+class QueryTooComplex(GraphQLError):
+    def __init__(self, message: str, cost: QueryCost):
+        super().__init__(message, extensions={"code": "QUERY_TOO_COMPLEX", "cost": cost.to_dict()})
+
+
+class _Totals:
+    def __init__(self, analysis: "CostAnalysis"):
+        self.analysis = analysis
+        self.cost = 0
+        self.depth = 0
+        self.aliases = 0
+        self.selections = 0
+
+    def result(self) -> QueryCost:
+        return QueryCost(self.cost, self.depth, self.aliases, self.selections, self.analysis.max_cost,
+                         self.analysis.max_depth, self.analysis.max_aliases)
+
+
+def page_size(arguments: dict) -> Optional[int]:
+    first = arguments.get("first")
+    if isinstance(first, int):
+        # rejected here and not only by the resolver: a negative page would
+        # make the cost negative and let sibling fields past the limit
+        if first < 0:
+            raise GraphQLError("first must not be negative")
+        return first
+    for value in arguments.values():
+        if isinstance(value, list):
+            return len(value)
+    return None
+
+
+class CostAnalysis:
+    # Static cost of a validated document for the given variables, worked
+    # out before execution: every field costs its FIELD_COSTS entry for
+    # each object the enclosing lists are expected to hold. Introspection
+    # fields are free, so the playground keeps working.
+
+    def __init__(self, field_costs: dict = FIELD_COSTS, list_sizes: dict = LIST_SIZES,
+                 default_list_size: int = GRAPHQL_DEFAULT_LIST_SIZE, max_cost: int = GRAPHQL_MAX_COST,
+                 max_depth: int = GRAPHQL_MAX_DEPTH, max_aliases: int = GRAPHQL_MAX_ALIASES,
+                 max_selections: int = GRAPHQL_MAX_SELECTIONS):
+        self.field_costs = field_costs
+        self.list_sizes = list_sizes
+        self.default_list_size = default_list_size
+        self.max_cost = max_cost
+        self.max_depth = max_depth
+        self.max_aliases = max_aliases
+        self.max_selections = max_selections
+
+    def analyze(self, schema: GraphQLSchema, document: DocumentNode, variables: Optional[dict] = None,
+                operation_name: Optional[str] = None) -> QueryCost:
+        totals = _Totals(self)
+        operation = get_operation_ast(document, operation_name)
+        if operation is None:
+            return totals.result()
+        variables = dict(variables or {})
+        for definition in operation.variable_definitions or ():
+            name = definition.variable.name.value
+            if name not in variables and definition.default_value is not None:
+                variables[name] = value_from_ast_untyped(definition.default_value)
+        fragments = {definition.name.value: definition for definition in document.definitions
+                     if isinstance(definition, FragmentDefinitionNode)}
+        root = schema.get_root_type(operation.operation)
+        self._selections(schema, root, operation.selection_set, fragments, variables, 1, None, 1, totals)
+        return totals.result()
+
+    def check(self, schema: GraphQLSchema, document: DocumentNode, variables: Optional[dict] = None,
+              operation_name: Optional[str] = None) -> QueryCost:
+        cost = self.analyze(schema, document, variables, operation_name)
+        if cost.depth > self.max_depth:
+            raise QueryTooComplex(f"query depth {cost.depth} exceeds the limit of {self.max_depth}", cost)
+        if cost.aliases > self.max_aliases:
+            raise QueryTooComplex(f"query uses {cost.aliases} aliases, the limit is {self.max_aliases}", cost)
+        if cost.cost > self.max_cost:
+            raise QueryTooComplex(f"query cost {cost.cost} exceeds the limit of {self.max_cost}; "
+                                  f"page large lists with `first`", cost)
+        return cost
+
+    def _selections(self, schema, parent_type, selection_set, fragments, variables,
+                    multiplier: int, page: Optional[int], depth: int, totals: _Totals):
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                self._field(schema, parent_type, selection, fragments, variables, multiplier, page, depth, totals)
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = schema.get_type(selection.type_condition.name.value) \
+                    if selection.type_condition else parent_type
+                self._selections(schema, fragment_type, selection.selection_set, fragments, variables,
+                                 multiplier, page, depth, totals)
+            elif isinstance(selection, FragmentSpreadNode) and selection.name.value in fragments:
+                fragment = fragments[selection.name.value]
+                self._selections(schema, schema.get_type(fragment.type_condition.name.value),
+                                 fragment.selection_set, fragments, variables, multiplier, page, depth, totals)
+
+    def _field(self, schema, parent_type, node: FieldNode, fragments, variables,
+               multiplier: int, page: Optional[int], depth: int, totals: _Totals):
+        name = node.name.value
+        field = getattr(parent_type, "fields", {}).get(name)
+        if name.startswith("__") or field is None:
+            return
+        totals.selections += 1
+        if totals.selections > self.max_selections:
+            raise QueryTooComplex(f"query selects more than {self.max_selections} fields", totals.result())
+        totals.depth = max(totals.depth, depth)
+        if node.alias:
+            totals.aliases += 1
+
+        key = f"{parent_type.name}.{name}"
+        field_type = field.type.of_type if isinstance(field.type, GraphQLNonNull) else field.type
+        named_type = get_named_type(field_type)
+        composite = is_composite_type(named_type)
+        count = multiplier
+        if isinstance(field_type, GraphQLList) and composite:
+            count *= page if page is not None else self.list_sizes.get(key, self.default_list_size)
+            page = None
+        totals.cost += self.field_costs.get(key, 1 if composite else 0) * count
+
+        if node.selection_set and composite:
+            arguments = {argument.name.value: value_from_ast_untyped(argument.value, variables)
+                         for argument in node.arguments or ()}
+            paging = page_size(arguments)
+            self._selections(schema, named_type, node.selection_set, fragments, variables,
+                             count, paging if paging is not None else page, depth + 1, totals)
+
+
+cost_analysis = CostAnalysis()
@@ -0,0 +1,189 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_right
+from os import getenv
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional
+from repository.snapshot import SnapshotRepository
+from service.generation import generation
+
+logger = logging.getLogger(__name__)
+
+READ_MODEL_ENABLED = (getenv("READ_MODEL_ENABLED") or "false").lower() in ("1", "true", "yes")
+# how old a snapshot may get before a request triggers a background reload
+READ_MODEL_TTL = float(getenv("READ_MODEL_TTL") or 300)
+MAIN_OBJECTIVES = ("mitigation", "adoptation")
+
+
+class Snapshot(NamedTuple):
+    # Rows are shaped like the repository results the resolvers return and
+    # are shared between requests, so treat them as read-only.
+    activities: tuple
+    activity_keys: tuple
+    activities_by_id: Mapping[str, dict]
+    activities_by_name: Mapping[str, dict]
+    sectors_by_name: Mapping[str, dict]
+    objectives_by_key: Mapping[str, dict]
+    main_objectives: tuple
+    main_objective_keys: tuple
+    main_objectives_by_activity: Mapping[str, tuple]
+    criteria_by_hash: Mapping[str, str]
+    loaded_at: float
+    # data generation the snapshot was read at, see service.generation
+    generation: int = 0
+
+    @staticmethod
+    def build(records: dict) -> "Snapshot":
+        sectors = {record["properties"]["name"]: {"id": str(record["id"]), **record["properties"]}
+                   for record in records["sectors"]}
+        objectives = {record["properties"]["key"]: {"id": str(record["id"]), **record["properties"]}
+                      for record in records["objectives"]}
+        activities = sorted(({"id": str(record["id"]), **record["properties"],
+                              "sector": sectors.get(record["sector"])}
+                             for record in records["activities"]),
+                            key=lambda activity: activity["name"])
+        activities_by_name = {activity["name"]: activity for activity in activities}
+        criteria = {record["hash"]: record["description"] for record in records["criteria"]}
+
+        dnsh_criteria: dict[str, list[str]] = {}
+        for record in records["dnsh_criteria"]:
+            dnsh_criteria.setdefault(record["objective"], []).append(record["hash"])
+        sc_criteria: dict[str, list[str]] = {}
+        for record in records["sc_criteria"]:
+            sc_criteria.setdefault(record["objective"], []).append(record["hash"])
+        dnsh: dict[str, list[dict]] = {}
+        for record in records["dnsh"]:
+            hashes = dnsh_criteria.get(record["dnsh_objective"], [])
+            dnsh.setdefault(record["objective"], []).append({
+                "objective": objectives.get(record["dnsh_objective"]),
+                "criteria": [criteria.get(hash) for hash in hashes],
+                "criteria_hashes": hashes,
+            })
+
+        main_objectives = []
+        main_objective_keys = []
+        by_activity: dict[str, list[dict]] = {}
+        # same order as ActivityRepository pages in, keyed (activity name, objective key)
+        for record in sorted(records["matches"], key=lambda record: (record["activity"], record["objective"])):
+            # matches written before they carried a summary fall back to
+            # their objective's DNSH and criteria
+            if record.get("dnsh_summary") is not None:
+                match_dnsh = [{"objective": objectives.get(entry["objective"]),
+                               "criteria": [criteria.get(hash) for hash in entry["criteria_hashes"]],
+                               "criteria_hashes": entry["criteria_hashes"]}
+                              for entry in json.loads(record["dnsh_summary"])]
+            else:
+                match_dnsh = dnsh.get(record["objective"], [])
+            hashes = record.get("sc_criteria_hashes")
+            if hashes is None:
+                hashes = sc_criteria.get(record["objective"], [])
+            row = {
+                "activity": activities_by_name.get(record["activity"]),
+                "objective": objectives.get(record["objective"]),
+                "activity_contribution_type": record["contribution_type"],
+                "contribution_description": record["description"],
+                "dnsh": match_dnsh,
+                "substantial_contribution_criteria": [criteria.get(hash) for hash in hashes],
+                "substantial_contribution_criteria_hashes": hashes,
+            }
+            main_objectives.append(row)
+            main_objective_keys.append((record["activity"], record["objective"]))
+            by_activity.setdefault(record["activity"], []).append(row)
+
+        return Snapshot(
+            activities=tuple(activities),
+            activity_keys=tuple(activity["name"] for activity in activities),
+            activities_by_id=MappingProxyType({activity["id"]: activity for activity in activities}),
+            activities_by_name=MappingProxyType(activities_by_name),
+            sectors_by_name=MappingProxyType(sectors),
+            objectives_by_key=MappingProxyType(objectives),
+            main_objectives=tuple(main_objectives),
+            main_objective_keys=tuple(main_objective_keys),
+            main_objectives_by_activity=MappingProxyType(
+                {name: tuple(rows) for name, rows in by_activity.items()}),
+            criteria_by_hash=MappingProxyType(criteria),
+            loaded_at=time.time(),
+        )
+
+    def get_activity(self, name: str) -> Optional[dict]:
+        return self.activities_by_name.get(name)
+
+    def get_activities(self, after: Optional[str] = None, limit: Optional[int] = None) -> list[dict]:
+        start = bisect_right(self.activity_keys, after) if after is not None else 0
+        return list(self.activities[start:start + limit if limit is not None else None])
+
+    def get_main_objectives_all(self, after: Optional[tuple] = None, limit: Optional[int] = None) -> list[dict]:
+        start = bisect_right(self.main_objective_keys, tuple(after)) if after is not None else 0
+        return list(self.main_objectives[start:start + limit if limit is not None else None])
+
+    def get_main_objectives_by_id(self, id: str) -> list[dict]:
+        activity = self.activities_by_id.get(str(id))
+        return self.get_main_objectives_by_name(activity["name"]) if activity else []
+
+    def get_main_objectives_by_name(self, name: str) -> list[dict]:
+        return [row for row in self.main_objectives_by_activity.get(name, ())
+                if row["objective"] and row["objective"]["key"] in MAIN_OBJECTIVES]
+
+    def get_criteria(self, hashes: list[str]) -> list[dict]:
+        return [{"hash": hash, "description": self.criteria_by_hash[hash]}
+                for hash in hashes if hash in self.criteria_by_hash]
+
+
+class ReadModel:
+    # Holds the current Snapshot. Loading builds a complete new snapshot and
+    # swaps the reference in one assignment, so readers never see a
+    # half-built one; Neo4j stays the source of truth.
+
+    def __init__(self, enabled: bool = READ_MODEL_ENABLED, ttl: float = READ_MODEL_TTL):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.db = None
+        self._snapshot: Optional[Snapshot] = None
+        self._reloading = threading.Lock()
+
+    @property
+    def snapshot(self) -> Optional[Snapshot]:
+        # until the first snapshot is in, requests are served from Neo4j
+        snapshot = self._snapshot
+        if snapshot and snapshot.generation != generation.current():
+            # a population, possibly run by another worker, changed the
+            # data; Neo4j answers until the new snapshot is in
+            self.reload_in_background()
+            return None
+        if snapshot is None and self.enabled or \
+                snapshot and time.time() - snapshot.loaded_at > self.ttl:
+            self.reload_in_background()
+        return snapshot
+
+    def bind(self, db):
+        # the snapshot is then loaded on first use or by load()
+        self.db = db
+
+    def load(self, db) -> Snapshot:
+        self.db = db
+        # read before the data, so a population finishing meanwhile is
+        # picked up by the next reload
+        current = generation.current()
+        snapshot = Snapshot.build(SnapshotRepository(db).load())._replace(generation=current)
+        self._snapshot = snapshot
+        return snapshot
+
+    def reload_in_background(self):
+        # stale-while-revalidate: at most one reload at a time, readers keep
+        # the old snapshot until the new one is swapped in
+        if self.db is None or not self._reloading.acquire(blocking=False):
+            return
+
+        def reload():
+            try:
+                self.load(self.db)
+            except Exception:
+                logger.exception("read model reload failed")
+            finally:
+                self._reloading.release()
+        threading.Thread(target=reload, name="read-model-reload", daemon=True).start()
+
+
+read_model = ReadModel()
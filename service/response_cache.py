@@ -0,0 +1,135 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from os import getenv
+from typing import NamedTuple, Optional
+from graphql import GraphQLError, OperationDefinitionNode, OperationType, parse, print_ast
+from service.documents import persisted_queries
+
+GRAPHQL_CACHE_ENABLED = (getenv("GRAPHQL_CACHE_ENABLED") or "true").lower() in ("1", "true", "yes")
+GRAPHQL_CACHE_TTL = float(getenv("GRAPHQL_CACHE_TTL") or 300)
+GRAPHQL_CACHE_MAX_ENTRIES = int(getenv("GRAPHQL_CACHE_MAX_ENTRIES") or 1000)
+GRAPHQL_CACHE_MAX_BYTES = int(getenv("GRAPHQL_CACHE_MAX_BYTES") or 64 * 1024 * 1024)
+# larger responses are served but not kept
+GRAPHQL_CACHE_MAX_ENTRY_BYTES = int(getenv("GRAPHQL_CACHE_MAX_ENTRY_BYTES") or 1024 * 1024)
+
+
+@lru_cache(maxsize=GRAPHQL_CACHE_MAX_ENTRIES)
+def normalized(query: str) -> Optional[str]:
+    # the document printed back from its AST, so whitespace, comments and
+    # formatting do not split the cache; None for anything but queries
+    try:
+        document = parse(query)
+    except GraphQLError:
+        return None
+    if any(isinstance(definition, OperationDefinitionNode) and definition.operation != OperationType.QUERY
+           for definition in document.definitions):
+        return None
+    return print_ast(document)
+
+
+def etag(body: bytes) -> str:
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    status: int
+    etag: str
+    expires: float
+
+
+class ResponseCache:
+    # LRU of serialized /graphql responses, bounded by entry count and total
+    # bytes, each entry living at most ttl seconds. Keys carry the data
+    # generation, so a population makes earlier entries unreachable and
+    # they age out.
+
+    def __init__(self, enabled: bool = GRAPHQL_CACHE_ENABLED, ttl: float = GRAPHQL_CACHE_TTL,
+                 max_entries: int = GRAPHQL_CACHE_MAX_ENTRIES, max_bytes: int = GRAPHQL_CACHE_MAX_BYTES,
+                 max_entry_bytes: int = GRAPHQL_CACHE_MAX_ENTRY_BYTES):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(data, generation: str) -> Optional[str]:
+        # None when the request is not a cacheable query
+        if not isinstance(data, dict):
+            return None
+        query = data.get("query")
+        if query is None:
+            # persisted queries may come as a hash only
+            persisted = (data.get("extensions") or {}).get("persistedQuery")
+            query = persisted_queries.get(persisted.get("sha256Hash")) if isinstance(persisted, dict) else None
+        document = normalized(query) if isinstance(query, str) else None
+        if document is None:
+            return None
+        key = json.dumps([document, data.get("operationName"), data.get("variables") or {}, generation],
+                         sort_keys=True, default=str)
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry.expires < time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, body: bytes, status: int) -> CachedResponse:
+        entry = CachedResponse(body, status, etag(body), time.time() + self.ttl)
+        if len(body) > self.max_entry_bytes:
+            return entry
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = entry
+            self.bytes += len(body)
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+        return entry
+
+    def _remove(self, key: str):
+        self.bytes -= len(self.entries.pop(key).body)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "maxEntries": self.max_entries,
+                "maxBytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+            }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,223 @@
+import fcntl
+import json
+import logging
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+from typing import Any, Optional
+from neo4j import READ_ACCESS
+from dao.database_factory import db
+from dao.instrumentation import Observation
+from service.metrics import db_hits
+
+logger = logging.getLogger(__name__)
+
+# off by default: a plan is captured by running the statement once more
+SLOW_QUERY_ENABLED = (os.getenv("SLOW_QUERY_ENABLED") or "false").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS") or 1000)
+# share of slow reads re-run to capture their plan
+SLOW_QUERY_PROFILE_RATE = float(os.getenv("SLOW_QUERY_PROFILE_RATE") or 1)
+# a statement's plan is captured at most this often per worker
+SLOW_QUERY_PROFILE_INTERVAL = float(os.getenv("SLOW_QUERY_PROFILE_INTERVAL") or 60)
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG") or os.path.join(tempfile.gettempdir(), "eu_taxonamy_slow_queries.jsonl")
+# the log keeps between one and two times this many bytes
+SLOW_QUERY_LOG_BYTES = int(os.getenv("SLOW_QUERY_LOG_BYTES") or 4 << 20)
+SLOW_QUERY_PARAM_CHARS = int(os.getenv("SLOW_QUERY_PARAM_CHARS") or 200)
+LIST_ITEMS = 3
+# captures waiting for the profiler; more are dropped
+PENDING = 16
+
+
+def redacted(value: Any, chars: int = SLOW_QUERY_PARAM_CHARS) -> Any:
+    # parameters as logged: long text cut, long lists (UNWIND batches) sampled
+    if isinstance(value, str):
+        return f"{value[:chars // 4]}... <{len(value)} chars>" if len(value) > chars else value
+    if isinstance(value, dict):
+        return {key: redacted(item, chars) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [redacted(item, chars) for item in value[:LIST_ITEMS]]
+        return items + [f"<{len(value)} items>"] if len(value) > LIST_ITEMS else items
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    return redacted(str(value), chars)
+
+
+def plan_tree(plan: Optional[dict]) -> Optional[dict]:
+    # the parts of a PROFILE plan worth reading, with no identifiers
+    if not plan:
+        return None
+    arguments = plan.get("args") or {}
+    node = {"operator": plan.get("operatorType"), "details": arguments.get("Details"),
+            "estimatedRows": arguments.get("EstimatedRows")}
+    for key in ("rows", "dbHits"):
+        if key in plan:
+            node[key] = plan[key]
+    node["children"] = [plan_tree(child) for child in plan.get("children") or ()]
+    return node
+
+
+class RingLog:
+    # JSON lines in `path`; once it outgrows max_bytes it becomes path.1,
+    # replacing the older half. Writers in every worker hold an flock.
+
+    def __init__(self, path: str = SLOW_QUERY_LOG, max_bytes: int = SLOW_QUERY_LOG_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def append(self, entry: dict):
+        line = json.dumps(entry, default=str) + "\n"
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a") as file:
+                    file.write(line)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def entries(self) -> list[dict]:
+        entries = []
+        for path in (self.path + ".1", self.path):
+            try:
+                with open(path) as file:
+                    for line in file:
+                        try:
+                            entries.append(json.loads(line))
+                        except ValueError:
+                            pass
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def clear(self):
+        for path in (self.path + ".1", self.path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class SlowQueryLog:
+    # A DatabaseFactory observer. Statements slower than the threshold are
+    # logged; the plan of a sample of the reads is captured by running them
+    # again under PROFILE on a background thread, outside the request.
+    # Writes are logged without a plan: the bulk UNWIND writes of every
+    # population cross the threshold routinely, and PROFILE would execute
+    # them a second time.
+
+    def __init__(self, db, log: RingLog = RingLog(), threshold_ms: float = SLOW_QUERY_MS,
+                 profile_rate: float = SLOW_QUERY_PROFILE_RATE,
+                 profile_interval: float = SLOW_QUERY_PROFILE_INTERVAL):
+        # db is the sync DatabaseFactory, also for statements the async one ran
+        self.db = db
+        self.log = log
+        self.threshold_ms = threshold_ms
+        self.profile_rate = profile_rate
+        self.profile_interval = profile_interval
+        self.profiled_at: dict[str, float] = {}
+        self.pending: queue.Queue = queue.Queue(PENDING)
+        self.worker: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+    def __call__(self, observation: Observation):
+        if observation.seconds * 1000 < self.threshold_ms:
+            return
+        entry = {
+            "at": time.time(),
+            "pid": os.getpid(),
+            "name": observation.name,
+            "query": observation.query,
+            "parameters": redacted(observation.parameters),
+            "seconds": observation.seconds,
+            "rows": observation.rows,
+            "error": str(observation.error) if observation.error is not None else None,
+            "queryType": getattr(observation.summary, "query_type", None),
+            "profile": None,
+        }
+        mode = self.plan_mode(observation)
+        if mode and self.due(observation.name):
+            try:
+                self.pending.put_nowait((entry, mode, observation.parameters))
+                self.start()
+                return
+            except queue.Full:
+                pass
+        self.write(entry)
+
+    def plan_mode(self, observation: Observation) -> Optional[str]:
+        query = observation.query.lstrip().upper()
+        if observation.summary is None or query.startswith(("PROFILE", "EXPLAIN", "SHOW", "CALL")):
+            return None
+        return "PROFILE" if observation.summary.query_type == "r" else None
+
+    def due(self, name: str) -> bool:
+        if random.random() >= self.profile_rate:
+            return False
+        now = time.time()
+        with self.lock:
+            if now - self.profiled_at.get(name, float("-inf")) < self.profile_interval:
+                return False
+            self.profiled_at[name] = now
+            return True
+
+    def start(self):
+        # lazily, so a forked worker gets a thread of its own
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self.run, name="slow-query-profiler", daemon=True)
+                self.worker.start()
+
+    def run(self):
+        while True:
+            entry, mode, parameters = self.pending.get()
+            try:
+                entry["profile"] = self.plan(mode, entry["query"], parameters)
+            except Exception as error:
+                entry["profile"] = {"mode": mode, "error": str(error)}
+            self.write(entry)
+
+    def plan(self, mode: str, query: str, parameters: dict) -> dict:
+        # straight on the driver, so the re-run is not itself observed
+        started = time.perf_counter()
+        with self.db.driver.session(default_access_mode=READ_ACCESS) as session:
+            summary = session.run(f"{mode} {query}", parameters).consume()
+        return {"mode": mode, "seconds": time.perf_counter() - started,
+                "dbHits": db_hits(summary.profile), "plan": plan_tree(summary.profile)}
+
+    def write(self, entry: dict):
+        try:
+            self.log.append(entry)
+        except OSError as error:
+            logger.warning("slow query log failed: %s", error)
+
+    def worst(self, limit: int = 20, by: str = "seconds") -> dict:
+        # the slowest captures (or those with the most db hits), and per
+        # statement name how often and how slow it has been
+        entries = self.log.entries()
+        key = (lambda entry: (entry.get("profile") or {}).get("dbHits") or 0) if by == "dbHits" \
+            else (lambda entry: entry["seconds"])
+        statements: dict[str, dict] = {}
+        for entry in entries:
+            statement = statements.setdefault(entry["name"], {"name": entry["name"], "count": 0,
+                                                              "totalSeconds": 0.0, "maxSeconds": 0.0,
+                                                              "maxDbHits": None, "lastAt": 0.0})
+            statement["count"] += 1
+            statement["totalSeconds"] += entry["seconds"]
+            statement["maxSeconds"] = max(statement["maxSeconds"], entry["seconds"])
+            statement["lastAt"] = max(statement["lastAt"], entry["at"])
+            hits = (entry.get("profile") or {}).get("dbHits")
+            if hits is not None:
+                statement["maxDbHits"] = max(statement["maxDbHits"] or 0, hits)
+        return {
+            "thresholdMs": self.threshold_ms,
+            "captured": len(entries),
+            "statements": sorted(statements.values(), key=lambda statement: statement["totalSeconds"],
+                                 reverse=True),
+            "worst": sorted(entries, key=key, reverse=True)[:limit],
+        }
+
+
+slow_queries = SlowQueryLog(db)
@@ -0,0 +1,160 @@
+import fcntl
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import NamedTuple, Optional
+from requests import RequestException
+
+logger = logging.getLogger(__name__)
+
+TAXONOMY_CACHE_DIR = os.getenv("TAXONOMY_CACHE_DIR") or os.path.join(
+    tempfile.gettempdir(), "eu_taxonamy_source")
+# import the cached copy without asking the server whether it changed
+TAXONOMY_OFFLINE = (os.getenv("TAXONOMY_OFFLINE") or "false").lower() in ("1", "true", "yes")
+# seconds the cached copy is used as is before it is revalidated
+TAXONOMY_CACHE_MAX_AGE = float(os.getenv("TAXONOMY_CACHE_MAX_AGE") or 0)
+TAXONOMY_FETCH_TIMEOUT = float(os.getenv("TAXONOMY_FETCH_TIMEOUT") or 60)
+
+
+class SourceUnavailable(Exception):
+    pass
+
+
+class Source(NamedTuple):
+    path: str
+    # whether this fetch replaced the cached copy with different content
+    changed: bool
+    # downloaded, not modified, fresh, offline or stale
+    origin: str
+    metadata: dict
+
+    def to_dict(self) -> dict:
+        return {
+            "origin": self.origin,
+            "changed": self.changed,
+            "etag": self.metadata.get("etag"),
+            "lastModified": self.metadata.get("last_modified"),
+            "sha256": self.metadata.get("sha256"),
+            "bytes": self.metadata.get("bytes"),
+            "fetchedAt": self.metadata.get("fetched_at"),
+            "checkedAt": self.metadata.get("checked_at"),
+        }
+
+
+class _Digesting:
+    # the file the response body is spooled to, hashing it on the way
+
+    def __init__(self, file):
+        self.file = file
+        self.digest = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, chunk: bytes):
+        self.digest.update(chunk)
+        self.bytes += len(chunk)
+        self.file.write(chunk)
+
+
+class SourceCache:
+    # The last taxonomy.json downloaded, gzip compressed under `directory`
+    # with its ETag and Last-Modified, so a restarted process or another
+    # worker revalidates it with a conditional GET instead of downloading it
+    # again. taxonomy.meta.json names the current copy and is only replaced
+    # once that copy is complete; the previous copy is kept, since an import
+    # reads its file more than once. Refreshes hold an flock, so workers
+    # refreshing at the same time download it once.
+
+    def __init__(self, directory: str = TAXONOMY_CACHE_DIR, offline: bool = TAXONOMY_OFFLINE,
+                 max_age: float = TAXONOMY_CACHE_MAX_AGE, timeout: float = TAXONOMY_FETCH_TIMEOUT):
+        self.directory = directory
+        self.offline = offline
+        self.max_age = max_age
+        self.timeout = timeout
+
+    @property
+    def metadata_path(self) -> str:
+        return os.path.join(self.directory, "taxonomy.meta.json")
+
+    def metadata(self) -> Optional[dict]:
+        # None when nothing usable is cached
+        try:
+            with open(self.metadata_path) as file:
+                metadata = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return metadata if os.path.exists(self._path(metadata)) else None
+
+    def _path(self, metadata: dict) -> str:
+        return os.path.join(self.directory, metadata["file"])
+
+    def fetch(self, integration, offline: Optional[bool] = None) -> Source:
+        offline = self.offline if offline is None else offline
+        if offline:
+            metadata = self.metadata()
+            if metadata is None:
+                raise SourceUnavailable(f"no taxonomy cached in {self.directory}, "
+                                        "set TAXONOMY_FILE to import a local copy")
+            return Source(self._path(metadata), False, "offline", metadata)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "refresh.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                return self._refresh(integration)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _refresh(self, integration) -> Source:
+        # read under the lock: another worker may have refreshed meanwhile
+        metadata = self.metadata()
+        if metadata is not None and time.time() - metadata["checked_at"] < self.max_age:
+            return Source(self._path(metadata), False, "fresh", metadata)
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".part", delete=False) as temp:
+            try:
+                # mtime=0 keeps the compressed copy of the same body identical
+                with gzip.GzipFile(fileobj=temp, mode="wb", compresslevel=6, mtime=0) as file:
+                    body = _Digesting(file)
+                    validators = integration.revalidate_eu_taxonamy(body, metadata or {}, timeout=self.timeout)
+            except RequestException as error:
+                os.remove(temp.name)
+                if metadata is None:
+                    raise SourceUnavailable(f"taxonomy download failed and none is cached: {error}") from error
+                logger.warning("taxonomy download failed, importing the cached copy: %s", error)
+                return Source(self._path(metadata), False, "stale", metadata)
+            except BaseException:
+                os.remove(temp.name)
+                raise
+        now = time.time()
+        if validators is None:
+            os.remove(temp.name)
+            metadata = {**metadata, "checked_at": now}
+            self._save(metadata)
+            return Source(self._path(metadata), False, "not modified", metadata)
+        sha256 = body.digest.hexdigest()
+        # a server that sends no validators answers 200 every time, the digest
+        # still tells whether the content changed
+        changed = metadata is None or metadata["sha256"] != sha256
+        name = f"taxonomy-{sha256[:16]}.json.gz"
+        os.replace(temp.name, os.path.join(self.directory, name))
+        previous = metadata["file"] if metadata else None
+        metadata = {**validators, "file": name, "sha256": sha256, "bytes": body.bytes,
+                    "fetched_at": now if changed else metadata["fetched_at"], "checked_at": now}
+        self._save(metadata)
+        self._prune(keep={name, previous})
+        return Source(self._path(metadata), changed, "downloaded", metadata)
+
+    def _save(self, metadata: dict):
+        with tempfile.NamedTemporaryFile("w", dir=self.directory, delete=False) as file:
+            json.dump(metadata, file)
+        os.replace(file.name, self.metadata_path)
+
+    def _prune(self, keep: set):
+        for name in os.listdir(self.directory):
+            if name.startswith("taxonomy-") and name.endswith(".json.gz") and name not in keep:
+                os.remove(os.path.join(self.directory, name))
+
+
+source_cache = SourceCache()
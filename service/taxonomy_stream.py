@@ -0,0 +1,101 @@
+import codecs
+import gzip
+import json
+from typing import Any, Iterable, Iterator
+
+_decoder = json.JSONDecoder()
+_whitespace = " \t\n\r"
+
+
+class _Reader:
+    # a growing window over a stream of text chunks that hands out one JSON
+    # value at a time, keeping only the unread tail in memory
+
+    def __init__(self, chunks: Iterable[str]):
+        self.chunks = iter(chunks)
+        self.buffer = ""
+        self.pos = 0
+        self.exhausted = False
+
+    def _fill(self) -> bool:
+        if self.exhausted:
+            return False
+        for chunk in self.chunks:
+            if chunk:
+                self.buffer = self.buffer[self.pos:] + chunk
+                self.pos = 0
+                return True
+        self.exhausted = True
+        return False
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _whitespace:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise ValueError("unexpected end of taxonomy document")
+
+    def expect(self, token: str) -> str:
+        char = self.peek()
+        if char not in token:
+            raise ValueError(
+                f"expected {token!r} at offset {self.pos}, got {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                # a number cut at the chunk boundary still decodes, so only
+                # trust a value that is followed by more input
+                if end < len(self.buffer) or self.exhausted:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+            self._fill()
+
+
+def iter_taxonomy(chunks: Iterable[str]) -> Iterator[tuple[str, Any]]:
+    # yields (section, item) for every element of the top-level arrays
+    # ("sectors", "objectives", "activities", "matches", ...)
+    reader = _Reader(chunks)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        section = reader.value()
+        reader.expect(":")
+        if reader.peek() == "[":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.expect("]")
+            else:
+                while True:
+                    yield section, reader.value()
+                    if reader.expect(",]") == "]":
+                        break
+        else:
+            reader.value()
+        if reader.expect(",}") == "}":
+            return
+
+
+def iter_file_chunks(path: str, chunk_size: int = 1 << 16) -> Iterator[str]:
+    # gzip compressed documents, like the source cache's copy, are read as is
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as file:
+        compressed = file.read(2) == b"\x1f\x8b"
+    with (gzip.open if compressed else open)(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
+def iter_taxonomy_file(path: str, chunk_size: int = 1 << 16) -> Iterator[tuple[str, Any]]:
+    return iter_taxonomy(iter_file_chunks(path, chunk_size))
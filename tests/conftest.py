@@ -0,0 +1,35 @@
+import os
+import sys
+import pytest
+from ariadne import load_schema_from_path, make_executable_schema
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the modules are imported from the repository root, as the servers do
+sys.path.insert(0, ROOT)
+
+OBJECTIVES = ("mitigation", "adoptation", "water", "pollution")
+
+
+@pytest.fixture(scope="session")
+def schema():
+    return make_executable_schema(load_schema_from_path(os.path.join(ROOT, "schema", "eu_taxonamy.graphql")))
+
+
+@pytest.fixture
+def taxonomy() -> dict:
+    # a small taxonomy.json shaped document: activities share their sector
+    # and DNSH criteria, the way the published one does
+    activities = [{"name": f"{index}.1 Activity {index}", "description": f"Activity {index}",
+                   "reference": float(f"{index}.1"), "sector": f"Sector {index % 2}",
+                   "nace_codes": [f"C{20 + index}.1"]} for index in range(1, 5)]
+    matches = [{"activity": activity["name"], "objective": objective,
+                "activity_contribution_type": "enabling" if objective == "mitigation" else None,
+                "contribution_description": f"{activity['name']} contributes",
+                "dnsh": [{"objective": key, "criteria": [f"DNSH {key} {number}" for number in range(2)]}
+                         for key in OBJECTIVES if key != objective],
+                "substantial_contribution_criteria": [f"SC {activity['name']} {objective}"]}
+               for activity in activities for objective in OBJECTIVES[:2]]
+    return {"sectors": [{"name": f"Sector {index}", "reference": index} for index in range(2)],
+            "objectives": [{"name": key.title(), "long_name": f"{key.title()} objective", "key": key}
+                           for key in OBJECTIVES],
+            "activities": activities, "matches": matches}
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import pytest
+import asgi
+from dao.database_factory import AsyncDatabaseFactory
+from service.read_model import read_model
+
+
+class Database(AsyncDatabaseFactory):
+    # answers the queries below after a delay, counting those in flight
+    def __init__(self):
+        super().__init__("bolt://localhost", "neo4j", "secret")
+        self.queries = []
+        self.running = 0
+        self.peak = 0
+
+    async def execute_read(self, query, statement, params):
+        self.queries.append(statement)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.02)
+        self.running -= 1
+        if "ORDER BY activity.name" in statement:
+            return [{"activity": {"id": id, "name": f"A{id}"}} for id in range(params["limit"])]
+        if "sector.reference" in statement:
+            return [{"activity_name": name, "id": 1, "name": "Sector " + name, "reference": 1}
+                    for name in params["names"]]
+        if "nace_codes" in statement:
+            return [{"name": name, "nace_codes": ["C1"]} for name in params["names"]]
+        return [{"hash": hash, "description": "criteria " + hash} for hash in params["hashes"]]
+
+
+async def post(body) -> tuple[int, object]:
+    messages = [{"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+    await asgi.app({"type": "http", "method": "POST", "path": "/graphql", "query_string": b"", "root_path": "",
+                    "headers": [(b"content-type", b"application/json")], "scheme": "http",
+                    "server": ("testserver", 80), "client": ("client", 1), "http_version": "1.1"},
+                   receive, send)
+    return sent[0]["status"], json.loads(b"".join(message.get("body", b"") for message in sent[1:]))
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = Database()
+    monkeypatch.setattr(read_model, "_snapshot", None)
+    monkeypatch.setattr(read_model, "enabled", False)
+    monkeypatch.setattr(asgi.graphql.http_handler, "context_value",
+                        lambda request: asgi.context(request, database))
+    return database
+
+
+QUERY = ('{ listActivities(first: 3) { activities { name sector { name } nace { nace } } } '
+         'getCriteria(hashes: ["h1"]) { criteria { description } } }')
+
+
+def test_fields_are_fetched_concurrently_and_batched(database):
+    status, result = asyncio.run(post({"query": QUERY}))
+    assert status == 200
+    assert result["data"]["listActivities"]["activities"][0] == \
+        {"name": "A0", "sector": {"name": "Sector A0"}, "nace": {"nace": "C1"}}
+    assert result["data"]["getCriteria"]["criteria"] == [{"description": "criteria h1"}]
+    # one query per list and per nested field, the root fields side by side
+    assert len(database.queries) == 4
+    assert database.peak >= 2
+
+
+
+def test_batch_operations_share_loaders(database):
+    status, results = asyncio.run(post([{"query": QUERY}, {"query": QUERY}]))
+    assert status == 200
+    assert results[0] == results[1]
+    # the second operation's sectors and nace codes come from the first's lookups
+    assert len([query for query in database.queries if "UNWIND $names" in query]) == 2
@@ -0,0 +1,51 @@
+import pytest
+from graphql import GraphQLError
+from benchmark.load import in_process_client
+from service import documents
+from service.documents import batch_context, check_batch
+
+ACTIVITIES = {"query": "{ listActivities(first: 2) { success activities { name } } }"}
+
+
+@pytest.fixture(scope="module")
+def post():
+    return in_process_client(0.05, 1, cache=False)()
+
+
+def test_batch_size_is_checked(monkeypatch):
+    monkeypatch.setattr(documents, "GRAPHQL_BATCH_MAX", 2)
+    check_batch([ACTIVITIES, ACTIVITIES])
+    with pytest.raises(GraphQLError, match="no operations"):
+        check_batch([])
+    with pytest.raises(GraphQLError, match="the limit is 2"):
+        check_batch([ACTIVITIES] * 3)
+
+
+def test_operations_share_loaders_but_not_failures():
+    shared = {"loaders": object()}
+    first, second = batch_context(shared), batch_context(shared)
+    assert first["loaders"] is second["loaders"]
+    first["failures"] = 1
+    assert "failures" not in second and "failures" not in shared
+
+
+def test_results_come_back_in_order(post):
+    single = post(ACTIVITIES).body
+    names = {"query": "{ listActivities(first: 1) { activities { name } } }"}
+    response = post([ACTIVITIES, names, ACTIVITIES])
+    assert response.status == 200
+    assert response.body[0] == response.body[2] == single
+    assert response.body[1]["data"]["listActivities"]["activities"] == single["data"]["listActivities"]["activities"][:1]
+
+
+def test_a_failing_operation_only_fails_itself(post):
+    response = post([ACTIVITIES, {"query": "{ noSuchField }"}])
+    assert response.status == 200
+    assert response.body[0]["data"]["listActivities"]["success"] is True
+    assert response.body[1]["errors"]
+
+
+def test_empty_batch_is_rejected(post):
+    response = post([])
+    assert response.status == 400
+    assert response.body["errors"][0]["message"] == "batch has no operations"
@@ -0,0 +1,21 @@
+from benchmark import run, synthetic
+from service.generation import generation
+
+
+def test_synthetic_taxonomy_is_reproducible():
+    assert synthetic.taxonomy(0.2, seed=1) == synthetic.taxonomy(0.2, seed=1)
+    assert synthetic.taxonomy(0.2, seed=1) != synthetic.taxonomy(0.2, seed=2)
+    small, large = synthetic.taxonomy(0.1), synthetic.taxonomy(0.5)
+    assert len(small["activities"]) == 10 and len(large["activities"]) == 50
+    assert {match["activity"] for match in small["matches"]} == {activity["name"] for activity in small["activities"]}
+
+
+def test_run_reports_every_target_and_scale(tmp_path, monkeypatch):
+    monkeypatch.setattr(generation, "path", str(tmp_path / "generation"))
+    results = run.main(["--scale", "0.1", "0.2", "--repeat", "1", "--json", str(tmp_path / "results.json")])
+    assert [(result["target"], result["scale"]) for result in results] == [
+        ("persist_to_db", 0.1), ("populate_database", 0.1), ("persist_to_db", 0.2), ("populate_database", 0.2)]
+    persist = results[0]
+    assert persist["transactions"] == 1
+    assert persist["round_trips"] > 0 and persist["peak_memory_bytes"] > 0
+    assert (tmp_path / "results.json").exists()
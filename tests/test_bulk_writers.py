@@ -0,0 +1,34 @@
+from math import ceil
+from dao.batch import batched
+from service.integration import Integration
+
+
+class Transaction:
+    def __init__(self):
+        self.statements = {}
+
+    def run(self, query, parameters=None, **kwargs):
+        statement = " ".join(query.split())
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batched([], 2)) == []
+
+
+def test_import_sends_one_statement_per_batch(taxonomy):
+    whole, batched_by_five = Transaction(), Transaction()
+    Integration.persist_to_db(whole, taxonomy)
+    Integration.persist_to_db(batched_by_five, taxonomy, 5)
+    # one round trip per writer, whatever the taxonomy holds
+    assert all(statement.startswith("UNWIND $") for statement in whole.statements)
+    assert set(whole.statements.values()) == {1}
+    [criteria] = [count for statement, count in batched_by_five.statements.items() if "Criteria{" in statement]
+    assert criteria == ceil(len(Integration.relationship_rows(taxonomy)["criteria"]) / 5)
+
+
+def test_shared_criteria_are_written_once(taxonomy):
+    rows = Integration.relationship_rows(taxonomy)
+    assert len(rows["criteria"]) == len(set(rows["criteria"]))
+    assert len(rows["dnsh_objectives"]) == 2 * 3
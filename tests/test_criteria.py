@@ -0,0 +1,40 @@
+from dao.fingerprint import criteria_hash
+from repository.criteria import CriteriaRepository
+from service.integration import Integration
+
+LONG = "Criteria text " * 500
+
+
+class Transaction:
+    def __init__(self):
+        self.statements = []
+
+    def run(self, statement, **params):
+        self.statements.append(statement)
+
+
+def match(objective: str) -> dict:
+    return {"activity": "A", "objective": objective, "activity_contribution_type": "enabling",
+            "contribution_description": None, "dnsh": [{"objective": "water", "criteria": [LONG]}],
+            "substantial_contribution_criteria": [LONG]}
+
+
+def test_criteria_are_keyed_by_a_short_hash():
+    assert criteria_hash(LONG) == criteria_hash("Criteria text " * 500)
+    assert criteria_hash(LONG) != criteria_hash(LONG + ".")
+    assert len(criteria_hash(LONG)) == 32
+    row = CriteriaRepository.params(LONG)
+    assert row["hash"] == criteria_hash(LONG) and row["description"] == LONG
+
+
+def test_each_description_is_written_once():
+    rows = Integration.relationship_rows({"activities": [], "matches": [match("mitigation"), match("adoptation")]})
+    assert rows["criteria"] == [LONG]
+    assert {row["criteria_hash"] for row in rows["dnsh_criteria"] + rows["sc_criteria"]} == {criteria_hash(LONG)}
+
+
+def test_nodes_are_merged_on_the_hash():
+    tx = Transaction()
+    CriteriaRepository.bulk_create_query(tx, [LONG, "short"])
+    [statement] = tx.statements
+    assert "MERGE (criteria:Criteria{hash:row.hash})" in statement
@@ -0,0 +1,119 @@
+import gc
+import weakref
+import pytest
+from neo4j import READ_ACCESS, WRITE_ACCESS
+from dao import database_factory
+from dao.database_factory import DatabaseFactory
+
+
+class Session:
+    def __init__(self, driver, default_access_mode=WRITE_ACCESS):
+        self.driver = driver
+        self.access_mode = default_access_mode
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute_read(self, query, *args):
+        self.driver.units.append(("read", self.access_mode))
+        return query(None, *args)
+
+    def execute_write(self, query, *args):
+        self.driver.units.append(("write", self.access_mode))
+        return query(None, *args)
+
+
+class Driver:
+    # like neo4j's driver, closes its pool when it is garbage collected
+    def __init__(self, number: int, closes: list, uri, auth=None, **config):
+        self.number = number
+        self.closes = closes
+        self.uri = uri
+        self.config = config
+        self.units = []
+        self.closed = False
+
+    def session(self, **config):
+        return Session(self, **config)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.closes.append(self.number)
+
+    def __del__(self):
+        self.close()
+
+
+@pytest.fixture
+def drivers(monkeypatch):
+    # weak references, so that a driver nothing else holds is collected
+    created, closes = [], []
+
+    def driver(uri, **config):
+        instance = Driver(len(created), closes, uri, **config)
+        created.append(weakref.ref(instance))
+        return instance
+    monkeypatch.setattr(database_factory.GraphDatabase, "driver", driver)
+    return created, closes
+
+
+def test_reads_and_writes_use_their_access_mode(drivers):
+    db = DatabaseFactory("neo4j://cluster", "neo4j", "secret", max_connection_pool_size=5)
+    assert db.execute_read(lambda tx, value: value, 1) == 1
+    db.execute_write(lambda tx: None)
+    db.execute_query(lambda tx: None)
+    [driver] = [ref() for ref in drivers[0]]
+    assert driver.config == {"max_connection_pool_size": 5}
+    assert driver.units == [("read", READ_ACCESS), ("write", WRITE_ACCESS), ("write", WRITE_ACCESS)]
+
+
+
+def test_driver_is_created_on_first_use(drivers):
+    created, _ = drivers
+    db = DatabaseFactory("bolt://localhost", "neo4j", "secret")
+    assert created == []
+    db.execute_read(lambda tx: None)
+    db.execute_read(lambda tx: None)
+    assert len(created) == 1
+
+
+def test_forked_worker_builds_its_own_driver(drivers):
+    created, closes = drivers
+    db = DatabaseFactory("bolt://localhost", "neo4j", "secret")
+    db.execute_read(lambda tx: None)
+    db._after_fork()
+    gc.collect()
+    # the inherited driver is neither closed nor collected, either of which
+    # would end connections the parent still uses
+    assert closes == []
+    db.execute_read(lambda tx: None)
+    inherited, own = [ref() for ref in created]
+    assert inherited is not None and inherited.units == [("read", READ_ACCESS)]
+    assert len(own.units) == 1
+    db.close()
+    assert closes == [own.number]
+
+
+class Database:
+    def __init__(self):
+        self.calls = []
+
+    def execute_read(self, query, *args):
+        self.calls.append(("read", query.__name__))
+
+    def execute_write(self, query, *args):
+        self.calls.append(("write", query.__name__))
+
+
+def test_code_repository_reads_in_read_transactions():
+    from repository.code import ActivityRepository
+    db = Database()
+    repository = ActivityRepository(db)
+    repository.get_by_id("1")
+    repository.get_all()
+    repository.delete_by_id("1")
+    assert db.calls == [("read", "_get_query"), ("read", "_get_all_query"), ("write", "_delete_query")]
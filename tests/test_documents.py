@@ -0,0 +1,80 @@
+import json
+import pytest
+from graphql import GraphQLError
+from service.documents import DocumentCache, PersistedQueries, query_hash
+
+QUERY = "{ listActivities { activities { name } } }"
+HASH = query_hash(QUERY)
+
+
+def persisted(hash: str = HASH, **data) -> dict:
+    return {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": hash}}, **data}
+
+
+def test_unknown_hash_asks_for_the_query():
+    with pytest.raises(GraphQLError, match="PersistedQueryNotFound") as error:
+        PersistedQueries().resolve(persisted())
+    assert error.value.extensions["code"] == "PERSISTED_QUERY_NOT_FOUND"
+
+
+def test_query_sent_with_its_hash_is_registered():
+    queries = PersistedQueries()
+    assert queries.resolve(persisted(query=QUERY))["query"] == QUERY
+    assert queries.resolve(persisted())["query"] == QUERY
+
+
+def test_hash_must_match_the_query():
+    with pytest.raises(GraphQLError) as error:
+        PersistedQueries().resolve(persisted("0" * 64, query=QUERY))
+    assert error.value.extensions["code"] == "PERSISTED_QUERY_HASH_MISMATCH"
+
+
+def test_registered_queries_are_bounded():
+    queries = PersistedQueries(max_entries=1)
+    queries.register("a", "{ a }")
+    queries.register("b", "{ b }")
+    assert queries.get("a") is None
+    assert queries.get("b") == "{ b }"
+
+
+def test_allowlist(tmp_path):
+    path = tmp_path / "queries.json"
+    path.write_text(json.dumps([QUERY]))
+    queries = PersistedQueries(str(path), allowlist_only=True)
+    assert queries.resolve(persisted())["query"] == QUERY
+    assert queries.resolve({"query": QUERY})["query"] == QUERY
+    with pytest.raises(GraphQLError) as error:
+        queries.resolve({"query": "{ listActivities { success } }"})
+    assert error.value.extensions["code"] == "PERSISTED_QUERY_NOT_ALLOWED"
+
+
+def test_allowlist_hashes_are_checked(tmp_path):
+    path = tmp_path / "queries.json"
+    path.write_text(json.dumps({"0" * 64: QUERY}))
+    with pytest.raises(ValueError):
+        PersistedQueries(str(path))
+
+
+def test_documents_are_parsed_and_validated_once(schema):
+    cache = DocumentCache()
+    parsed = cache.get(schema, QUERY)
+    assert parsed.errors == []
+    assert cache.get(schema, QUERY) is parsed
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_validation_errors_are_cached(schema):
+    cache = DocumentCache(max_entries=1)
+    parsed = cache.get(schema, "{ noSuchField }")
+    assert parsed.errors
+    assert cache.get(schema, "{ noSuchField }") is parsed
+    cache.get(schema, QUERY)
+    assert cache.stats()["entries"] == 1
+
+
+def test_syntax_errors_are_not_cached(schema):
+    cache = DocumentCache()
+    with pytest.raises(GraphQLError):
+        cache.get(schema, "{ broken")
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,77 @@
+import gzip
+import json
+from neo4j import Record
+from dao.fingerprint import criteria_hash
+from repository.activity import ActivityRepository
+from service.export import ndjson
+from service.integration import Integration
+
+
+class Result:
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+
+    def data(self) -> list[dict]:
+        return self.rows
+
+    def __iter__(self):
+        return (Record(row) for row in self.rows)
+
+
+class Transaction:
+    # answers the objectives, criteria and matches queries in turn
+    def __init__(self, objectives: list[dict], criteria: list[dict], matches: list[dict]):
+        self.results = [objectives, criteria, matches]
+        self.queries = []
+
+    def run(self, query, params=None):
+        self.queries.append(query)
+        return Result(self.results[len(self.queries) - 1])
+
+
+MATCH = {"activity": "A", "objective": "mitigation", "activity_contribution_type": "enabling",
+         "contribution_description": "d", "dnsh": [{"objective": "water", "criteria": ["no harm"]}],
+         "substantial_contribution_criteria": ["sc"]}
+WATER = {"key": "water", "name": "Water"}
+
+
+def record(**columns) -> dict:
+    return {"activity": {"name": "A"}, "objective": {"key": "mitigation"},
+            "activity_contribution_type": "enabling", "contribution_description": "d", **columns}
+
+
+def test_export_streams_one_record_per_match():
+    rows = [record(activity={"name": name}, dnsh_summary=None, sc_criteria_hashes=None, dnsh=[],
+                   substantial_contribution_criteria=[]) for name in "AB"]
+    exported = ActivityRepository._export_query(Transaction([], [], rows), {})
+    assert next(exported)["activity"] == {"name": "A"}
+    assert [row["activity"] for row in exported] == [{"name": "B"}]
+
+
+def test_export_resolves_the_match_summary():
+    criteria = [{"hash": criteria_hash(text), "description": text} for text in ("no harm", "sc")]
+    tx = Transaction([{"key": "water", "objective": WATER}], criteria,
+                     [record(**Integration.match_summary(MATCH), dnsh=None, substantial_contribution_criteria=None)])
+    [exported] = ActivityRepository._export_query(tx, {})
+    assert exported["dnsh"] == [{"objective": WATER, "criteria": ["no harm"]}]
+    assert exported["substantial_contribution_criteria"] == ["sc"]
+    assert "dnsh_summary" not in exported and "sc_criteria_hashes" not in exported
+    assert "CASE WHEN matches.dnsh_summary IS NULL" in tx.queries[2]
+
+
+def test_export_falls_back_to_the_graph_without_a_summary():
+    dnsh = [{"objective": WATER, "criteria": ["from the graph"]}]
+    tx = Transaction([], [], [record(dnsh_summary=None, sc_criteria_hashes=None, dnsh=dnsh,
+                                     substantial_contribution_criteria=["sc"])])
+    [exported] = ActivityRepository._export_query(tx, {})
+    assert exported["dnsh"] == dnsh and exported["substantial_contribution_criteria"] == ["sc"]
+
+
+def test_ndjson_chunks_and_gzip():
+    records = [{"n": number} for number in range(100)]
+    chunks = list(ndjson(records, chunk_bytes=100))
+    # the first record goes out on its own, the rest in chunks of about 100 bytes
+    assert chunks[0] == b'{"n":0}\n' and len(chunks) > 2
+    lines = b"".join(chunks).splitlines()
+    assert [json.loads(line) for line in lines] == records
+    assert gzip.decompress(b"".join(ndjson(records, compress=True))) == b"".join(chunks)
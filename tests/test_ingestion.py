@@ -0,0 +1,190 @@
+import json
+import threading
+from zlib import crc32
+from dao.fingerprint import fingerprinted
+from repository.criteria import CriteriaRepository
+from service import ingestion
+from service.ingestion import CONTRIBUTION_MATCHES, DNSH_CRITERIA, DNSH_OBJECTIVES, PHASES, SC_CRITERIA, \
+    SECTOR_ACTIVITIES, Incremental, Ingestion, RecentKeys, Stage, changed, plan, populate_database, stream_plan
+from service.generation import Generation
+from service.integration import Integration
+from service.jobs import PopulationJob
+
+RELATIONSHIPS = (SECTOR_ACTIVITIES, CONTRIBUTION_MATCHES, DNSH_OBJECTIVES, DNSH_CRITERIA, SC_CRITERIA)
+
+
+class Database:
+    # stands in for DatabaseFactory, keeping the chunks each writer was given
+    def __init__(self):
+        self.chunks = []
+        self.queries = []
+        self.lock = threading.Lock()
+
+    def execute_write(self, query, rows, *args):
+        with self.lock:
+            # the chunk writers are also passed a batch size
+            if args:
+                self.chunks.append((query, list(rows)))
+            else:
+                self.queries.append(query)
+
+
+def write(tmp_path, data) -> str:
+    path = tmp_path / "taxonomy.json"
+    path.write_text(json.dumps(data))
+    return str(path)
+
+
+def totals(stages) -> dict:
+    return {name: count for stage in stages for name, count in stage.totals.items()}
+
+
+def written(stages) -> dict:
+    counts = {}
+    for stage in stages:
+        for phase, _ in stage.rows:
+            counts[phase.name] = counts.get(phase.name, 0) + 1
+    return counts
+
+
+def test_every_row_is_written_once(taxonomy):
+    db = Database()
+    Ingestion(db, workers=3, chunk_size=4).run(taxonomy)
+    for stage in plan(taxonomy):
+        for phase, row in stage.rows:
+            assert sum(rows.count(row) for writer, rows in db.chunks if writer is phase.writer) == 1
+
+
+def test_stream_plan_totals_match_its_rows_and_the_whole_document_plan(tmp_path, taxonomy):
+    path = write(tmp_path, taxonomy)
+    assert totals(stream_plan(path)) == written(stream_plan(path)) == totals(plan(taxonomy))
+
+
+def test_dedup_window_bounds_memory_and_only_repeats_rows(tmp_path, taxonomy):
+    path = write(tmp_path, taxonomy)
+    unbounded, bounded = totals(stream_plan(path)), totals(stream_plan(path, max_keys=2))
+    assert bounded["criteria"] > unbounded["criteria"]
+    assert bounded["activities"] == unbounded["activities"]
+    keys = RecentKeys(2)
+    assert [keys.first_seen(key) for key in "abab"] == [True, True, False, False]
+    assert keys.first_seen("c") and keys.first_seen("a") and len(keys.keys) == 2
+
+
+def test_streamed_import_reports_totals_and_eta(tmp_path, taxonomy):
+    path = write(tmp_path, taxonomy)
+    job = PopulationJob(str(tmp_path))
+    Ingestion(Database(), workers=2, chunk_size=5, progress=job).run_stream(path)
+    status = job.to_dict()
+    assert status["rowsTotal"] and status["rowsWritten"] == status["rowsTotal"]
+    job.rows_written = {phase: count // 2 for phase, count in status["rowsTotal"].items()}
+    assert job.to_dict()["eta"] is not None
+
+
+def test_relationship_chunks_lock_their_nodes_in_order(tmp_path, taxonomy):
+    db = Database()
+    Ingestion(db, workers=3, chunk_size=4).run_stream(write(tmp_path, taxonomy))
+    for phase in RELATIONSHIPS:
+        chunks = [rows for writer, rows in db.chunks if writer is phase.writer]
+        assert chunks
+        for rows in chunks:
+            assert rows == sorted(rows, key=phase.lock_order)
+
+
+def test_dnsh_objectives_share_one_partition(taxonomy):
+    rows = [row for stage in plan(taxonomy) for phase, row in stage.rows if phase is DNSH_OBJECTIVES]
+    # either end may be another partition's hub
+    assert len({crc32(DNSH_OBJECTIVES.lock_key(row).encode()) % 4 for row in rows}) == 1
+
+
+def match(activity: str, objective: str, contribution_type=None, description="d") -> dict:
+    return {"activity": activity, "objective": objective, "activity_contribution_type": contribution_type,
+            "contribution_description": description, "dnsh": [], "substantial_contribution_criteria": []}
+
+
+def test_repeated_identical_match_is_written_once(tmp_path, taxonomy):
+    data = {**taxonomy, "matches": [match("A", "water"), match("A", "water"), match("A", "pollution")]}
+    assert len(Integration.relationship_rows(data)["contribution_matches"]) == 2
+    assert totals(stream_plan(write(tmp_path, data)))["contribution_matches"] == 2
+
+
+def test_differing_match_for_the_same_pair_keeps_the_first(tmp_path, taxonomy, caplog):
+    data = {**taxonomy, "matches": [match("A", "water", "enabling"), match("A", "water", "transitional")]}
+    [row] = Integration.relationship_rows(data)["contribution_matches"]
+    assert row["contribution_type"] == "enabling"
+    assert "'A' matches objective 'water' again" in caplog.text
+    streamed = [row for stage in stream_plan(write(tmp_path, data))
+                for phase, row in stage.rows if phase is CONTRIBUTION_MATCHES]
+    assert streamed == [row]
+
+
+class GraphDatabase(Database):
+    # answers Incremental's fingerprint reads with the given rows per phase
+    def __init__(self, existing: dict):
+        super().__init__()
+        self.existing = existing
+
+    def execute_read(self, reader):
+        phase = next(phase for phase in PHASES if phase.reader is reader)
+        return self.existing.get(phase.name, [])
+
+
+def graph(data) -> dict:
+    # the fingerprints a full import of data leaves in the graph
+    return {phase.name: [phase.params(item) for stage in plan(data) for row_phase, item in stage.rows
+                         if row_phase is phase]
+            for phase in PHASES}
+
+
+def test_incremental_writes_only_what_changed(taxonomy):
+    data = {**taxonomy, "matches": [match("A", "water"), match("B", "water"), match("C", "water")]}
+    rows = {row["activity_name"]: fingerprinted(row) for row in Integration.relationship_rows(data)["contribution_matches"]}
+    existing = {"contribution_matches": [
+        rows["A"],
+        {**rows["B"], "content_hash": "stale"},
+        {"activity_name": "Z", "objective_key": "water", "content_hash": "gone"},
+    ]}
+    diff = Incremental(GraphDatabase(existing), [CONTRIBUTION_MATCHES])
+    stage = Stage("relationships", [(CONTRIBUTION_MATCHES, row) for row in rows.values()],
+                  {"contribution_matches": 3})
+    relationships, deletions = diff.apply([stage])
+    assert relationships.totals == {"contribution_matches": 2}
+    assert deletions.totals == {"contribution_matches_deleted": 1}
+    assert [row["activity_name"] for _, row in relationships.rows] == ["B", "C"]
+    assert [row for _, row in deletions.rows] == [{"activity_name": "Z", "objective_key": "water"}]
+    assert diff.summary["contribution_matches"] == {"inserted": 1, "updated": 1, "deleted": 1, "unchanged": 1}
+
+
+def test_incremental_totals_count_the_rows_written(tmp_path, taxonomy):
+    existing = graph(taxonomy)
+    existing["activities"] = existing["activities"][1:]
+    db = GraphDatabase(existing)
+    job = PopulationJob(str(tmp_path))
+    diff = Ingestion(db, workers=2, chunk_size=5, progress=job).run_stream(write(tmp_path, taxonomy), True)
+    assert diff["activities"]["inserted"] == 1
+    status = job.to_dict()
+    for rows in (status["rowsTotal"], status["rowsWritten"]):
+        assert {phase: count for phase, count in rows.items() if count} == {"activities": 1}
+    assert sum(len(rows) for _, rows in db.chunks) == 1
+
+
+def test_incremental_run_without_changes_writes_nothing(tmp_path, taxonomy):
+    db = GraphDatabase(graph(taxonomy))
+    diff = Ingestion(db, workers=2, chunk_size=5).run(taxonomy, incremental=True)
+    assert not changed(diff)
+    assert db.chunks == []
+
+
+def test_incremental_population_without_changes_touches_nothing(tmp_path, taxonomy, monkeypatch):
+    bootstraps = []
+    monkeypatch.setattr(ingestion.Schema, "bootstrap", lambda schema: bootstraps.append(schema))
+    monkeypatch.setattr(ingestion.Schema, "await_online", lambda schema: None)
+    monkeypatch.setattr(ingestion, "generation", Generation(str(tmp_path / "generation")))
+    db = GraphDatabase(graph(taxonomy))
+    path = write(tmp_path, taxonomy)
+    assert not changed(populate_database(None, db, source=path, incremental=True))
+    assert bootstraps == [] and db.chunks == db.queries == []
+    assert ingestion.generation.current() == 0
+    populate_database(None, db, source=path)
+    assert len(bootstraps) == 1 and db.chunks
+    assert db.queries == [CriteriaRepository.delete_unhashed_query]
+    assert ingestion.generation.current() == 1
@@ -0,0 +1,32 @@
+import json
+from dao.fingerprint import criteria_hash
+from service.integration import Integration
+
+
+def match(activity: str, criteria: list) -> dict:
+    return {"activity": activity, "objective": "mitigation", "activity_contribution_type": "enabling",
+            "contribution_description": "d", "dnsh": [{"objective": "water", "criteria": criteria}],
+            "substantial_contribution_criteria": ["sc"]}
+
+
+def test_summary_holds_the_match_s_own_criteria_by_hash():
+    summary = Integration.match_summary(match("A", ["one"]))
+    assert json.loads(summary["dnsh_summary"]) == [{"objective": "water", "criteria_hashes": [criteria_hash("one")]}]
+    assert summary["sc_criteria_hashes"] == [criteria_hash("sc")]
+    # the text itself is only stored on the Criteria nodes
+    assert "one" not in summary["dnsh_summary"]
+
+
+def test_matches_of_one_objective_keep_separate_summaries():
+    # the graph only keeps the union of DNSH criteria per objective
+    rows = Integration.relationship_rows({"activities": [], "matches": [match("A", ["one"]), match("B", ["two"])]})
+    summaries = {row["activity_name"]: json.loads(row["dnsh_summary"])[0]["criteria_hashes"]
+                 for row in rows["contribution_matches"]}
+    assert summaries == {"A": [criteria_hash("one")], "B": [criteria_hash("two")]}
+    assert sorted(row["criteria_hash"] for row in rows["dnsh_criteria"]) == \
+        sorted([criteria_hash("one"), criteria_hash("two")])
+
+
+def test_unlinked_match_has_no_summary():
+    unlinked = {**match("A", []), "activity_contribution_type": None, "contribution_description": None}
+    assert [kind for kind, _ in Integration.match_rows(unlinked)] == ["dnsh_objectives", "criteria", "sc_criteria"]
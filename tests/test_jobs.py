@@ -0,0 +1,64 @@
+import threading
+import time
+import pytest
+from service.jobs import JobAlreadyRunning, JobManager
+
+
+def wait(manager: JobManager, job_id: str) -> dict:
+    deadline = time.time() + 5
+    while manager.status(job_id)["state"] in ("running", "cancelling") and time.time() < deadline:
+        time.sleep(0.01)
+    return manager.status(job_id)
+
+
+def until_cancelled(job):
+    while True:
+        job.check()
+        time.sleep(0.01)
+
+
+def test_one_job_at_a_time(tmp_path):
+    manager, release = JobManager(str(tmp_path)), threading.Event()
+    job = manager.start(lambda job: release.wait())
+    with pytest.raises(JobAlreadyRunning) as error:
+        JobManager(str(tmp_path)).start(lambda job: None)
+    assert error.value.job_id == job.id
+    release.set()
+    assert wait(manager, job.id)["state"] == "finished"
+    manager.start(lambda job: None)
+
+
+def test_progress_is_reported(tmp_path):
+    manager, release = JobManager(str(tmp_path)), threading.Event()
+
+    def populate(job):
+        job.stage("nodes")
+        job.total("activities", 10)
+        job.advance("activities", 4)
+        release.wait()
+    job = manager.start(populate)
+    while manager.status(job.id)["phase"] != "nodes" or not manager.status(job.id)["rowsWritten"]:
+        time.sleep(0.01)
+    status = manager.status(job.id)
+    assert (status["rowsWritten"], status["rowsTotal"]) == ({"activities": 4}, {"activities": 10})
+    release.set()
+    status = wait(manager, job.id)
+    assert status["eta"] is None and status["finishedAt"]
+
+
+def test_failure_is_recorded(tmp_path):
+    manager = JobManager(str(tmp_path))
+
+    def fail(job):
+        raise RuntimeError("no database")
+    status = wait(manager, manager.start(fail).id)
+    assert (status["state"], status["error"]) == ("failed", "no database")
+
+
+def test_another_worker_reports_and_cancels(tmp_path):
+    manager, other = JobManager(str(tmp_path)), JobManager(str(tmp_path))
+    job = manager.start(until_cancelled)
+    assert other.status(job.id)["state"] == "running"
+    assert other.cancel(job.id)["state"] == "cancelling"
+    assert wait(other, job.id)["state"] == "cancelled"
+    assert other.status("unknown") is None
@@ -0,0 +1,43 @@
+import pytest
+from benchmark import load
+from benchmark.load import Response, Sample, parse_mix, percentile, report, succeeded
+
+
+def test_percentile_is_the_nearest_rank():
+    latencies = [float(value) for value in range(1, 101)]
+    assert percentile(latencies, 0.5) == 50
+    assert percentile(latencies, 0.99) == 99
+    assert percentile([7.0], 0.95) == 7
+
+
+def test_report_per_operation():
+    samples = [Sample("getActivity", 0.01, True, False), Sample("getActivity", 0.03, False, False),
+               Sample("listActivities", 0.02, True, True)]
+    results = report(samples, 2.0)
+    assert results["total"]["requests"] == 3 and results["total"]["throughput"] == 1.5
+    activity = results["operations"]["getActivity"]
+    assert (activity["errors"], activity["error_rate"]) == (1, 0.5)
+    assert activity["p50_ms"] == pytest.approx(10) and activity["max_ms"] == pytest.approx(30)
+    assert results["operations"]["listActivities"]["cache_hits"] == 1
+
+
+def test_failed_payloads_are_errors():
+    assert succeeded(Response(200, {"data": {"getActivity": {"success": True}}}, None))
+    assert not succeeded(Response(200, {"data": {"getActivity": {"success": False}}}, None))
+    assert not succeeded(Response(200, {"errors": [{"message": "boom"}]}, None))
+    assert not succeeded(Response(400, None, None))
+
+
+def test_mix():
+    assert parse_mix(None) == load.DEFAULT_MIX
+    assert parse_mix("getActivity=2, listActivities") == {"getActivity": 2.0, "listActivities": 1.0}
+    with pytest.raises(SystemExit):
+        parse_mix("dropEverything=1")
+
+
+def test_in_process_run(tmp_path):
+    results = load.main(["--in-process", "0.05", "--duration", "0.3", "--warmup", "0", "--concurrency", "2",
+                         "--mix", "getActivity,listActivities", "--json", str(tmp_path / "load.json")])
+    assert results["total"]["requests"] > 0
+    assert results["total"]["errors"] == 0
+    assert set(results["operations"]) == {"getActivity", "listActivities"}
@@ -0,0 +1,101 @@
+import asyncio
+from resolver.loaders import AsyncLoader, Loader, nace_code
+
+
+class Batch:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, keys: list) -> dict:
+        self.calls.append(keys)
+        return {key: key.upper() for key in keys if key != "missing"}
+
+
+def test_primed_keys_are_fetched_with_the_first_load():
+    batch = Batch()
+    loader = Loader(batch)
+    loader.prime(["a", "b", None])
+    assert loader.load("c") == "C"
+    assert loader.load_many(["a", "b", "missing"]) == ["A", "B", None]
+    assert batch.calls == [["a", "b", "c"], ["missing"]]
+    assert loader.load("missing") is None
+    assert len(batch.calls) == 2
+
+
+def test_sibling_loads_share_one_batch():
+    batch = Batch()
+
+    async def batched(keys: list) -> dict:
+        return batch(keys)
+
+    async def main():
+        loader = AsyncLoader(batched)
+        values = await asyncio.gather(loader.load("a"), loader.load("b"), loader.load("a"))
+        again = await loader.load_many(["b", "c"])
+        return values, again
+    assert asyncio.run(main()) == (["A", "B", "A"], ["B", "C"])
+    assert batch.calls == [["a", "b"], ["c"]]
+
+
+def test_batch_failure_fails_every_waiting_load():
+    async def failing(keys: list) -> dict:
+        raise RuntimeError("down")
+
+    async def main():
+        loader = AsyncLoader(failing)
+        return await asyncio.gather(loader.load("a"), loader.load("b"), return_exceptions=True)
+    assert [str(error) for error in asyncio.run(main())] == ["down", "down"]
+
+
+def test_nace_code():
+    assert nace_code({"nace_codes": ["C1", "C2"]}) == {"id": "C1,C2", "nace": "C1, C2"}
+    assert nace_code({"nace_codes": None}) is None
+
+
+class Database:
+    # answers the queries of the requests below
+    def __init__(self):
+        self.queries = []
+
+    def execute_read(self, query, params, *args):
+        self.queries.append(query.__name__)
+        if query.__name__ == "_get_all_query":
+            return [{"id": id, "name": f"A{id}"} for id in range(20)]
+        if query.__name__ == "get_by_activity_names_query":
+            return [{"activity_name": name, "id": 1, "name": "Sector " + name} for name in params]
+        if query.__name__ == "_main_objectives_all_by_id_query":
+            # DNSH and criteria by hash, as summarized() leaves them
+            return [{"activity": {"name": f"A{id}"}, "objective": {"key": "water"},
+                     "dnsh": [{"objective": "mitigation", "criteria_hashes": [f"d{id}"]}],
+                     "substantial_contribution_criteria_hashes": [f"s{id}"]} for id in range(3)]
+        if query.__name__ == "get_by_hashes_query":
+            return [{"hash": hash, "description": "text " + hash} for hash in params]
+        return [{"name": name, "nace_codes": ["C1"]} for name in params]
+
+
+def post(monkeypatch, database, query: str):
+    import app
+    monkeypatch.setattr(app, "db", database)
+    monkeypatch.setattr(app.read_model, "_snapshot", None)
+    monkeypatch.setattr(app.read_model, "enabled", False)
+    monkeypatch.setattr(app.response_cache, "enabled", False)
+    return app.app.test_client().post("/graphql", json={"query": query})
+
+
+def test_nested_fields_are_fetched_once_per_list(monkeypatch):
+    database = Database()
+    response = post(monkeypatch, database, "{ listActivities { activities { name sector { name } nace { nace } } } }")
+    activities = response.get_json()["data"]["listActivities"]["activities"]
+    assert len(activities) == 20
+    assert activities[0] == {"name": "A0", "sector": {"name": "Sector A0"}, "nace": {"nace": "C1"}}
+    assert sorted(database.queries) == ["_get_all_query", "_nace_codes_by_names_query",
+                                        "get_by_activity_names_query"]
+
+
+def test_criteria_text_is_fetched_once_per_page(monkeypatch):
+    database = Database()
+    response = post(monkeypatch, database, "{ getActivityAllMainObjectives { activityMainObjectives { "
+                                           "substantialContributionCriteria dnsh { criteria } } } }")
+    rows = response.get_json()["data"]["getActivityAllMainObjectives"]["activityMainObjectives"]
+    assert rows[2] == {"substantialContributionCriteria": ["text s2"], "dnsh": [{"criteria": ["text d2"]}]}
+    assert database.queries == ["_main_objectives_all_by_id_query", "get_by_hashes_query"]
@@ -0,0 +1,35 @@
+import json
+import os
+from graphql import parse
+from service.metrics import Registry, db_hits, operation_label
+
+
+def test_render_adds_up_every_worker(tmp_path):
+    registry = Registry(str(tmp_path), interval=0)
+    registry.inc("eu_taxonamy_cypher_query_rows_total", {"query": "q"}, 3)
+    registry.observe("eu_taxonamy_cypher_query_duration_seconds", {"query": "q"}, 0.003)
+    # what another worker flushed
+    (tmp_path / "1.json").write_text(json.dumps({
+        "counters": [["eu_taxonamy_cypher_query_rows_total", {"query": "q"}, 4]], "histograms": [], "gauges": []}))
+    lines = registry.render().splitlines()
+    assert 'eu_taxonamy_cypher_query_rows_total{query="q"} 7' in lines
+    assert 'eu_taxonamy_cypher_query_duration_seconds_bucket{query="q",le="0.0025"} 0' in lines
+    assert 'eu_taxonamy_cypher_query_duration_seconds_bucket{query="q",le="0.005"} 1' in lines
+    assert 'eu_taxonamy_cypher_query_duration_seconds_count{query="q"} 1' in lines
+
+
+def test_disabled_registry_records_nothing(tmp_path):
+    registry = Registry(str(tmp_path), enabled=False)
+    registry.inc("eu_taxonamy_cypher_query_errors_total", {"query": "q"})
+    assert registry.counters == {} and os.listdir(tmp_path) == []
+
+
+def test_db_hits_sum_the_plan():
+    assert db_hits({"dbHits": 2, "children": [{"dbHits": 3, "children": [{"dbHits": 5}]}]}) == 10
+    assert db_hits(None) == 0
+
+
+def test_operation_label_uses_root_fields():
+    document = parse("query A { listActivities { totalCount } getCriteria(hashes: []) { success } }")
+    assert operation_label(document, "A") == "getCriteria+listActivities"
+    assert operation_label(document, "B") == "unknown"
@@ -0,0 +1,66 @@
+import base64
+import pytest
+from graphql import GraphQLError
+from resolver.pagination import connection, decode_cursor, encode_cursor, page_limit
+
+ROWS = [{"activity": name, "key": key} for name, key in
+        (("A", "mitigation"), ("A", "water"), ("B", "adaptation"), ("C", "pollution"))]
+
+
+def key(row: dict) -> tuple:
+    return row["activity"], row["key"]
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(("A", "water"))) == ("A", "water")
+    assert decode_cursor(encode_cursor(("Ünïcode",))) == ("Ünïcode",)
+    assert decode_cursor(None) is None
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", "e30=",
+                                    base64.urlsafe_b64encode(b"5").decode()])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(GraphQLError, match="invalid cursor"):
+        decode_cursor(cursor)
+
+
+def test_page_limit_fetches_one_extra_row():
+    assert page_limit(None) is None
+    assert page_limit(0) == 1
+    assert page_limit(3) == 4
+    with pytest.raises(GraphQLError):
+        page_limit(-1)
+
+
+def test_connection_trims_to_first():
+    counted = []
+    page = connection(ROWS[:3], 2, key, lambda: counted.append(1) or len(ROWS), "nodes")
+    assert page["nodes"] == ROWS[:2]
+    assert [edge["node"] for edge in page["edges"]] == ROWS[:2]
+    assert page["page_info"]["has_next_page"] is True
+    assert decode_cursor(page["page_info"]["end_cursor"]) == key(ROWS[1])
+    # the count only runs when total_count is resolved
+    assert counted == []
+    assert page["total_count"](None) == len(ROWS)
+    assert counted == [1]
+
+
+def test_last_page():
+    page = connection(ROWS[2:], 5, key, lambda: len(ROWS), "nodes")
+    assert page["nodes"] == ROWS[2:]
+    assert page["page_info"] == {"has_next_page": False, "end_cursor": encode_cursor(key(ROWS[-1]))}
+    empty = connection([], 5, key, lambda: 0, "nodes")
+    assert empty["page_info"] == {"has_next_page": False, "end_cursor": None}
+
+
+def test_paging_visits_every_row_once():
+    # each page starts after the end cursor of the one before
+    seen, after = [], None
+    while True:
+        start = 0 if after is None else [key(row) for row in ROWS].index(after) + 1
+        page = connection(ROWS[start:start + page_limit(3)], 3, key, lambda: len(ROWS), "nodes")
+        seen += page["nodes"]
+        if not page["page_info"]["has_next_page"]:
+            break
+        after = decode_cursor(page["page_info"]["end_cursor"])
+    assert seen == ROWS
@@ -0,0 +1,66 @@
+import json
+from graphql import build_schema, graphql_sync
+from repository.activity import activity_projection, main_objectives_return, summarized
+from resolver.projection import node_fields, selected_fields
+
+SCHEMA = build_schema("""
+type Activity { id: ID name: String description: String nace: String }
+type Edge { node: Activity }
+type Page { activities: [Activity] edges: [Edge] totalCount: Int }
+type Query { listActivities: Page }
+""")
+
+
+def selection(query: str) -> dict:
+    selected = {}
+
+    def resolve(info):
+        selected.update(selected_fields(info))
+    result = graphql_sync(SCHEMA, query, root_value={"listActivities": resolve})
+    assert not result.errors
+    return selected
+
+
+def test_selection_is_snake_case_with_fragments_merged():
+    fields = selection("fragment F on Activity { description } "
+                       "{ listActivities { totalCount __typename activities { ...F ... on Activity { id } } } }")
+    assert fields == {"total_count": {}, "activities": {"description": {}, "id": {}}}
+
+
+def test_node_fields_merge_the_list_and_edges():
+    fields = selection("{ listActivities { activities { name } edges { node { nace } } } }")
+    assert node_fields(fields, "activities") == {"name": {}, "nace": {}}
+
+
+def test_only_requested_properties_are_returned():
+    assert activity_projection("a", {"description": {}}) == "a{.name, .description}"
+    assert activity_projection("a", {"nace": {}, "id": {}}) == "a{id: id(a), .name, .nace_codes}"
+    assert "sector:" in activity_projection("a", {"sector": {"name": {}}})
+    assert activity_projection("a", None) == "a{id: id(a), .name, .description, .reference, .nace_codes}"
+
+
+def test_criteria_are_only_traversed_when_requested():
+    plain = main_objectives_return({"activity": {"name": {}}, "objective": {"key": {}}})
+    assert plain == "RETURN a{.name} as activity, o{.key} as objective"
+    dnsh = main_objectives_return({"dnsh": {"criteria": {}}})
+    assert "matches.dnsh_summary as dnsh_summary" in dnsh and "sc_criteria_hashes" not in dnsh
+    assert "DNSH_MATCHES" in dnsh and "SC_CRITERIA" not in dnsh
+
+
+
+def test_only_the_requested_summary_properties_are_returned():
+    hashes = main_objectives_return({"substantial_contribution_criteria_hashes": {}})
+    assert "matches.sc_criteria_hashes" in hashes and "dnsh_summary" not in hashes
+    assert "c.description" not in hashes
+    # the text is resolved from the hashes, or read from the graph without a summary
+    text = main_objectives_return({"substantial_contribution_criteria": {}})
+    assert "matches.sc_criteria_hashes" in text and "c.description" in text
+
+
+def test_dnsh_summary_is_unpacked():
+    summary = json.dumps([{"objective": "water", "criteria_hashes": ["h"]}])
+    [row] = summarized([{"dnsh_summary": summary, "dnsh": None}], {"dnsh": {"objective": {"key": {}}}})
+    assert row == {"dnsh": [{"objective": {"key": "water"}, "criteria_hashes": ["h"]}]}
+    [row] = summarized([{"dnsh_summary": summary, "dnsh": None}], {"dnsh": {"objective": {"name": {}}}})
+    # left for the objectives loader
+    assert row["dnsh"][0]["objective"] == "water"
@@ -0,0 +1,67 @@
+import pytest
+from graphql import GraphQLError, parse
+from service.query_cost import CostAnalysis, QueryTooComplex, page_size
+
+UNPAGED = "all: getActivityAllMainObjectives { activityMainObjectives { dnsh { criteria } } }"
+
+
+def analysis(**limits) -> CostAnalysis:
+    return CostAnalysis(field_costs={"Query.getActivityAllMainObjectives": 10,
+                                     "ActivityMainObjectives.dnsh": 2, "DNSH.criteria": 1},
+                        list_sizes={"ActivityMainObjectivesResult.activityMainObjectives": 500,
+                                    "ActivityMainObjectives.dnsh": 6},
+                        default_list_size=10, **limits)
+
+
+def test_unpaged_lists_cost_their_expected_size(schema):
+    cost = analysis().analyze(schema, parse("{ %s }" % UNPAGED))
+    # 10 for the root, 500 matches, 500 * 6 dnsh at 2 and their criteria at 1
+    assert cost.cost == 10 + 500 + 500 * 6 * 2 + 500 * 6
+    assert cost.depth == 4
+    assert cost.aliases == 1
+
+
+def test_first_sizes_the_page(schema):
+    cost = analysis().analyze(schema, parse("{ getActivityAllMainObjectives(first: 5) "
+                                            "{ activityMainObjectives { objective { key } } } }"))
+    assert cost.cost == 10 + 5 + 5
+
+
+def test_page_from_variables(schema):
+    document = parse("query Q($n: Int) { getActivityAllMainObjectives(first: $n) { activityMainObjectives { description } } }")
+    assert analysis().analyze(schema, document, {"n": 3}).cost == 10 + 3
+
+
+def test_list_argument_sizes_the_page():
+    assert page_size({"hashes": ["a", "b", "c"]}) == 3
+    assert page_size({}) is None
+
+
+def test_negative_first_is_rejected(schema):
+    # a negative page used to make the total negative, hiding unpaged siblings
+    document = parse("{ %s other: getActivityAllMainObjectives { activityMainObjectives { dnsh { criteria } } } "
+                     "x: getActivityAllMainObjectives(first: -100000) { activityMainObjectives { description } } }"
+                     % UNPAGED)
+    with pytest.raises(GraphQLError, match="first must not be negative"):
+        analysis(max_cost=20000).check(schema, document)
+
+
+def test_limits(schema):
+    with pytest.raises(QueryTooComplex, match="cost"):
+        analysis(max_cost=100).check(schema, parse("{ %s }" % UNPAGED))
+    with pytest.raises(QueryTooComplex, match="depth"):
+        analysis(max_depth=2).check(schema, parse("{ %s }" % UNPAGED))
+    with pytest.raises(QueryTooComplex, match="aliases"):
+        analysis(max_aliases=0).check(schema, parse("{ %s }" % UNPAGED))
+
+
+def test_fragments_count_every_expansion(schema):
+    document = parse("{ a: getActivity(name: \"x\") { ...F } b: getActivity(name: \"y\") { ...F } } "
+                     "fragment F on ActivityResult { activity { name } }")
+    assert analysis(max_selections=3).analyze(schema, parse("{ getActivity(name: \"x\") { activity { name } } }"))
+    with pytest.raises(QueryTooComplex, match="selects more than 3"):
+        analysis(max_selections=3).analyze(schema, document)
+
+
+def test_introspection_is_free(schema):
+    assert analysis().analyze(schema, parse("{ __schema { types { name } } }")).cost == 0
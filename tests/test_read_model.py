@@ -0,0 +1,108 @@
+from benchmark import synthetic
+from dao.fingerprint import criteria_hash
+from service import read_model
+from service.generation import Generation
+from service.integration import Integration
+from service.read_model import ReadModel, Snapshot
+
+RECORDS = {
+    "sectors": [{"id": 1, "properties": {"name": "Energy"}}],
+    "objectives": [{"id": 2, "properties": {"key": "mitigation", "name": "Mitigation"}},
+                   {"id": 3, "properties": {"key": "water", "name": "Water"}}],
+    "activities": [{"id": 5, "properties": {"name": "B"}, "sector": "Energy"},
+                   {"id": 4, "properties": {"name": "A"}, "sector": "Energy"}],
+    "matches": [{"activity": "B", "objective": "mitigation", "contribution_type": None, "description": "b"},
+                {"activity": "A", "objective": "water", "contribution_type": None, "description": "w"},
+                {"activity": "A", "objective": "mitigation", "contribution_type": "enabling", "description": "m"}],
+    "dnsh": [{"objective": "mitigation", "dnsh_objective": "water"}],
+    "dnsh_criteria": [{"objective": "water", "hash": "h1"}],
+    "sc_criteria": [{"objective": "mitigation", "hash": "h2"}],
+    "criteria": [{"hash": "h1", "description": "no harm"}, {"hash": "h2", "description": "contributes"}],
+}
+
+
+class Database:
+    def __init__(self, records: dict):
+        self.records = records
+        self.reads = 0
+
+    def execute_read(self, query, *args):
+        self.reads += 1
+        return self.records
+
+
+def test_lookups():
+    snapshot = Snapshot.build(RECORDS)
+    assert snapshot.get_activity("A")["sector"]["name"] == "Energy"
+    assert snapshot.activities_by_id["4"]["name"] == "A"
+    assert snapshot.get_criteria(["h2", "missing"]) == [{"hash": "h2", "description": "contributes"}]
+
+
+def test_main_objectives_page_by_activity_and_objective():
+    snapshot = Snapshot.build(RECORDS)
+    assert [row["contribution_description"] for row in snapshot.get_main_objectives_all()] == ["m", "w", "b"]
+    assert [row["contribution_description"] for row in snapshot.get_main_objectives_all(("A", "mitigation"), 1)] \
+        == ["w"]
+    assert [activity["name"] for activity in snapshot.get_activities("A")] == ["B"]
+
+
+def test_matches_without_a_summary_use_the_objective_union():
+    [mitigation] = Snapshot.build(RECORDS).get_main_objectives_by_name("A")
+    assert mitigation["dnsh"] == [{"objective": {"id": "3", "key": "water", "name": "Water"},
+                                   "criteria": ["no harm"], "criteria_hashes": ["h1"]}]
+    assert mitigation["substantial_contribution_criteria"] == ["contributes"]
+
+
+def test_matches_with_a_summary_keep_their_own_criteria():
+    summary = Integration.match_summary({"dnsh": [{"objective": "water", "criteria": []}],
+                                         "substantial_contribution_criteria": ["own"]})
+    records = {**RECORDS, "matches": [{**RECORDS["matches"][2], **summary}],
+               "criteria": RECORDS["criteria"] + [{"hash": criteria_hash("own"), "description": "own"}]}
+    [mitigation] = Snapshot.build(records).get_main_objectives_by_name("A")
+    assert mitigation["dnsh"] == [{"objective": {"id": "3", "key": "water", "name": "Water"},
+                                   "criteria": [], "criteria_hashes": []}]
+    # the summary holds hashes, the text comes from the snapshot's criteria
+    assert mitigation["substantial_contribution_criteria"] == ["own"]
+    assert mitigation["substantial_contribution_criteria_hashes"] == [criteria_hash("own")]
+
+
+def test_synthetic_taxonomy_builds():
+    snapshot = Snapshot.build(synthetic.snapshot_records(synthetic.taxonomy(0.1)))
+    assert len(snapshot.main_objectives) == len(set(snapshot.main_objective_keys))
+    assert list(snapshot.main_objective_keys) == sorted(snapshot.main_objective_keys)
+    assert None not in snapshot.main_objectives[0]["substantial_contribution_criteria"]
+
+
+def test_first_request_is_served_from_neo4j():
+    db = Database(RECORDS)
+    model = ReadModel(enabled=True, ttl=60)
+    assert model.snapshot is None
+    model.load(db)
+    assert model.snapshot.get_activity("A")
+    assert db.reads == 1
+
+
+def test_stale_snapshot_is_served_while_it_reloads():
+    db = Database(RECORDS)
+    model = ReadModel(enabled=True, ttl=-1)
+    stale = model.load(db)
+    assert model.snapshot is stale
+    # the reload holds the lock until the new snapshot is swapped in
+    with model._reloading:
+        assert model._snapshot is not stale
+    assert db.reads == 2
+
+
+def test_population_elsewhere_reloads_the_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(read_model, "generation", Generation(str(tmp_path / "generation")))
+    db = Database(RECORDS)
+    model = ReadModel(enabled=True, ttl=60)
+    loaded = model.load(db)
+    assert model.snapshot is loaded
+    # another worker's population bumps the shared generation
+    Generation(str(tmp_path / "generation")).bump()
+    assert model.snapshot is None
+    with model._reloading:
+        assert model._snapshot.generation == 1
+    assert model.snapshot is model._snapshot
+    assert db.reads == 2
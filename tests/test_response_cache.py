@@ -0,0 +1,81 @@
+from service.documents import persisted_queries, query_hash
+from service.generation import Generation
+from service.response_cache import ResponseCache
+
+QUERY = "{ listActivities { activities { name } } }"
+
+
+def test_formatting_does_not_split_the_key():
+    key = ResponseCache.key({"query": QUERY}, "1")
+    assert key == ResponseCache.key({"query": "# all\n{\n  listActivities {\n activities { name } } }"}, "1")
+    assert key != ResponseCache.key({"query": QUERY, "variables": {"first": 1}}, "1")
+    assert key != ResponseCache.key({"query": QUERY, "operationName": "Q"}, "1")
+
+
+def test_generation_is_part_of_the_key():
+    assert ResponseCache.key({"query": QUERY}, "1") != ResponseCache.key({"query": QUERY}, "2")
+
+
+def test_only_queries_are_cacheable():
+    assert ResponseCache.key({"query": "mutation { populateDatabase { success } }"}, "1") is None
+    assert ResponseCache.key({"query": "{ broken"}, "1") is None
+    assert ResponseCache.key({}, "1") is None
+    assert ResponseCache.key([{"query": QUERY}], "1") is None
+
+
+def test_persisted_query_hash_shares_the_key_of_its_text():
+    hash = query_hash(QUERY)
+    persisted_queries.register(hash, QUERY)
+    data = {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": hash}}}
+    assert ResponseCache.key(data, "1") == ResponseCache.key({"query": QUERY}, "1")
+    unknown = {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": "0" * 64}}}
+    assert ResponseCache.key(unknown, "1") is None
+
+
+def test_hits_and_etag():
+    cache = ResponseCache()
+    assert cache.get("a") is None
+    stored = cache.put("a", b"{}", 200)
+    assert cache.get("a") == stored
+    assert stored.etag == cache.put("b", b"{}", 200).etag
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_entries_expire():
+    cache = ResponseCache(ttl=-1)
+    cache.put("a", b"{}", 200)
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_go_first():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", b"1", 200)
+    cache.put("b", b"2", 200)
+    cache.get("a")
+    cache.put("c", b"3", 200)
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_bounded_by_bytes():
+    cache = ResponseCache(max_bytes=10, max_entry_bytes=8)
+    cache.put("a", b"x" * 6, 200)
+    cache.put("b", b"x" * 6, 200)
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 6
+    # served but not kept
+    assert cache.put("c", b"x" * 9, 200).body == b"x" * 9
+    assert cache.get("c") is None
+
+
+def test_bump_is_seen_by_other_workers(tmp_path):
+    path = str(tmp_path / "generation")
+    worker, other = Generation(path), Generation(path)
+    assert other.current() == 0
+    assert worker.bump() == 1
+    assert other.current() == 1
+    assert other.bump() == 2
+    assert worker.current() == 2
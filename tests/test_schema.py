@@ -0,0 +1,50 @@
+from dao.schema import CONSTRAINTS, INDEXES, Schema
+
+
+class Transaction:
+    def __init__(self, database):
+        self.database = database
+
+    def run(self, statement, params=None, **kwargs):
+        self.database.statements.append(statement)
+        if statement.startswith("CREATE CONSTRAINT activity_name") and self.database.duplicates:
+            raise RuntimeError("duplicate activity names")
+        if statement.startswith("CREATE"):
+            name = statement.split(" IF NOT EXISTS")[0].split()[-1]
+            self.database.indexes.setdefault(name, {"name": name, "type": "RANGE", "state": "POPULATING",
+                                                    "populationPercent": 50.0, "owningConstraint": name})
+        return self
+
+    def consume(self):
+        pass
+
+    def data(self):
+        return list(self.database.indexes.values())
+
+
+class Database:
+    def __init__(self, duplicates: bool = False):
+        self.duplicates = duplicates
+        self.statements = []
+        self.indexes = {}
+
+    def execute_write(self, query, *args):
+        return query(Transaction(self), *args)
+
+    execute_read = execute_write
+
+
+def test_bootstrap_is_idempotent():
+    database = Database()
+    status = Schema(database).bootstrap()
+    assert status["missing"] == [] and status["failed"] == {}
+    assert sorted(status["populating"]) == sorted({**CONSTRAINTS, **INDEXES})
+    assert database.statements[0] == "DROP INDEX criteria_description IF EXISTS"
+    assert all("IF NOT EXISTS" in statement for statement in database.statements[1:-1])
+    assert Schema(database).bootstrap() == status
+
+
+def test_violated_constraint_is_reported():
+    status = Schema(Database(duplicates=True)).bootstrap()
+    assert status["failed"] == {"activity_name": "duplicate activity names"}
+    assert status["missing"] == ["activity_name"]
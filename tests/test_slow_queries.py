@@ -0,0 +1,66 @@
+from neo4j import SummaryCounters
+from dao.instrumentation import Observation
+from service.slow_queries import RingLog, SlowQueryLog, plan_tree, redacted
+
+
+class Summary:
+    counters = SummaryCounters({})
+    profile = None
+
+    def __init__(self, query_type: str):
+        self.query_type = query_type
+
+
+def observation(query: str, query_type: str = "r", seconds: float = 2.0, name: str = "read") -> Observation:
+    return Observation(name, query, {"rows": list(range(10)), "text": "x" * 500}, seconds, 1,
+                       Summary(query_type), None)
+
+
+class Capture(SlowQueryLog):
+    # records what would be profiled instead of running it
+    def __init__(self, path, **options):
+        super().__init__(None, RingLog(str(path)), **options)
+        self.queued = []
+
+    def start(self):
+        while not self.pending.empty():
+            self.queued.append(self.pending.get())
+
+
+def test_only_slow_reads_are_profiled(tmp_path):
+    log = Capture(tmp_path / "slow.jsonl", threshold_ms=1000, profile_rate=1, profile_interval=60)
+    log(observation("MATCH (n) RETURN n", seconds=0.5))
+    log(observation("UNWIND $rows AS row MERGE (n {key: row})", "w", name="write"))
+    log(observation("MATCH (n) RETURN n"))
+    assert [mode for _, mode, _ in log.queued] == ["PROFILE"]
+    # the write went to the log right away, without a plan
+    [entry] = log.log.entries()
+    assert entry["name"] == "write" and entry["profile"] is None
+    assert entry["parameters"] == {"rows": [0, 1, 2, "<10 items>"], "text": "x" * 50 + "... <500 chars>"}
+
+
+def test_a_statement_is_profiled_once_per_interval(tmp_path):
+    log = Capture(tmp_path / "slow.jsonl", threshold_ms=0, profile_rate=1, profile_interval=60)
+    log(observation("MATCH (n) RETURN n"))
+    log(observation("MATCH (n) RETURN n"))
+    assert len(log.queued) == 1 and len(log.log.entries()) == 1
+
+
+def test_ring_log_keeps_two_segments(tmp_path):
+    ring = RingLog(str(tmp_path / "slow.jsonl"), max_bytes=200)
+    for number in range(20):
+        ring.append({"number": number, "padding": "x" * 40})
+    numbers = [entry["number"] for entry in ring.entries()]
+    assert numbers == sorted(numbers) and numbers[-1] == 19 and len(numbers) < 20
+    ring.clear()
+    assert ring.entries() == []
+
+
+def test_redacted_and_plan_tree():
+    assert redacted({"a": ("b", None, 1.5)}) == {"a": ["b", None, 1.5]}
+    plan = {"operatorType": "Filter", "args": {"Details": "n.name = $name", "EstimatedRows": 3.0},
+            "rows": 1, "dbHits": 4, "children": [{"operatorType": "NodeIndexSeek", "args": {}}]}
+    assert plan_tree(plan) == {"operator": "Filter", "details": "n.name = $name", "estimatedRows": 3.0,
+                               "rows": 1, "dbHits": 4,
+                               "children": [{"operator": "NodeIndexSeek", "details": None,
+                                             "estimatedRows": None, "children": []}]}
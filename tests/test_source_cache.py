@@ -0,0 +1,99 @@
+import json
+import os
+import pytest
+from requests import ConnectionError
+from benchmark import synthetic
+from service.integration import Integration
+from service.source_cache import SourceCache, SourceUnavailable
+
+BODY = json.dumps(synthetic.taxonomy(0.1)).encode()
+
+
+class Response:
+    def __init__(self, status_code: int, body: bytes = b"", headers: dict = None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise ConnectionError(self.status_code)
+
+    def iter_content(self, chunk_size: int):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+
+class Server:
+    # a taxonomy endpoint that honours If-None-Match
+    def __init__(self):
+        self.requests = []
+        self.down = False
+        self.etag = '"v1"'
+        self.body = BODY
+
+    def get(self, url, stream=False, headers=None, timeout=None):
+        self.requests.append(headers)
+        if self.down:
+            raise ConnectionError("offline")
+        if self.etag and headers.get("If-None-Match") == self.etag:
+            return Response(304)
+        return Response(200, self.body, {"ETag": self.etag} if self.etag else {})
+
+
+@pytest.fixture
+def server():
+    return Server()
+
+
+def test_second_fetch_revalidates(tmp_path, server):
+    cache = SourceCache(str(tmp_path))
+    source = cache.fetch(Integration(server))
+    assert (source.origin, source.changed, source.metadata["bytes"]) == ("downloaded", True, len(BODY))
+    source = cache.fetch(Integration(server))
+    assert (source.origin, source.changed) == ("not modified", False)
+    assert server.requests[-1] == {"If-None-Match": '"v1"'}
+
+
+def test_download_failure_falls_back_to_the_cached_copy(tmp_path, server):
+    cache = SourceCache(str(tmp_path))
+    with pytest.raises(SourceUnavailable):
+        cache.fetch(Integration(server), offline=True)
+    server.down = True
+    with pytest.raises(SourceUnavailable):
+        cache.fetch(Integration(server))
+    server.down = False
+    cache.fetch(Integration(server))
+    server.down = True
+    assert cache.fetch(Integration(server)).origin == "stale"
+    assert cache.fetch(Integration(server), offline=True).origin == "offline"
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".part")] == []
+
+
+def test_unchanged_body_without_validators_is_not_a_change(tmp_path, server):
+    server.etag = None
+    cache = SourceCache(str(tmp_path))
+    assert cache.fetch(Integration(server)).changed
+    source = cache.fetch(Integration(server))
+    assert (source.origin, source.changed) == ("downloaded", False)
+
+
+def test_fresh_copy_is_not_revalidated(tmp_path, server):
+    SourceCache(str(tmp_path)).fetch(Integration(server))
+    source = SourceCache(str(tmp_path), max_age=60).fetch(Integration(server))
+    assert source.origin == "fresh"
+    assert len(server.requests) == 1
+
+
+def test_previous_copy_is_kept(tmp_path, server):
+    cache = SourceCache(str(tmp_path))
+    for etag, body in (('"v1"', BODY), ('"v2"', BODY + b" "), ('"v3"', BODY + b"  ")):
+        server.etag, server.body = etag, body
+        cache.fetch(Integration(server))
+    assert len([name for name in os.listdir(tmp_path) if name.startswith("taxonomy-")]) == 2
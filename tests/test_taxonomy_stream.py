@@ -0,0 +1,45 @@
+import gzip
+import json
+import pytest
+from service.taxonomy_stream import iter_taxonomy, iter_taxonomy_file
+
+DOCUMENT = {"objectives": [{"key": "water", "name": "Water"}], "empty": [], "version": "1.0",
+            "matches": [{"activity": "A", "n": 1.25, "dnsh": [{"objective": "water", "criteria": ["c"]}]},
+                        {"activity": "B \u00e9", "n": -3e2, "dnsh": []}], "n": 2}
+
+
+def chunked(text: str, size: int):
+    return [text[index:index + size] for index in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1 << 16])
+def test_items_whatever_the_chunk_boundaries(size):
+    text = json.dumps(DOCUMENT, indent=1)
+    items = list(iter_taxonomy(chunked(text, size)))
+    assert items == [("objectives", DOCUMENT["objectives"][0]),
+                     ("matches", DOCUMENT["matches"][0]), ("matches", DOCUMENT["matches"][1])]
+
+
+def test_empty_document():
+    assert list(iter_taxonomy(["{ }"])) == []
+
+
+def test_truncated_document():
+    with pytest.raises(ValueError):
+        list(iter_taxonomy(chunked(json.dumps(DOCUMENT)[:-20], 5)))
+
+
+def test_file_reads(tmp_path):
+    path = tmp_path / "taxonomy.json"
+    path.write_text(json.dumps(DOCUMENT, ensure_ascii=False), encoding="utf-8")
+    # a multibyte character split across reads still decodes
+    assert list(iter_taxonomy_file(str(path), 3)) == list(iter_taxonomy_file(str(path)))
+    assert len(list(iter_taxonomy_file(str(path)))) == 3
+
+
+def test_gzip_file_reads_like_the_plain_one(tmp_path):
+    plain, compressed = tmp_path / "taxonomy.json", tmp_path / "taxonomy.json.gz"
+    plain.write_text(json.dumps(DOCUMENT, ensure_ascii=False), encoding="utf-8")
+    with gzip.open(compressed, "wt", encoding="utf-8") as file:
+        json.dump(DOCUMENT, file, ensure_ascii=False)
+    assert list(iter_taxonomy_file(str(compressed), 3)) == list(iter_taxonomy_file(str(plain)))